@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from app.core.auth import require_admin
+from app.core.log_sampling import sampling_policy
+from app.core.logging import get_log_level, get_logger, get_logging_stats, set_log_level
+from app.core.profiling import profile_store
+from app.schemas.admin import LoggingPolicyUpdate
+
+logger = get_logger("api.admin")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+def _logging_state() -> dict:
+    return {
+        "level": get_log_level(),
+        "sampling": sampling_policy.snapshot(),
+        "queue": get_logging_stats(),
+    }
+
+
+@router.get("/logging")
+async def get_logging_policy():
+    """查看目前的日誌等級、抽樣策略與佇列統計"""
+    return _logging_state()
+
+
+@router.put("/logging")
+async def update_logging_policy(update: LoggingPolicyUpdate):
+    """執行期間調整日誌等級與抽樣策略"""
+    if update.sample_rates and any(not 0.0 <= rate <= 1.0 for rate in update.sample_rates.values()):
+        raise HTTPException(status_code=400, detail="Sample rates must be between 0 and 1")
+
+    if update.level is not None:
+        set_log_level(update.level)
+
+    sampling_policy.update(
+        sample_rates=update.sample_rates,
+        adaptive_events=update.adaptive_events,
+        adaptive_target_per_second=update.adaptive_target_per_second,
+        slow_request_seconds=update.slow_request_seconds,
+        enabled=update.sampling_enabled,
+    )
+    logger.warning("Logging policy updated", **update.model_dump(exclude_unset=True))
+    return _logging_state()
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """列出慢請求的 profiler 擷取結果（新的在前）"""
+    return {"captures": profile_store.list()}
+
+
+@router.get("/profiles/{request_id}")
+async def download_profile(request_id: str):
+    """下載 collapsed stack 格式的擷取結果（可直接餵給 flamegraph.pl / speedscope）"""
+    path = profile_store.path_for(request_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{request_id}.collapsed")
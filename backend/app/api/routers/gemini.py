@@ -1,24 +1,38 @@
-from typing import Optional
-import os, requests, io
+import asyncio
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+import os, io
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile, Depends, Request
 from fastapi.responses import StreamingResponse
-from google import genai
-from google.genai import types
+from starlette.concurrency import run_in_threadpool
 from app.schemas.intents import SpeechResponse
+from app.core.config import settings
 from app.core.logging import get_logger
-from app.core.auth import get_current_user_optional
+from app.core.metrics import observe_stage, speculation_total, upload_bytes_total
+from app.core.scheduler import DeadlineExceeded, gemini_scheduler
+from app.core.speculation import Speculation, image_digest, speculation_store
+from app.core.auth import decode_access_token, get_current_user_optional, get_user_profile
 from app.models.user import User
 from app.core.database import get_db
-from app.services.user_service import UserService
+from app.core.cache import UserProfile
+from app.services.intent_service import guess_intent
 from .system_prompt import SYSTEM_PROMPT, get_system_prompt_with_user
-from .tts import synthesize_speech
+from .tts import audio_url, store_audio, synthesize_speech
+
+if TYPE_CHECKING:
+    from google import genai
 
 logger = get_logger("api.gemini")
 
 router = APIRouter(prefix="/gemini", tags=["gemini"])
 
+# 只有語音、沒有文字時，告訴模型問題在音訊中
+AUDIO_QUESTION_HINT = "使用者的問題在上面的語音中，請依語音內容回答。"
+# 預先分析時推測的問題
+DESCRIBE_PROMPT = "請描述眼前的畫面。"
+
 
-def get_current_user_from_request(request: Request, db) -> Optional[User]:
+async def get_current_user_from_request(request: Request, db) -> Optional[UserProfile]:
     """
     從請求中獲取當前使用者，如果沒有認證則返回 None
     """
@@ -28,22 +42,15 @@ def get_current_user_from_request(request: Request, db) -> Optional[User]:
             return None
         
         token = auth_header.split(" ")[1]
-        from jose import JWTError, jwt
-        from app.core.config import settings
         
-        # 解碼 JWT token
-        payload = jwt.decode(
-            token, 
-            settings.secret_key, 
-            algorithms=[settings.algorithm]
-        )
+        # 解碼 JWT token（已驗證的 token 會被快取）
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             return None
         
-        # 從資料庫獲取用戶信息
-        user_service = UserService(db)
-        user = user_service.get_user_by_username(username)
+        # 從快取或資料庫獲取用戶信息
+        user = await get_user_profile(db, username)
         if user is None:
             logger.warning("User not found in database", username=username)
             return None
@@ -55,11 +62,20 @@ def get_current_user_from_request(request: Request, db) -> Optional[User]:
         return None
 
 
-def _client() -> genai.Client:
+@lru_cache(maxsize=1)
+def _build_client(api_key: str, base_url: str = "") -> "genai.Client":
+    # google.genai 匯入需要約半秒，延遲到第一次呼叫時才載入
+    from google import genai
+    if base_url:
+        return genai.Client(api_key=api_key, http_options={"base_url": base_url})
+    return genai.Client(api_key=api_key)
+
+
+def _client() -> "genai.Client":
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise HTTPException(status_code=500, detail="GOOGLE_API_KEY is not set")
-    return genai.Client(api_key=api_key)
+    return _build_client(api_key, settings.gemini_base_url)
 
 
 def _read_upload_bytes(upload: UploadFile) -> tuple[bytes, str]:
@@ -74,6 +90,151 @@ def _read_upload_bytes(upload: UploadFile) -> tuple[bytes, str]:
     return data, mime
 
 
+async def _read_audio_upload(upload: UploadFile) -> tuple[bytes, str]:
+    """讀取語音提問：限制大小，WAV 依設定降頻（在執行緒池中進行，不阻塞 event loop）"""
+    # 瀏覽器的 MediaRecorder 會帶參數，例如 audio/webm;codecs=opus
+    mime = (upload.content_type or "").split(";", 1)[0].strip().lower()
+    if not mime.startswith("audio/"):
+        raise HTTPException(status_code=400, detail="audio must be an audio/* upload")
+
+    max_bytes = settings.gemini_audio_max_bytes
+    try:
+        data = upload.file.read(max_bytes + 1)
+    finally:
+        try:
+            upload.file.close()
+        except Exception:
+            pass
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"audio exceeds {max_bytes} bytes")
+    upload_bytes_total.inc("audio", amount=len(data))
+
+    if settings.gemini_audio_max_sample_rate and mime in ("audio/wav", "audio/x-wav", "audio/wave"):
+        from app.services.audio_service import downsample_wav
+        with observe_stage("audio_downsample"):
+            data = await run_in_threadpool(downsample_wav, data, settings.gemini_audio_max_sample_rate)
+        mime = "audio/wav"
+    return data, mime
+
+
+async def _generate_speech(
+    model: str,
+    contents: list,
+    system_instruction: str,
+    priority: int,
+    deadline: float,
+) -> str:
+    """
+    呼叫 Gemini 並取出結構化輸出中的 speech
+
+    使用 SDK 的 async client，等待上游時不佔用 event loop 或執行緒池，也可以被取消。
+    呼叫前先向 gemini_scheduler 取得配額（依 priority 與 deadline 排隊）
+    """
+    client = _client()
+    from google.genai import types
+
+    config_params = {
+        "system_instruction": system_instruction,
+        "response_mime_type": "application/json",
+        "response_schema": SpeechResponse,
+    }
+    
+    # 只有支援 thinking 的模型才添加 thinking_config
+    if "2.5" in model or "1.5" in model:
+        config_params["thinking_config"] = types.ThinkingConfig(thinking_budget=-1)
+    
+    config = types.GenerateContentConfig(**config_params)
+
+    async with gemini_scheduler.slot(priority, deadline):
+        logger.debug("Sending request to Gemini API", model=model)
+        with observe_stage("gemini"):
+            resp = await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config,
+            )
+
+    # Parse structured output to get speech response
+    if getattr(resp, "parsed", None) is not None:
+        try:
+            parsed = resp.parsed
+            # Get speech attribute from parsed response
+            speech = getattr(parsed, "speech", None)
+            if speech is None and isinstance(parsed, dict):
+                speech = parsed.get("speech")
+            
+            if speech:
+                logger.debug("Gemini analysis completed successfully", 
+                           speech_length=len(speech))
+                return speech
+            else:
+                logger.warning("No speech content found in parsed response")
+        except Exception as e:
+            logger.warning("Failed to parse Gemini response", error=str(e))
+            pass
+    # Fallback to raw text string
+    result = getattr(resp, "text", str(resp))
+    logger.debug("Gemini analysis completed with fallback", result_length=len(result))
+    return result
+
+
+async def _speculate(speculation: Speculation, system_instruction: str) -> str:
+    from google.genai import types
+    contents = [types.Part.from_bytes(data=speculation.image, mime_type=speculation.mime), DESCRIBE_PROMPT]
+    # 推測呼叫使用最低的等級，不與真正的問題搶配額
+    deadline = asyncio.get_running_loop().time() + settings.speculation_ttl_seconds
+    speech = await _generate_speech(
+        speculation.model, contents, system_instruction, gemini_scheduler.priority_of("speculative"), deadline
+    )
+    # handle 可能落在其他 worker，答案也寫入共用快取
+    speculation_store.publish_answer(speculation, speech)
+    return speech
+
+
+def _log_speculation_result(task: "asyncio.Task[str]") -> None:
+    # 取出例外，避免 "Task exception was never retrieved"
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Speculative analysis failed", error=str(task.exception()))
+
+
+@router.post("/prefetch")
+async def prefetch(
+    request: Request,
+    image: UploadFile = File(...),
+    model: str = Form(default="gemini-2.5-flash-lite"),
+    replaces: Optional[str] = Form(default=None),
+    db = Depends(get_db),
+):
+    """
+    影像先於問題到達時呼叫：先讀取影像，並在背景推測性地請 Gemini 描述畫面
+
+    返回的 handle 之後以 prefetch_handle 傳給 analyze / analyze-and-speak；
+    replaces 為同一使用者上一個 handle，對應的推測呼叫會被取消
+    """
+    if not settings.speculation_enabled:
+        raise HTTPException(status_code=404, detail="Prefetch is disabled")
+
+    current_user = await get_current_user_from_request(request, db)
+    user_id = current_user.id if current_user else None
+    if replaces:
+        speculation_store.cancel(replaces, user_id, "replaced")
+
+    with observe_stage("image_read"):
+        data, mime = _read_upload_bytes(image)
+    upload_bytes_total.inc("image", amount=len(data))
+
+    with observe_stage("prompt_build"):
+        system_instruction = get_system_prompt_with_user(current_user)
+
+    speculation = Speculation(user_id, data, mime, model)
+    speculation.task = asyncio.get_running_loop().create_task(_speculate(speculation, system_instruction))
+    speculation.task.add_done_callback(_log_speculation_result)
+    speculation_store.add(speculation)
+
+    logger.debug("Speculative analysis started", handle=speculation.handle, data_size=len(data), model=model)
+    return {"handle": speculation.handle, "expires_in": settings.speculation_ttl_seconds}
+
+
 @router.post("/analyze")
 async def analyze(
     request: Request,
@@ -81,83 +242,147 @@ async def analyze(
     text: Optional[str] = Form(default=None),
     system_instruction: Optional[str] = Form(default=None),
     model: str = Form(default="gemini-2.5-flash-lite"),
+    audio: Optional[UploadFile] = File(default=None),
+    prefetch_handle: Optional[str] = Form(default=None),
+    intent: Optional[str] = Form(default=None),
+    priority: Optional[str] = Form(default=None),
+    deadline_ms: Optional[int] = Form(default=None, ge=1),
     db = Depends(get_db),
 ):
-    """Accepts an image or webpage URL with optional text, then calls Gemini."""
+    """
+    Accepts an image, a spoken question (audio) and/or text, then calls Gemini.
+
+    The audio goes to Gemini in the same multimodal request as the image,
+    so the browser does not need a separate speech recognition round trip.
+    With prefetch_handle the image uploaded earlier to /gemini/prefetch is reused,
+    and for describe questions so is the speculative answer. The handle works on any
+    worker; if the image is sent again and matches the prefetched frame, the
+    speculation is still used.
+
+    Gemini calls are scheduled by priority class (derived from the question text; the
+    priority / intent parameters can only lower it) and earliest deadline; requests still
+    queued at their deadline get 504.
+    A deadline from the X-Request-Deadline / X-Request-Timeout headers also applies.
+    """
+    # 期限從收到請求開始計算；標頭指定的期限（CancellationMiddleware）較早時以其為準
+    deadline = asyncio.get_running_loop().time() + (
+        deadline_ms / 1000 if deadline_ms else settings.gemini_default_deadline_seconds
+    )
+    header_deadline = getattr(request.state, "deadline", None)
+    if header_deadline is not None:
+        deadline = min(deadline, header_deadline)
+
     # 獲取當前使用者
-    current_user = get_current_user_from_request(request, db)
+    current_user = await get_current_user_from_request(request, db)
     
     logger.debug("Gemini analysis request", 
                 has_image=image is not None, 
+                has_audio=audio is not None,
                 has_text=text is not None, 
+                has_prefetch=prefetch_handle is not None,
                 model=model,
                 has_user=current_user is not None)
+
+    speculation = None
+    # 已讀取的影像 (data, mime)
+    upload = None
+    if prefetch_handle:
+        speculation = speculation_store.take(prefetch_handle, current_user.id if current_user else None)
+        if speculation is None:
+            speculation_total.inc("miss")
+            if not image:
+                # handle 已過期，或共用快取停用 / 已清空而 handle 來自其他 worker
+                raise HTTPException(status_code=410, detail="Prefetch handle expired or unknown; resend the image")
+        elif image:
+            with observe_stage("image_read"):
+                upload = _read_upload_bytes(image)
+            upload_bytes_total.inc("image", amount=len(upload[0]))
+            if image_digest(upload[0]) == speculation.digest:
+                # 重送的就是預先分析的畫面：沿用推測
+                speculation_total.inc("image_matched")
+                image, upload = None, None
+            else:
+                # 畫面已更新，新上傳的影像優先
+                speculation_store.discard(speculation, "superseded")
+                speculation = None
     
-    # Require at least one of image or text. URL is optional and additive.
-    if not image and not text:
+    # Require at least one of image, audio or text. URL is optional and additive.
+    if not image and not speculation and not audio and not text:
         logger.warning("Gemini analysis failed: no input provided")
-        raise HTTPException(status_code=400, detail="Provide at least one of image or text")
+        raise HTTPException(status_code=400, detail="Provide at least one of image, audio or text")
+
+    # 大小與型別檢查需在下方的 try 之外，才能返回 400 / 413
+    audio_part = None
+    if audio:
+        with observe_stage("audio_read"):
+            audio_part = await _read_audio_upload(audio)
+
+    # 排程等級由伺服器依問題判斷；客戶端的 priority / intent 只能降低等級，不能用來插隊
+    server_intent = guess_intent(text)
+    priority_class = server_intent or "default"
+    requested_class = priority or intent
+    if requested_class and gemini_scheduler.priority_of(requested_class) > gemini_scheduler.priority_of(priority_class):
+        priority_class = requested_class
+
+    intent = intent or server_intent
+    if speculation is not None:
+        # 沒有額外問題或問題是描述畫面時，推測答案就是答案
+        if audio_part is None and speculation.model == model and (not text or intent == "describe"):
+            with observe_stage("speculation_wait"):
+                speech = await speculation_store.answer(speculation, settings.speculation_wait_seconds)
+            if speech:
+                speculation_total.inc("answer_reused")
+                logger.debug("Speculative answer reused", handle=speculation.handle, intent=intent)
+                return {"result": speech}
+        else:
+            speculation_store.discard(speculation, "unused")
+        speculation_total.inc("image_reused")
 
     try:
-        client = _client()
+        from google.genai import types
 
         contents: list[object] = []
 
         if image:
-            data, mime = _read_upload_bytes(image)
+            if upload is None:
+                with observe_stage("image_read"):
+                    upload = _read_upload_bytes(image)
+                upload_bytes_total.inc("image", amount=len(upload[0]))
+            data, mime = upload
             contents.append(types.Part.from_bytes(data=data, mime_type=mime))
             logger.debug("Image processed for analysis", mime_type=mime, data_size=len(data))
+        elif speculation is not None:
+            contents.append(types.Part.from_bytes(data=speculation.image, mime_type=speculation.mime))
+            logger.debug("Prefetched image reused", handle=speculation.handle, data_size=len(speculation.image))
+
+        if audio_part is not None:
+            audio_data, audio_mime = audio_part
+            contents.append(types.Part.from_bytes(data=audio_data, mime_type=audio_mime))
+            logger.debug("Audio added for analysis", mime_type=audio_mime, data_size=len(audio_data))
+            if not text:
+                contents.append(AUDIO_QUESTION_HINT)
 
         if text:
             contents.append(text)
             logger.debug("Text added for analysis", text_length=len(text))
+        elif speculation is not None and audio_part is None:
+            contents.append(DESCRIBE_PROMPT)
 
         # 根據模型類型設置配置
         # 優先使用呼叫方傳入的 system_instruction，否則使用包含使用者資料的 SYSTEM_PROMPT
-        system_instruction = get_system_prompt_with_user(current_user)
+        with observe_stage("prompt_build"):
+            system_instruction = get_system_prompt_with_user(current_user)
         print(system_instruction)
-        
-        config_params = {
-            "system_instruction": system_instruction,
-            "response_mime_type": "application/json",
-            "response_schema": SpeechResponse,
-        }
-        
-        # 只有支援 thinking 的模型才添加 thinking_config
-        if "2.5" in model or "1.5" in model:
-            config_params["thinking_config"] = types.ThinkingConfig(thinking_budget=-1)
-        
-        config = types.GenerateContentConfig(**config_params)
 
-        logger.debug("Sending request to Gemini API", model=model)
-        resp = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=config,
+        speech = await _generate_speech(
+            model, contents, system_instruction, gemini_scheduler.priority_of(priority_class), deadline
         )
-
-        # Parse structured output to get speech response
-        if getattr(resp, "parsed", None) is not None:
-            try:
-                parsed = resp.parsed
-                # Get speech attribute from parsed response
-                speech = getattr(parsed, "speech", None)
-                if speech is None and isinstance(parsed, dict):
-                    speech = parsed.get("speech")
-                
-                if speech:
-                    logger.debug("Gemini analysis completed successfully", 
-                               speech_length=len(speech))
-                    return {"result": speech}
-                else:
-                    logger.warning("No speech content found in parsed response")
-            except Exception as e:
-                logger.warning("Failed to parse Gemini response", error=str(e))
-                pass
-        # Fallback to raw text string
-        result = getattr(resp, "text", str(resp))
-        logger.debug("Gemini analysis completed with fallback", result_length=len(result))
-        return {"result": result}
+        return {"result": speech}
+    except HTTPException:
+        raise
+    except DeadlineExceeded as exc:
+        logger.warning("Gemini request dropped", reason=str(exc), priority=priority_class)
+        raise HTTPException(status_code=504, detail="Deadline exceeded before the Gemini call started")
     except Exception as exc:
         logger.error("Gemini analysis failed", error=str(exc), exc_info=True)
         raise HTTPException(status_code=500, detail=f"Gemini request failed: {exc}")
@@ -170,19 +395,27 @@ async def analyze_and_speak(
     text: Optional[str] = Form(default=None),
     system_instruction: Optional[str] = Form(default=None),
     model: str = Form(default="gemini-2.5-flash-lite"),
+    audio: Optional[UploadFile] = File(default=None),
+    prefetch_handle: Optional[str] = Form(default=None),
+    intent: Optional[str] = Form(default=None),
+    priority: Optional[str] = Form(default=None),
+    deadline_ms: Optional[int] = Form(default=None, ge=1),
     language_code: str = Form(default="cmn-CN"),
     voice_name: str = Form(default="cmn-CN-Chirp3-HD-Achernar"),
+    sample_rate_hertz: Optional[int] = Form(default=None, ge=8000, le=48000),
+    return_url: bool = Form(default=False),
     db = Depends(get_db),
 ):
     """
-    Analyze image/text with Gemini and return audio response.
+    Analyze image/audio/text with Gemini and return audio response.
     Combines Gemini analysis with TTS synthesis.
     """
     # 獲取當前使用者
-    current_user = get_current_user_from_request(request, db)
+    current_user = await get_current_user_from_request(request, db)
     
     logger.debug("Gemini analyze-and-speak request", 
                 has_image=image is not None, 
+                has_audio=audio is not None,
                 has_text=text is not None, 
                 has_system_instruction=system_instruction is not None,
                 model=model,
@@ -192,7 +425,10 @@ async def analyze_and_speak(
     
     try:
         # 直接調用 analyze 函數獲取文本結果，並傳遞 system_instruction 和 current_user
-        analysis_result = await analyze(request, image, text, system_instruction, model, db)
+        analysis_result = await analyze(
+            request, image, text, system_instruction, model, audio, prefetch_handle, intent,
+            priority, deadline_ms, db,
+        )
         speech_text = analysis_result["result"]
         
         if not speech_text:
@@ -202,21 +438,30 @@ async def analyze_and_speak(
 
         # 使用 TTS 合成語音
         try:
-            audio_data = synthesize_speech(
+            audio_data = await synthesize_speech(
                 text=speech_text,
                 language_code=language_code,
-                voice_name=voice_name
+                voice_name=voice_name,
+                sample_rate_hertz=sample_rate_hertz
             )
             
             logger.debug("TTS synthesis completed successfully", audio_size=len(audio_data))
+
+            # 返回文字與可快取的音訊 URL，由客戶端以 GET 取得音訊；只有此時才寫入儲存
+            if return_url:
+                audio_hash = await store_audio(audio_data)
+                return {
+                    "success": True,
+                    "text": speech_text,
+                    "audio_url": audio_url(audio_hash),
+                    "audio_hash": audio_hash,
+                }
             
             # 返回音頻流
             return StreamingResponse(
                 io.BytesIO(audio_data),
                 media_type="audio/wav",
-                headers={
-                    "Content-Disposition": "attachment; filename=response.wav"
-                }
+                headers={"Content-Disposition": "attachment; filename=response.wav"}
             )
             
         except Exception as tts_error:
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
-from app.schemas.health import HealthResponse
+from app.schemas.health import HealthResponse, ReadinessResponse
+from app.core.load import readiness
 from app.core.logging import get_logger
+from app.core.responses import ORJSONResponse
 
 logger = get_logger("api.health")
 router = APIRouter(tags=["health"])
@@ -8,7 +10,16 @@ router = APIRouter(tags=["health"])
 
 @router.get("/health", response_model=HealthResponse)
 def health_check() -> HealthResponse:
-    logger.info("Health check requested")
+    logger.debug("Health check requested")
     return HealthResponse(status="ok")
 
 
+@router.get("/ready", response_model=ReadinessResponse, responses={503: {"model": ReadinessResponse}})
+async def readiness_check() -> ORJSONResponse:
+    """
+    負載感知的 readiness 探測：超過門檻時返回 503，讓負載平衡器繞過這個 worker
+
+    不記錄日誌、不存取資料庫
+    """
+    state = readiness()
+    return ORJSONResponse(state, status_code=200 if state["status"] == "ready" else 503)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import render_metrics
+from app.core.metrics_multiprocess import aggregate
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    """Prometheus 指標（gunicorn 多 worker 時為所有 worker 的彙總）"""
+    return PlainTextResponse(render_metrics(aggregate()), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Path, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from typing import TYPE_CHECKING, Optional, Tuple
 import io
 import base64
-import requests
 import os
+from app.core.audio_store import audio_store
+from app.core.config import settings
 from app.core.logging import get_logger
+from app.core.metrics import audio_bytes_total, observe_stage
+from app.core.shared_cache import get_shared_cache
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = get_logger("api.tts")
 
@@ -23,24 +30,70 @@ def get_access_token():
     except subprocess.CalledProcessError:
         raise Exception("Failed to get Google Cloud access token, please run 'gcloud auth login' first")
 
-def synthesize_speech(text: str, language_code: str = "cmn-CN", voice_name: str = "cmn-CN-Chirp3-HD-Achernar") -> bytes:
+_http_client: Optional["httpx.AsyncClient"] = None
+
+
+def _tts_client() -> "httpx.AsyncClient":
+    """共用的 async HTTP client（連線重用）；在第一次合成時建立"""
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient(timeout=settings.tts_timeout_seconds)
+    return _http_client
+
+
+async def close_tts_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def synthesize_speech(
+    text: str,
+    language_code: str = "cmn-CN",
+    voice_name: str = "cmn-CN-Chirp3-HD-Achernar",
+    sample_rate_hertz: Optional[int] = None,
+    postprocess: Optional[bool] = None,
+) -> bytes:
     """
     Synthesize speech using Google Cloud Text-to-Speech API
+
+    The upstream call is async, so it does not block the event loop and is
+    cancelled together with the request.
     
     Args:
         text: Text to convert to speech
         language_code: Language code (default: cmn-CN)
         voice_name: Voice name (default: cmn-CN-Chirp3-HD-Achernar)
+        sample_rate_hertz: Output sample rate requested by the client (optional)
+        postprocess: Trim silence / resample / normalise the PCM
+            (default: settings.tts_postprocess_enabled, forced on when sample_rate_hertz is set)
     
     Returns:
         Audio data (bytes)
     """
+    if postprocess is None:
+        postprocess = settings.tts_postprocess_enabled or sample_rate_hertz is not None
+
+    # 相同參數合成的語音在同一台主機的所有 worker 間共用
+    cache_key = f"tts:{language_code}:{voice_name}:{sample_rate_hertz}:{int(postprocess)}:{text}"
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        cached = shared_cache.get(cache_key)
+        if cached is not None:
+            audio_bytes_total.inc(amount=len(cached))
+            return cached
+
+    # httpx 延遲到第一次合成時載入
+    import httpx
+
     # Get gcloud project ID and access token
     project_id = os.getenv("GOOGLE_PROJECT_ID")
     access_token = os.getenv("GOOGLE_ACCESS_TOKEN")
     
     # API endpoint
-    url = "https://texttospeech.googleapis.com/v1/text:synthesize"
+    url = settings.tts_api_url
     
     # Request data
     data = {
@@ -61,16 +114,18 @@ def synthesize_speech(text: str, language_code: str = "cmn-CN", voice_name: str
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            # Request headers
+            # Request headers（未設定專案 ID 時不送該標頭）
             headers = {
                 "Content-Type": "application/json",
-                "X-Goog-User-Project": project_id,
                 "Authorization": f"Bearer {access_token}"
             }
+            if project_id:
+                headers["X-Goog-User-Project"] = project_id
             
             # Send POST request
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
+            with observe_stage("tts"):
+                response = await _tts_client().post(url, headers=headers, json=data)
+                response.raise_for_status()
             
             # Parse response
             result = response.json()
@@ -78,14 +133,22 @@ def synthesize_speech(text: str, language_code: str = "cmn-CN", voice_name: str
             # Decode base64 audio data
             audio_content = base64.b64decode(result["audioContent"])
             
+            if postprocess:
+                # numpy 只在需要後處理時載入；CPU 運算放到執行緒池
+                from app.services.audio_service import postprocess_wav
+                audio_content = await run_in_threadpool(postprocess_wav, audio_content, sample_rate_hertz)
+            
+            if shared_cache is not None:
+                shared_cache.set(cache_key, audio_content)
+            audio_bytes_total.inc(amount=len(audio_content))
             return audio_content
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPStatusError as e:
             # If 401 error and still have retry attempts, get new access_token
             if e.response.status_code == 401 and attempt < max_retries - 1:
                 print(f"API request failed (401), getting new access_token... (attempt {attempt + 1}/{max_retries})")
                 try:
-                    access_token = get_access_token()
+                    access_token = await run_in_threadpool(get_access_token)
                     os.environ["GOOGLE_ACCESS_TOKEN"] = access_token
                     print("Successfully got new access_token, retrying...")
                     continue
@@ -94,6 +157,8 @@ def synthesize_speech(text: str, language_code: str = "cmn-CN", voice_name: str
                     raise Exception(f"Failed to get new access_token: {token_error}")
             else:
                 raise Exception(f"API request failed: {e}")
+        except httpx.HTTPError as e:
+            raise Exception(f"API request failed: {e}")
         except KeyError as e:
             raise Exception(f"Response format error, missing field: {e}")
     
@@ -121,12 +186,32 @@ class TTSRequest(BaseModel):
     text: str
     language_code: Optional[str] = "cmn-CN"
     voice_name: Optional[str] = "cmn-CN-Chirp3-HD-Achernar"
+    sample_rate_hertz: Optional[int] = Field(default=None, ge=8000, le=48000)
+    postprocess: Optional[bool] = None
+    # True 時 audio_url 為可快取的 GET /tts/audio/{hash}，而非 base64 data URL；
+    # synthesize-stream 則以 Content-Location 標頭附上此位址
+    return_url: bool = False
 
 
 class TTSResponse(BaseModel):
     success: bool
     message: str
     audio_url: Optional[str] = None
+    audio_hash: Optional[str] = None
+
+
+def audio_url(audio_hash: str) -> str:
+    return f"{router.prefix}/audio/{audio_hash}"
+
+
+async def store_audio(audio_data: bytes) -> str:
+    """保存到內容定址儲存並返回雜湊（磁碟寫入在執行緒池進行）"""
+    return await run_in_threadpool(audio_store.put, audio_data)
+
+
+def audio_location_headers(audio_hash: str) -> dict:
+    """POST 回應附上音訊的 GET 位址，客戶端之後可直接使用可快取的 URL"""
+    return {"Content-Location": audio_url(audio_hash), "ETag": f'"{audio_hash}"'}
 
 
 @router.post("/synthesize", response_model=TTSResponse)
@@ -147,12 +232,24 @@ async def synthesize_text_to_speech(request: TTSRequest):
     
     try:
         # Use speech synthesis functionality
-        audio_data = synthesize_speech(
+        audio_data = await synthesize_speech(
             text=request.text,
             language_code=request.language_code,
-            voice_name=request.voice_name
+            voice_name=request.voice_name,
+            sample_rate_hertz=request.sample_rate_hertz,
+            postprocess=request.postprocess
         )
         
+        if request.return_url:
+            audio_hash = await store_audio(audio_data)
+            logger.debug("TTS synthesis completed successfully", audio_size=len(audio_data), audio_hash=audio_hash)
+            return TTSResponse(
+                success=True,
+                message="Speech synthesis successful",
+                audio_url=audio_url(audio_hash),
+                audio_hash=audio_hash,
+            )
+
         # Encode audio data as base64
         audio_base64 = base64.b64encode(audio_data).decode('utf-8')
         
@@ -190,23 +287,25 @@ async def synthesize_text_to_speech_stream(request: TTSRequest):
     
     try:
         # Use speech synthesis functionality
-        audio_data = synthesize_speech(
+        audio_data = await synthesize_speech(
             text=request.text,
             language_code=request.language_code,
-            voice_name=request.voice_name
+            voice_name=request.voice_name,
+            sample_rate_hertz=request.sample_rate_hertz,
+            postprocess=request.postprocess
         )
         
-        # Create audio stream
-        audio_stream = io.BytesIO(audio_data)
-        
         logger.debug("TTS stream synthesis completed successfully", audio_size=len(audio_data))
         
+        headers = {"Content-Disposition": "attachment; filename=synthesized_audio.wav"}
+        # 要求 URL 時才寫入內容定址儲存，並以 Content-Location 附上 GET 位址
+        if request.return_url:
+            headers.update(audio_location_headers(await store_audio(audio_data)))
+        
         return StreamingResponse(
             io.BytesIO(audio_data),
             media_type="audio/wav",
-            headers={
-                "Content-Disposition": "attachment; filename=synthesized_audio.wav"
-            }
+            headers=headers,
         )
         
     except Exception as e:
@@ -215,3 +314,86 @@ async def synthesize_text_to_speech_stream(request: TTSRequest):
             status_code=500,
             detail=f"Speech synthesis failed: {str(e)}"
         )
+
+
+class _RangeNotSatisfiable(Exception):
+    pass
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析單一範圍的 Range 標頭，返回含頭尾的 (start, end)
+
+    格式錯誤或多重範圍時返回 None，由呼叫端忽略 Range 返回完整內容；
+    無法滿足的範圍拋出 _RangeNotSatisfiable（416）
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # bytes=-N：最後 N 個位元組
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    if start < 0 or (first and last and end < start):
+        return None
+    if start >= size or size == 0:
+        raise _RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match 使用弱比較，W/ 前綴不影響
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+@router.api_route("/audio/{audio_hash}", methods=["GET", "HEAD"])
+async def get_audio(
+    request: Request,
+    audio_hash: str = Path(..., pattern=r"^[0-9a-f]{64}$"),
+):
+    """
+    以內容雜湊取得合成語音
+
+    內容永不改變：強 ETag、長期 Cache-Control，支援 If-None-Match（304）與單一範圍的 Range（206）
+    """
+    audio = await run_in_threadpool(audio_store.get, audio_hash)
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    etag = f'"{audio_hash}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.tts_audio_cache_max_age}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range 不符（客戶端持有的是別的版本）時忽略 Range，返回完整內容
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, len(audio))
+        except _RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{len(audio)}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(audio)}"
+            return Response(audio[start:end + 1], status_code=206, media_type="audio/wav", headers=headers)
+
+    return Response(audio, media_type="audio/wav", headers=headers)
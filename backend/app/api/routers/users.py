@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+import codecs
+import csv
+import orjson
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import BinaryIO, Iterator, List, Optional, TextIO, Tuple, Union
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
-from ...core.database import get_db
+from ...core.database import async_session, get_db
 from ...core.logging import get_logger
 from ...core.config import settings
-from ...core.auth import get_current_user, get_current_user_optional
-from ...schemas.user import User, UserCreate, UserUpdate, Token
-from ...services.user_service import UserService
+from ...core.auth import get_current_user, get_current_user_optional, require_admin
+from ...schemas.user import BulkUserResponse, BulkUserResult, User, UserCreate, UserUpdate, Token, serialize_user
+from ...services.user_service import UserService, UsernameAlreadyExistsError
 
 logger = get_logger("api.users")
 
@@ -17,6 +22,8 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """創建 JWT token"""
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -27,25 +34,88 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
+def _parse_bulk_rows(stream: TextIO, file_format: str) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """
+    逐列解析批次匯入內容，返回 (列號, 欄位)
+
+    CSV 第一列為欄位名稱，空白欄位視為未提供，chronic_diseases 以 ; 分隔；
+    NDJSON 每一行原樣返回，交給 schema 解析
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for row_number, row in enumerate(reader, start=1):
+            data = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            if "chronic_diseases" in data:
+                data["chronic_diseases"] = [item.strip() for item in data["chronic_diseases"].split(";") if item.strip()]
+            yield row_number, data
+    else:
+        for row_number, line in enumerate(stream, start=1):
+            if line.strip():
+                yield row_number, line
+
+
+class _TooManyRows(Exception):
+    pass
+
+
+def _validate_bulk_rows(
+    upload: BinaryIO, file_format: str, max_rows: int
+) -> Tuple[List[BulkUserResult], List[Tuple[BulkUserResult, UserCreate]]]:
+    """
+    從上傳檔逐列讀取並驗證（不一次解碼整個檔案），超過 max_rows 列時拋出 _TooManyRows
+
+    同步執行（檔案可能已落地到磁碟），由呼叫端放到執行緒池
+    """
+    results: List[BulkUserResult] = []
+    valid: List[Tuple[BulkUserResult, UserCreate]] = []
+    seen = set()
+    # 逐段解碼；StreamReader 保留行尾，CSV 欄位內的換行可正確解析
+    stream = codecs.getreader("utf-8-sig")(upload)
+    for row_number, data in _parse_bulk_rows(stream, file_format):
+        if len(results) >= max_rows:
+            raise _TooManyRows()
+        try:
+            if isinstance(data, str):
+                user = UserCreate.model_validate_json(data)
+            else:
+                user = UserCreate.model_validate(data)
+        except ValidationError as e:
+            results.append(BulkUserResult(
+                row=row_number,
+                username=data.get("username") if isinstance(data, dict) else None,
+                status="invalid",
+                error=str(e.errors()[0]["msg"]) if e.errors() else str(e),
+            ))
+            continue
+        if user.username in seen:
+            results.append(BulkUserResult(row=row_number, username=user.username, status="duplicate"))
+            continue
+        seen.add(user.username)
+        result = BulkUserResult(row=row_number, username=user.username, status="exists")
+        results.append(result)
+        valid.append((result, user))
+    return results, valid
+
+
+def _detect_bulk_format(upload: UploadFile) -> str:
+    content_type = (upload.content_type or "").lower()
+    filename = (upload.filename or "").lower()
+    if "csv" in content_type or filename.endswith(".csv"):
+        return "csv"
+    return "ndjson"
+
+
 @router.post("/register", response_model=dict)
-def register_user(username: str, db: Session = Depends(get_db)):
+async def register_user(username: str, db: AsyncSession = Depends(get_db)):
     """註冊新使用者（無密碼）"""
     logger.debug("User registration attempt", username=username)
     
     user_service = UserService(db)
     
-    # 檢查使用者名稱是否已存在
-    if user_service.get_user_by_username(username):
-        logger.warning("User registration failed: username already exists", username=username)
-        raise HTTPException(
-            status_code=400,
-            detail="Username already exists"
-        )
-    
     try:
-        # 創建用戶
+        # 創建用戶（使用者名稱衝突由資料庫判斷）
         user_data = UserCreate(username=username)
-        new_user = user_service.create_user(user_data)
+        new_user = await user_service.create_user(user_data)
         
         # 創建 token
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
@@ -57,31 +127,27 @@ def register_user(username: str, db: Session = Depends(get_db)):
         return {
             "success": True,
             "message": "User registered successfully",
-            "user": {
-                "id": new_user.id,
-                "username": new_user.username,
-                "gender": new_user.gender.value if new_user.gender else None,
-                "age": new_user.age,
-                "vision_level": new_user.vision_level.value if new_user.vision_level else None,
-                "chronic_diseases": new_user.chronic_diseases,
-                "others": new_user.others,
-                "created_at": new_user.created_at.isoformat(),
-                "updated_at": new_user.updated_at.isoformat() if new_user.updated_at else None
-            },
+            "user": serialize_user(new_user),
             "token": access_token
         }
+    except UsernameAlreadyExistsError:
+        logger.warning("User registration failed: username already exists", username=username)
+        raise HTTPException(
+            status_code=400,
+            detail="Username already exists"
+        )
     except Exception as e:
         logger.error("User registration failed", username=username, error=str(e), exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.post("/login", response_model=dict)
-def login_user(username: str, db: Session = Depends(get_db)):
+async def login_user(username: str, db: AsyncSession = Depends(get_db)):
     """使用者登入（無密碼）"""
     logger.debug("User login attempt", username=username)
     
     user_service = UserService(db)
-    user = user_service.get_user_by_username(username)
+    user = await user_service.get_user_by_username(username)
     
     if not user:
         logger.warning("User login failed: user not found", username=username)
@@ -101,17 +167,7 @@ def login_user(username: str, db: Session = Depends(get_db)):
         return {
             "success": True,
             "message": "User logged in successfully",
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "gender": user.gender.value if user.gender else None,
-                "age": user.age,
-                "vision_level": user.vision_level.value if user.vision_level else None,
-                "chronic_diseases": user.chronic_diseases,
-                "others": user.others,
-                "created_at": user.created_at.isoformat(),
-                "updated_at": user.updated_at.isoformat() if user.updated_at else None
-            },
+            "user": serialize_user(user),
             "token": access_token
         }
     except Exception as e:
@@ -120,66 +176,155 @@ def login_user(username: str, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=User)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """創建新使用者"""
     logger.debug("User creation attempt", username=user.username)
     
     user_service = UserService(db)
     
-    # 檢查使用者名稱是否已存在
-    if user_service.get_user_by_username(user.username):
+    try:
+        new_user = await user_service.create_user(user)
+        logger.debug("User created successfully", user_id=new_user.id, username=new_user.username)
+        return new_user
+    except UsernameAlreadyExistsError:
         logger.warning("User creation failed: username already exists", username=user.username)
         raise HTTPException(
             status_code=400,
             detail="Username already exists"
         )
-    
-    try:
-        new_user = user_service.create_user(user)
-        logger.debug("User created successfully", user_id=new_user.id, username=new_user.username)
-        return new_user
     except Exception as e:
         logger.error("User creation failed", username=user.username, error=str(e), exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.post("/bulk", response_model=BulkUserResponse)
+async def bulk_import_users(
+    file: UploadFile = File(...),
+    mode: str = Form(default="create", pattern="^(create|upsert)$"),
+    batch_size: int = Form(default=500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    批次匯入使用者（CSV 或 NDJSON）
+
+    mode=create 只新增，已存在的使用者會被略過；
+    mode=upsert 同時更新既有使用者有提供的欄位。
+    所有寫入在同一個交易內完成，並回報每一列的結果。
+    檔案大小與列數上限見 bulk_import_max_bytes / bulk_import_max_rows（超過返回 413）
+    """
+    file_format = _detect_bulk_format(file)
+    logger.debug("Bulk user import attempt", filename=file.filename, format=file_format, mode=mode)
+
+    max_bytes = settings.bulk_import_max_bytes
+    max_rows = settings.bulk_import_max_rows
+    try:
+        if file.size is not None and file.size > max_bytes:
+            logger.warning("Bulk user import failed: file too large", size=file.size, max_bytes=max_bytes)
+            raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+        results, valid = await run_in_threadpool(_validate_bulk_rows, file.file, file_format, max_rows)
+    except UnicodeDecodeError:
+        logger.warning("Bulk user import failed: file is not UTF-8", filename=file.filename)
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    except _TooManyRows:
+        logger.warning("Bulk user import failed: too many rows", max_rows=max_rows)
+        raise HTTPException(status_code=413, detail=f"File exceeds {max_rows} rows")
+    except csv.Error as e:
+        logger.warning("Bulk user import failed: malformed file", format=file_format, error=str(e))
+        raise HTTPException(status_code=400, detail=f"Malformed {file_format} file: {e}")
+    finally:
+        await file.close()
+
+    try:
+        written = await UserService(db).bulk_upsert_users(
+            [user for _, user in valid],
+            update_existing=mode == "upsert",
+            batch_size=batch_size,
+        )
+    except Exception as e:
+        logger.error("Bulk user import failed", count=len(valid), error=str(e), exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    for result, user in valid:
+        if user.username in written:
+            result.id, result.status = written[user.username]
+
+    counts = {status_name: 0 for status_name in ("created", "updated", "exists", "duplicate", "invalid")}
+    for result in results:
+        counts[result.status] += 1
+
+    logger.info("Bulk user import completed", mode=mode, **counts)
+    return BulkUserResponse(
+        success=counts["invalid"] == 0 and counts["duplicate"] == 0,
+        created=counts["created"],
+        updated=counts["updated"],
+        skipped=counts["exists"],
+        failed=counts["invalid"] + counts["duplicate"],
+        results=results,
+    )
+
+
 @router.get("/me", response_model=dict)
-def get_current_user_info(current_user = Depends(get_current_user)):
+async def get_current_user_info(current_user = Depends(get_current_user)):
     """獲取當前登入用戶的詳細信息"""
     logger.debug("Current user info requested", user_id=current_user.id, username=current_user.username)
     
     return {
         "success": True,
-        "user": {
-            "id": current_user.id,
-            "username": current_user.username,
-            "gender": current_user.gender.value if current_user.gender else None,
-            "age": current_user.age,
-            "vision_level": current_user.vision_level.value if current_user.vision_level else None,
-            "chronic_diseases": current_user.chronic_diseases,
-            "others": current_user.others,
-            "created_at": current_user.created_at.isoformat(),
-            "updated_at": current_user.updated_at.isoformat() if current_user.updated_at else None
-        }
+        "user": serialize_user(current_user)
     }
 
 
 @router.get("/", response_model=List[User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """獲取使用者列表"""
-    logger.debug("Users list requested", skip=skip, limit=limit)
+async def read_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[int] = Query(default=None, description="上一頁最後一筆的 id（keyset 分頁）"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    獲取使用者列表
+
+    建議使用 cursor 分頁：下一頁的 cursor 會放在 X-Next-Cursor 回應標頭，
+    沒有該標頭代表已是最後一頁。使用 skip（offset 分頁）時不提供 cursor
+    """
+    logger.debug("Users list requested", skip=skip, limit=limit, cursor=cursor)
     user_service = UserService(db)
-    users = user_service.get_users(skip=skip, limit=limit)
+    users = await user_service.get_users(skip=skip, limit=limit, after_id=cursor)
+    # 只有 keyset 分頁（或第一頁）才提供下一頁 cursor，避免從 offset 頁面混用兩種分頁
+    if len(users) == limit and (cursor is not None or skip == 0):
+        response.headers["X-Next-Cursor"] = str(users[-1].id)
     logger.debug("Users list retrieved", count=len(users))
     return users
 
 
+@router.get("/export", dependencies=[Depends(require_admin)])
+async def export_users(batch_size: int = Query(default=1000, ge=1, le=10000)):
+    """以 NDJSON 串流匯出所有使用者（需 X-Admin-Token）"""
+    logger.debug("Users export requested", batch_size=batch_size)
+
+    async def _ndjson():
+        # StreamingResponse 會在 dependency 結束後才開始輸出，因此在串流內自行管理 session
+        count = 0
+        async with async_session() as db:
+            async for user in UserService(db).stream_users(batch_size=batch_size):
+                count += 1
+                yield orjson.dumps(serialize_user(user)) + b"\n"
+        logger.info("Users export completed", count=count)
+
+    return StreamingResponse(
+        _ndjson(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=users.ndjson"}
+    )
+
+
 @router.get("/{user_id}", response_model=User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
+async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
     """根據 ID 獲取使用者"""
     logger.debug("User details requested", user_id=user_id)
     user_service = UserService(db)
-    user = user_service.get_user(user_id)
+    user = await user_service.get_user(user_id)
     if user is None:
         logger.warning("User not found", user_id=user_id)
         raise HTTPException(status_code=404, detail="User not found")
@@ -188,42 +333,52 @@ def read_user(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.put("/{user_id}", response_model=User)
-def update_user(
+async def update_user(
     user_id: int, 
     user_update: UserUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """更新使用者資訊"""
     logger.debug("User update attempt", user_id=user_id)
     
     try:
         user_service = UserService(db)
-        user = user_service.update_user(user_id, user_update)
+        user = await user_service.update_user(user_id, user_update)
         if user is None:
             logger.warning("User update failed: user not found", user_id=user_id)
             raise HTTPException(status_code=404, detail="User not found")
         logger.debug("User updated successfully", user_id=user_id, username=user.username)
         return user
+    except HTTPException:
+        raise
+    except UsernameAlreadyExistsError:
+        logger.warning("User update failed: username already exists", user_id=user_id)
+        raise HTTPException(
+            status_code=400,
+            detail="Username already exists"
+        )
     except Exception as e:
         logger.error("User update failed", user_id=user_id, error=str(e), exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.delete("/{user_id}")
-def delete_user(
+async def delete_user(
     user_id: int, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """刪除使用者"""
     logger.debug("User deletion attempt", user_id=user_id)
     
     try:
         user_service = UserService(db)
-        if not user_service.delete_user(user_id):
+        if not await user_service.delete_user(user_id):
             logger.warning("User deletion failed: user not found", user_id=user_id)
             raise HTTPException(status_code=404, detail="User not found")
         logger.debug("User deleted successfully", user_id=user_id)
         return {"message": "User deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("User deletion failed", user_id=user_id, error=str(e), exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
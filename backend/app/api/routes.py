@@ -3,6 +3,8 @@ from app.api.routers import health as health_router
 from app.api.routers import gemini as gemini_router
 from app.api.routers import tts as tts_router
 from app.api.routers import users as users_router
+from app.api.routers import admin as admin_router
+from app.api.routers import metrics as metrics_router
 
 
 api_router = APIRouter()
@@ -10,5 +12,7 @@ api_router.include_router(health_router.router)
 api_router.include_router(gemini_router.router)
 api_router.include_router(tts_router.router)
 api_router.include_router(users_router.router)
+api_router.include_router(admin_router.router)
+api_router.include_router(metrics_router.router)
 
 
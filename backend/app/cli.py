@@ -0,0 +1,281 @@
+"""
+後端管理指令
+
+    python -m app.cli startup-report [--target 1.5] [--top 20] [--json]
+    python -m app.cli rolling-restart [--timeout 60]
+
+本模組頂層只匯入標準函式庫，避免影響被量測的啟動時間
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_MEASURE_MARKER = "STARTUP_REPORT_RESULT "
+
+
+async def _asgi_lifespan_startup(app) -> Tuple[asyncio.Task, asyncio.Queue, asyncio.Queue]:
+    """送出 lifespan.startup 並等待完成，返回之後用來關閉的 task 與佇列"""
+    receive_queue: asyncio.Queue = asyncio.Queue()
+    send_queue: asyncio.Queue = asyncio.Queue()
+    scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+    task = asyncio.create_task(app(scope, receive_queue.get, send_queue.put))
+    await receive_queue.put({"type": "lifespan.startup"})
+    message = await send_queue.get()
+    if message["type"] != "lifespan.startup.complete":
+        raise RuntimeError(f"lifespan startup failed: {message.get('message', message['type'])}")
+    return task, receive_queue, send_queue
+
+
+async def _asgi_get(app, path: str) -> int:
+    """以原始 ASGI 呼叫送出一個 GET 請求，返回狀態碼"""
+    status = 0
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("latin-1"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"startup-report")],
+        "client": ("127.0.0.1", 0),
+        "server": ("startup-report", 80),
+    }
+    await app(scope, receive, send)
+    return status
+
+
+async def _measure_phases() -> Dict[str, Any]:
+    phases: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    from app.factory import create_app
+    phases["import"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app = create_app()
+    phases["create_app"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    task, receive_queue, send_queue = await _asgi_lifespan_startup(app)
+    phases["lifespan_startup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    status = await _asgi_get(app, "/health")
+    phases["first_health"] = time.perf_counter() - start
+    healthy_at = time.time()
+
+    await receive_queue.put({"type": "lifespan.shutdown"})
+    await send_queue.get()
+    await task
+
+    return {"phases": phases, "health_status": status, "healthy_at": healthy_at}
+
+
+def _run_measure() -> int:
+    """在子程序中執行：量測各階段並輸出 JSON（importtime 輸出在 stderr）"""
+    # 背景預熱的匯入不在關鍵路徑上，量測時關閉以免混入 importtime 結果
+    from app.core.config import settings
+    settings.startup_warm_imports = []
+
+    result = asyncio.run(_measure_phases())
+    print(_MEASURE_MARKER + json.dumps(result), flush=True)
+    return 0
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, float, float]]:
+    """解析 -X importtime 輸出，返回 (模組, self 秒, cumulative 秒)"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        modules.append((parts[2].strip(), int(parts[0]) / 1e6, int(parts[1]) / 1e6))
+    return modules
+
+
+def startup_report(target: float, top: int, as_json: bool) -> int:
+    """
+    量測冷啟動：程序啟動、匯入、create_app、lifespan 啟動到第一個 /health 回應
+
+    超過 target 秒時返回非零結束碼，可用於 CI
+    """
+    spawned_at = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "app.cli", "_measure"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    result: Optional[Dict[str, Any]] = None
+    for line in proc.stdout.splitlines():
+        if line.startswith(_MEASURE_MARKER):
+            result = json.loads(line[len(_MEASURE_MARKER):])
+    if proc.returncode != 0 or result is None:
+        sys.stderr.write(proc.stderr[-4000:])
+        print("startup-report: measurement failed", file=sys.stderr)
+        return 2
+
+    phases: Dict[str, float] = result["phases"]
+    # 從建立子程序到 /health 回應為止；lifespan shutdown 與程序結束不計入
+    elapsed = result["healthy_at"] - spawned_at
+    interpreter = max(0.0, elapsed - sum(phases.values()))
+    time_to_healthy = elapsed if result["health_status"] == 200 else float("inf")
+
+    modules = _parse_importtime(proc.stderr)
+    slowest = sorted(modules, key=lambda m: m[2], reverse=True)[:top]
+    heaviest_self = sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+    passed = time_to_healthy <= target
+
+    if as_json:
+        print(json.dumps({
+            "phases": phases,
+            "interpreter": interpreter,
+            "time_to_first_healthy_response": time_to_healthy,
+            "health_status": result["health_status"],
+            "target": target,
+            "passed": passed,
+            "slowest_imports_cumulative": [{"module": m, "self": s, "cumulative": c} for m, s, c in slowest],
+            "slowest_imports_self": [{"module": m, "self": s, "cumulative": c} for m, s, c in heaviest_self],
+        }, indent=2))
+        return 0 if passed else 1
+
+    print("Startup phases")
+    print(f"  {'interpreter':<22}{interpreter * 1000:>10.1f} ms")
+    for name, seconds in phases.items():
+        print(f"  {name:<22}{seconds * 1000:>10.1f} ms")
+    print(f"  {'time to first healthy':<22}{time_to_healthy * 1000:>10.1f} ms  (target {target * 1000:.0f} ms)")
+    print(f"  /health status: {result['health_status']}")
+    print()
+    print(f"Slowest imports (cumulative, top {top})")
+    for module, self_time, cumulative in slowest:
+        print(f"  {cumulative * 1000:>8.1f} ms  {self_time * 1000:>8.1f} ms self  {module}")
+    print()
+    print(f"Slowest imports (self, top {top})")
+    for module, self_time, cumulative in heaviest_self:
+        print(f"  {self_time * 1000:>8.1f} ms  {module}")
+    print()
+    print("PASS" if passed else "FAIL: time to first healthy response exceeds target")
+    return 0 if passed else 1
+
+
+def _ready_workers(ready_dir: Path) -> List[int]:
+    """gunicorn.conf.py 的 post_worker_init 為每個就緒的 worker 建立 <pid> 檔"""
+    pids = []
+    for path in ready_dir.glob("*"):
+        if not path.name.isdigit():
+            continue
+        pid = int(path.name)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            pass
+        pids.append(pid)
+    return pids
+
+
+def _wait_until(condition: Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.2)
+    return condition()
+
+
+def rolling_restart(pid_file: str, ready_dir: str, timeout: float) -> int:
+    """
+    逐一替換 gunicorn worker，過程中可服務的 worker 數不會低於原本數量
+
+    每一輪先 TTIN 增加一個新 worker（由已 preload 的 master fork，啟動很快），
+    就緒後再 TTOU 讓 master 以 SIGTERM 優雅關閉最舊的 worker
+    """
+    try:
+        master = int(Path(pid_file).read_text().strip())
+    except (OSError, ValueError) as e:
+        print(f"rolling-restart: cannot read master pid from {pid_file}: {e}", file=sys.stderr)
+        return 2
+
+    ready = Path(ready_dir)
+    count = len(_ready_workers(ready))
+    if count == 0:
+        print(f"rolling-restart: no ready workers found in {ready_dir}", file=sys.stderr)
+        return 2
+
+    for i in range(count):
+        os.kill(master, signal.SIGTTIN)
+        if not _wait_until(lambda: len(_ready_workers(ready)) > count, timeout):
+            # 新 worker 起不來時不要再關掉舊的
+            os.kill(master, signal.SIGTTOU)
+            print(f"rolling-restart: new worker did not become ready within {timeout}s", file=sys.stderr)
+            return 1
+
+        os.kill(master, signal.SIGTTOU)
+        if not _wait_until(lambda: len(_ready_workers(ready)) <= count, timeout):
+            print(f"rolling-restart: old worker did not exit within {timeout}s", file=sys.stderr)
+            return 1
+        print(f"replaced worker {i + 1}/{count}")
+
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    report = subparsers.add_parser("startup-report", help="量測冷啟動各階段與最慢的匯入")
+    report.add_argument("--target", type=float, default=None, help="首個健康回應的時間目標（秒）")
+    report.add_argument("--top", type=int, default=20, help="列出最慢的前 N 個模組")
+    report.add_argument("--json", action="store_true", help="以 JSON 輸出")
+
+    restart = subparsers.add_parser("rolling-restart", help="逐一優雅替換 gunicorn worker")
+    restart.add_argument("--pid-file", default=None, help="gunicorn master 的 pid 檔")
+    restart.add_argument("--timeout", type=float, default=None, help="每個步驟的等待上限（秒）")
+
+    subparsers.add_parser("_measure")
+
+    args = parser.parse_args(argv)
+    if args.command == "_measure":
+        return _run_measure()
+    if args.command == "startup-report":
+        target = args.target
+        if target is None:
+            from app.core.config import settings
+            target = settings.startup_target_seconds
+        return startup_report(target, args.top, args.json)
+    if args.command == "rolling-restart":
+        from app.core.config import settings
+        timeout = args.timeout or settings.gunicorn_graceful_timeout + 30
+        return rolling_restart(args.pid_file or settings.gunicorn_pid_file, settings.gunicorn_ready_dir, timeout)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
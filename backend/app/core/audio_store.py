@@ -0,0 +1,106 @@
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional
+from .config import settings
+from .logging import get_logger
+from .shared_cache import get_shared_cache
+
+logger = get_logger("core.audio_store")
+
+AUDIO_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AudioStore:
+    """
+    以內容雜湊（SHA-256）保存合成語音，供 GET /tts/audio/{hash} 讀取
+
+    - 同一段音訊只存一份，雜湊即 ETag，內容永不改變
+    - 磁碟為主要儲存（所有 worker 共用）；shared_cache 作為同主機的熱快取
+    - 總大小超過 max_bytes 時依修改時間刪除最舊的檔案
+    """
+
+    def __init__(self, directory: str, max_bytes: int, prune_every: int = 100):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, audio_hash: str) -> Path:
+        return self.directory / audio_hash[:2] / f"{audio_hash}.wav"
+
+    def put(self, audio: bytes) -> str:
+        """保存音訊並返回其雜湊；已存在時只更新修改時間（延後被清除）"""
+        audio_hash = hashlib.sha256(audio).hexdigest()
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.set(f"audio:{audio_hash}", audio)
+
+        path = self._path(audio_hash)
+        try:
+            os.utime(path)
+            return audio_hash
+        except FileNotFoundError:
+            pass
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(audio)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.prune()
+        return audio_hash
+
+    def get(self, audio_hash: str) -> Optional[bytes]:
+        if not AUDIO_HASH_PATTERN.match(audio_hash):
+            return None
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            cached = shared_cache.get(f"audio:{audio_hash}")
+            if cached is not None:
+                return cached
+        try:
+            audio = self._path(audio_hash).read_bytes()
+        except FileNotFoundError:
+            return None
+        if shared_cache is not None:
+            shared_cache.set(f"audio:{audio_hash}", audio)
+        return audio
+
+    def prune(self) -> None:
+        files = []
+        total = 0
+        for path in self.directory.glob("*/*.wav"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        logger.info("Audio store pruned", removed=removed, remaining_bytes=total)
+
+
+audio_store = AudioStore(
+    directory=settings.tts_audio_store_dir,
+    max_bytes=settings.tts_audio_store_max_mb * 1024 * 1024,
+)
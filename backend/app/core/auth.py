@@ -1,10 +1,16 @@
-from fastapi import Depends, HTTPException, status
+import hmac
+import time
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from jose.exceptions import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import UserProfile, cache_user, get_cached_user, token_cache
 from .config import settings
 from .database import get_db
 from .logging import get_logger
+from .metrics import observe_stage
 from ..services.user_service import UserService
 
 logger = get_logger("core.auth")
@@ -12,9 +18,47 @@ logger = get_logger("core.auth")
 # 創建 HTTPBearer 實例
 security = HTTPBearer()
 
-def get_current_user(
+
+def decode_access_token(token: str) -> Mapping[str, Any]:
+    """
+    解碼並驗證 JWT token，結果依 token 的 exp 快取
+
+    快取的 claims 由所有請求共用，返回唯讀 mapping；驗證失敗時拋出 JWTError
+    """
+    with observe_stage("auth"):
+        claims = token_cache.get(token)
+        if claims is not None:
+            return claims
+
+        # jose.jwt 匯入成本較高（約 80ms），延遲到第一次驗證時載入
+        from jose import jwt
+
+        claims = MappingProxyType(jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]))
+        exp = claims.get("exp")
+        ttl = exp - time.time() if exp is not None else None
+        if ttl is None or ttl > 0:
+            token_cache.set(token, claims, ttl=ttl)
+        return claims
+
+
+async def get_user_profile(db: AsyncSession, username: str) -> Optional[UserProfile]:
+    """根據使用者名稱獲取使用者快照，優先使用快取"""
+    with observe_stage("auth"):
+        generation, profile = get_cached_user(username)
+        if profile is not None:
+            return profile
+
+        user = await UserService(db).get_user_by_username(username)
+        if user is None:
+            return None
+
+        profile = UserProfile(user)
+        cache_user(username, generation, profile)
+        return profile
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     從 JWT token 中獲取當前用戶
@@ -27,11 +71,7 @@ def get_current_user(
     
     try:
         # 解碼 JWT token
-        payload = jwt.decode(
-            credentials.credentials, 
-            settings.secret_key, 
-            algorithms=[settings.algorithm]
-        )
+        payload = decode_access_token(credentials.credentials)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -39,9 +79,8 @@ def get_current_user(
         logger.warning("JWT token validation failed")
         raise credentials_exception
     
-    # 從資料庫獲取用戶信息
-    user_service = UserService(db)
-    user = user_service.get_user_by_username(username)
+    # 從快取或資料庫獲取用戶信息
+    user = await get_user_profile(db, username)
     if user is None:
         logger.warning("User not found in database", username=username)
         raise credentials_exception
@@ -49,15 +88,32 @@ def get_current_user(
     logger.debug("User authenticated successfully", username=username, user_id=user.id)
     return user
 
-def get_current_user_optional(
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """
+    只允許持有管理金鑰（settings.admin_token，X-Admin-Token 標頭）的請求存取
+
+    未設定 admin_token 時 /admin 路由停用（404）
+    """
+    if not settings.admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(
+        x_admin_token.encode("utf-8"), settings.admin_token.encode("utf-8")
+    ):
+        logger.warning("Admin access denied")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+
+async def get_current_user_optional(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     可選的用戶認證，如果沒有 token 或 token 無效則返回 None
     """
     try:
-        return get_current_user(credentials, db)
+        return await get_current_user(credentials, db)
     except HTTPException:
         return None
     except Exception:
@@ -65,7 +121,7 @@ def get_current_user_optional(
         return None
 
 def get_current_user_optional_no_dependency(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     可選的用戶認證，不依賴 HTTPBearer，手動檢查 Authorization 標頭
@@ -81,11 +137,7 @@ def get_current_user_optional_no_dependency(
         token = auth_header.split(" ")[1]
         try:
             # 解碼 JWT token
-            payload = jwt.decode(
-                token, 
-                settings.secret_key, 
-                algorithms=[settings.algorithm]
-            )
+            payload = decode_access_token(token)
             username: str = payload.get("sub")
             if username is None:
                 return None
@@ -93,9 +145,8 @@ def get_current_user_optional_no_dependency(
             logger.warning("JWT token validation failed in optional auth")
             return None
         
-        # 從資料庫獲取用戶信息
-        user_service = UserService(db)
-        user = user_service.get_user_by_username(username)
+        # 從快取或資料庫獲取用戶信息
+        user = await get_user_profile(db, username)
         if user is None:
             logger.warning("User not found in database", username=username)
             return None
@@ -0,0 +1,172 @@
+import multiprocessing
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+from .config import settings
+
+
+class LRUCache:
+    """執行緒安全、有容量上限與 TTL 的 LRU 快取"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class UserProfile:
+    """
+    使用者資料的輕量快照
+
+    只保留認證與 prompt 生成需要的欄位，不綁定 SQLAlchemy session，
+    可以安全地跨請求快取
+    """
+
+    __slots__ = (
+        "id",
+        "username",
+        "gender",
+        "age",
+        "vision_level",
+        "chronic_diseases",
+        "others",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(self, user: Any):
+        self.id = user.id
+        self.username = user.username
+        self.gender = user.gender
+        self.age = user.age
+        self.vision_level = user.vision_level
+        self.chronic_diseases = tuple(user.chronic_diseases) if user.chronic_diseases else None
+        self.others = user.others
+        self.created_at = user.created_at
+        self.updated_at = user.updated_at
+
+    def __repr__(self) -> str:
+        return f"UserProfile(id={self.id!r}, username={self.username!r})"
+
+
+# 已驗證的 JWT token -> 唯讀 claims（MappingProxyType）
+token_cache = LRUCache(maxsize=settings.auth_token_cache_size)
+
+class UserGenerations:
+    """
+    使用者資料的變更世代（跨 worker 共用的計數陣列）
+
+    依使用者名稱雜湊分桶；使用者變更或刪除時遞增對應的計數，
+    快取項目記錄寫入時的世代，世代不同即視為過期。分桶碰撞只會多一次資料庫查詢。
+    必須在 fork 之前建立（gunicorn.conf.py 的 on_starting）才會由所有 worker 共用
+    """
+
+    def __init__(self, slots: int):
+        self._counters = multiprocessing.Array("Q", slots)
+        self._values = self._counters.get_obj()
+        self._slots = slots
+
+    def _index(self, username: str) -> int:
+        # 不使用 hash()：各程序的字串雜湊種子可能不同
+        return zlib.crc32(username.encode("utf-8")) % self._slots
+
+    def get(self, username: str) -> int:
+        # 讀取對齊的 64 位元整數不需加鎖
+        return self._values[self._index(username)]
+
+    def bump(self, username: str) -> None:
+        with self._counters.get_lock():
+            self._values[self._index(username)] += 1
+
+
+_user_generations: Optional[UserGenerations] = None
+_generations_lock = threading.Lock()
+
+
+def init_user_generations() -> UserGenerations:
+    """
+    建立使用者變更世代（只建立一次）
+
+    gunicorn 在 master 的 on_starting 中呼叫；其他程序在第一次使用時才建立，只在本程序內有效
+    """
+    global _user_generations
+    if _user_generations is None:
+        with _generations_lock:
+            if _user_generations is None:
+                _user_generations = UserGenerations(settings.auth_user_generation_slots)
+    return _user_generations
+
+
+# username -> (世代, UserProfile)
+user_cache = LRUCache(
+    maxsize=settings.auth_user_cache_size,
+    ttl=settings.auth_user_cache_ttl_seconds,
+)
+
+
+def get_cached_user(username: str) -> Tuple[int, Optional[UserProfile]]:
+    """
+    返回 (目前世代, 快取的使用者快照)
+
+    使用者在任何 worker 被變更或刪除後快照為 None；查詢資料庫後以同一個世代呼叫 cache_user，
+    查詢期間發生的變更會讓這筆快取立即過期
+    """
+    generation = init_user_generations().get(username)
+    item = user_cache.get(username)
+    if item is None or item[0] != generation:
+        return generation, None
+    return generation, item[1]
+
+
+def cache_user(username: str, generation: int, profile: UserProfile, ttl: Optional[float] = None) -> None:
+    user_cache.set(username, (generation, profile), ttl=ttl)
+
+
+def invalidate_user(*usernames: Optional[str]) -> None:
+    """使用者資料變更或刪除時清除快取（其他 worker 的快取透過世代失效）"""
+    generations = init_user_generations()
+    for username in usernames:
+        if username:
+            generations.bump(username)
+            user_cache.pop(username)
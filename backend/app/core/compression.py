@@ -0,0 +1,65 @@
+import zlib
+from typing import Callable, Dict, Optional
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # 選用相依套件（backend[compression]）
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _gzip(data: bytes) -> bytes:
+    # wbits=31：gzip 標頭與 CRC，等同 gzip.compress 但不寫入時間戳
+    compressor = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=settings.compression_brotli_quality)
+
+
+def _zstd(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=settings.compression_zstd_level).compress(data)
+
+
+def available_codecs() -> Dict[str, Callable[[bytes], bytes]]:
+    """依設定的偏好順序，返回已安裝的編碼"""
+    codecs: Dict[str, Callable[[bytes], bytes]] = {"gzip": _gzip}
+    if brotli is not None:
+        codecs["br"] = _brotli
+    if zstandard is not None:
+        codecs["zstd"] = _zstd
+    return {name: codecs[name] for name in settings.compression_encodings if name in codecs}
+
+
+def negotiate(accept_encoding: str, encodings: Dict[str, Callable[[bytes], bytes]]) -> Optional[str]:
+    """
+    依 Accept-Encoding 的 q 值挑選編碼，同樣 q 值時依伺服器偏好順序
+
+    q=0 視為拒絕；「*」套用到未明確列出的編碼
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+
+    best, best_q = None, 0.0
+    for name in encodings:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
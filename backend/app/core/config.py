@@ -22,23 +22,159 @@ class Settings(BaseSettings):
     database_name: str = "mc_hackathon"
     database_user: str = "postgres"
     database_password: str = "postgres"
+    database_pool_size: int = 10
+    database_max_overflow: int = 20
+    database_pool_pre_ping: bool = True
+    database_pool_recycle: int = 1800  # seconds
+    database_pool_timeout: float = 30.0  # seconds
+    database_prepare_threshold: int = 5  # psycopg statement cache, 0 disables
     
     # JWT settings
     secret_key: str = "your-secret-key-change-this-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # Auth cache settings
+    auth_token_cache_size: int = 4096
+    auth_user_cache_size: int = 1024
+    auth_user_cache_ttl_seconds: int = 60
+    # 使用者變更世代的分桶數（跨 worker 共用，用於讓其他 worker 的使用者快取失效）
+    auth_user_generation_slots: int = 4096
+    
     # Google API settings (optional)
     google_api_key: str = ""
     google_project_id: str = ""
     google_access_token: str = ""
+    # 上游 API 位址（壓力測試時可指向本機的模擬服務）
+    gemini_base_url: str = ""  # 空字串 = SDK 預設
+    tts_api_url: str = "https://texttospeech.googleapis.com/v1/text:synthesize"
+    tts_timeout_seconds: float = 30.0
+    
+    # Gemini 呼叫排程：每個 worker 的並發上限（0 = 不限制），依優先等級與期限排隊
+    gemini_max_concurrency: int = 8
+    # 優先等級，越前面越優先；問題意圖（navigate / describe / info）或 priority 參數對應到等級名稱
+    gemini_priority_classes: list[str] = ["navigate", "describe", "default", "info", "speculative"]
+    gemini_default_deadline_seconds: float = 30.0  # 未指定 deadline_ms 時
+    
+    # 預先分析（/gemini/prefetch）：影像先到時先讀取並推測性地請 Gemini 描述畫面
+    speculation_enabled: bool = True
+    speculation_ttl_seconds: float = 20.0
+    speculation_max_entries: int = 256  # 每個 worker
+    speculation_wait_seconds: float = 8.0  # 問題到達時等待推測答案的上限
+    
+    # 語音提問上傳（與影像一起送給 Gemini）
+    gemini_audio_max_bytes: int = 5 * 1024 * 1024
+    gemini_audio_max_sample_rate: int = 16000  # WAV 高於此取樣率時降頻並混成單聲道，0 = 不處理
+    
+    # TTS audio post-processing settings
+    tts_postprocess_enabled: bool = False
+    tts_silence_threshold_db: float = -45.0
+    tts_target_dbfs: float = -16.0
+    
+    # 合成語音的內容定址儲存（GET /tts/audio/{hash}）
+    tts_audio_store_dir: str = "logs/tts_audio"
+    tts_audio_store_max_mb: int = 512
+    tts_audio_cache_max_age: int = 31536000  # 內容不會改變，可長期快取
     
     # Logging settings
-    log_level: str = "INFO"
+    log_level: str = "INFO"  # root / app logger 等級（各 handler 另有自己的等級）；需要除錯日誌時設 LOG_LEVEL=DEBUG 或透過 /admin/logging 在執行期間調整
     log_format: str = "json"  # json, text
     log_file: str = "logs/app.log"
     log_max_bytes: int = 10485760  # 10MB
     log_backup_count: int = 5
+    log_compress_backups: bool = True
+    log_queue_enabled: bool = True
+    log_queue_size: int = 10000
+    log_queue_overflow: str = "drop_new"  # drop_new, drop_oldest
+    log_sampling_enabled: bool = True
+    log_sample_rates: dict[str, float] = {}  # event name -> rate (0~1)
+    log_adaptive_events: list[str] = ["Request started", "Request completed", "Health check requested"]
+    log_adaptive_target_per_second: float = 50.0
+    log_slow_request_seconds: float = 1.0
+    
+    # Production server settings（gunicorn.conf.py）
+    gunicorn_bind: str = "0.0.0.0:8000"
+    gunicorn_workers: int = 0  # 0 = 依可用 CPU 核心數
+    gunicorn_max_requests: int = 2000  # 每個 worker 處理這麼多請求後輪替，0 = 不輪替
+    gunicorn_max_requests_jitter: int = 200
+    gunicorn_timeout: int = 120  # Gemini 呼叫可能較久
+    gunicorn_graceful_timeout: int = 30
+    gunicorn_keepalive: int = 5
+    gunicorn_pid_file: str = "logs/gunicorn.pid"
+    gunicorn_ready_dir: str = "logs/workers"
+
+    # 批次匯入使用者（POST /users/bulk）的上限
+    bulk_import_max_bytes: int = 5 * 1024 * 1024
+    bulk_import_max_rows: int = 10000
+
+    # Shared memory cache settings（跨 worker 共用，例如已合成的語音）
+    shared_cache_enabled: bool = True
+    shared_cache_size_mb: int = 64
+    shared_cache_max_entries: int = 4096
+
+    # Startup settings
+    # 啟動後在背景預先匯入的模組（不阻塞 /health）
+    startup_warm_imports: list[str] = ["google.genai", "jose.jwt", "httpx", "app.services.audio_service"]
+    # startup-report 的首個健康回應時間目標（秒）
+    startup_target_seconds: float = 1.5
+
+    # Observability settings
+    # 多 worker 時各 worker 寫出指標的目錄（gunicorn.conf.py 自動設定）；空字串 = 只輸出本程序的指標
+    metrics_multiprocess_dir: str = ""
+    metrics_flush_interval_seconds: float = 1.0
+    server_timing_enabled: bool = True
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.01  # fraction of requests to profile
+    profiling_slow_threshold_seconds: float = 2.0
+    profiling_interval_seconds: float = 0.005
+    profiling_dir: str = "logs/profiles"
+    profiling_max_captures: int = 50
+    # 流量擷取（供 benchmarks.replay 重播）；預設只記錄中繼資料與內容雜湊
+    traffic_capture_enabled: bool = False
+    traffic_capture_dir: str = "logs/traffic"
+    traffic_capture_payloads: bool = False  # 另存請求內容（可能包含使用者影像，注意保存期限）
+    traffic_capture_max_body_bytes: int = 16 * 1024 * 1024  # 另存請求內容的大小上限，超過只記錄雜湊與大小
+    traffic_capture_shape_max_bytes: int = 64 * 1024  # 超過此大小的 JSON 主體不記錄結構
+    traffic_capture_sample_rate: float = 1.0
+    traffic_capture_segment_mb: int = 64
+    # 表單 / JSON / 查詢字串中保留原值的參數欄位；其餘文字（問題、提示詞、使用者名稱）只記錄長度
+    traffic_capture_keep_fields: list[str] = [
+        "model", "language_code", "voice_name", "audio_encoding", "sample_rate_hertz", "limit", "skip", "mode",
+    ]
+    traffic_capture_exclude_paths: list[str] = ["/health", "/ready", "/metrics", "/admin", "/favicon.ico"]
+    
+    # 回應壓縮（br / zstd 需安裝 backend[compression]，未安裝時只用 gzip）
+    compression_enabled: bool = True
+    compression_encodings: list[str] = ["zstd", "br", "gzip"]  # 同樣 q 值時的偏好順序
+    compression_min_bytes: int = 1024
+    compression_content_types: list[str] = [
+        "application/json", "text/", "application/javascript", "application/xml", "image/svg+xml",
+    ]
+    compression_gzip_level: int = 5
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+    compression_threadpool_min_bytes: int = 64 * 1024  # 超過此大小在執行緒池壓縮，不阻塞 event loop
+    
+    # 請求取消：用戶端斷線或超過 X-Request-Deadline / X-Request-Timeout 時取消上游工作
+    request_cancellation_enabled: bool = True
+    request_max_timeout_seconds: float = 0.0  # 所有請求的期限上限，沒有標頭時也適用（0 = 不限制）
+    request_cancellation_exclude_paths: list[str] = ["/health", "/ready", "/metrics", "/favicon.ico"]
+    
+    # Readiness settings（超過任一門檻時 /ready 返回 503）
+    # 探針路徑：不記錄請求日誌與指標，探針不增加每次請求的成本
+    probe_paths: list[str] = ["/health", "/ready"]
+    readiness_upstream_stages: list[str] = ["gemini", "tts"]
+    readiness_max_upstream_in_flight: int = 16
+    # 等待 Gemini 配額的請求數；Gemini 並發受 gemini_max_concurrency 限制，過載時是排隊變長（0 = 不檢查）
+    readiness_max_gemini_queue: int = 8
+    readiness_max_loop_lag_ms: float = 200.0
+    readiness_max_db_pool_saturation: float = 0.9
+    readiness_max_log_queue_fill: float = 0.8
+    readiness_max_requests_in_flight: int = 0  # 0 = 不檢查
+    loop_lag_interval_seconds: float = 0.1
+
+    # Admin settings（/admin 需帶 X-Admin-Token 標頭；未設定時 /admin 停用）
+    admin_token: str = ""
     
     class Config:
         env_file = ".env"
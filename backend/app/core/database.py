@@ -1,25 +1,103 @@
+from typing import Optional, Tuple
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .config import settings
 
-# Create database engine
-engine = create_engine(
-    settings.database_url,
-    echo=False  # Set to False in production
+# 連線池設定（同步與非同步 engine 共用）
+_pool_options = {
+    "pool_size": settings.database_pool_size,
+    "max_overflow": settings.database_max_overflow,
+    "pool_pre_ping": settings.database_pool_pre_ping,
+    "pool_recycle": settings.database_pool_recycle,
+    "pool_timeout": settings.database_pool_timeout,
+}
+
+# psycopg 在同一條連線上執行超過 prepare_threshold 次的語句會自動 prepare，
+# 0 代表關閉 server-side prepared statements（例如經過 pgbouncer 時）
+_connect_args = {
+    "prepare_threshold": settings.database_prepare_threshold or None,
+}
+
+# engine 延遲到第一次使用時才建立：建立時會載入 psycopg 驅動，
+# API 程序只需要非同步 engine，CLI 腳本只需要同步 engine
+_async_engine: Optional[AsyncEngine] = None
+_engine: Optional[Engine] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """取得非同步 database engine（供 API 使用）"""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            settings.database_url,
+            echo=False,  # Set to False in production
+            connect_args=_connect_args,
+            **_pool_options,
+        )
+    return _async_engine
+
+
+def get_engine() -> Engine:
+    """取得同步 database engine（供 init_admin 等 CLI 腳本使用）"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(
+            settings.database_url,
+            echo=False,  # Set to False in production
+            pool_pre_ping=settings.database_pool_pre_ping,
+        )
+    return _engine
+
+
+async def dispose_engines() -> None:
+    """關閉已建立的連線池"""
+    global _async_engine, _engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+def async_pool_status() -> Optional[Tuple[int, int]]:
+    """返回非同步連線池 (已借出連線數, 上限)；engine 尚未建立時返回 None"""
+    if _async_engine is None:
+        return None
+    pool = _async_engine.pool
+    checkedout = getattr(pool, "checkedout", None)
+    if checkedout is None:
+        return None
+    return checkedout(), settings.database_pool_size + settings.database_max_overflow
+
+
+# Create AsyncSessionLocal class（bind 在建立 session 時才指定）
+AsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
 )
 
 # Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+def async_session() -> AsyncSession:
+    return AsyncSessionLocal(bind=get_async_engine())
+
+
+def sync_session() -> Session:
+    return SessionLocal(bind=get_engine())
+
 
 # Create Base class for models
 Base = declarative_base()
 
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with async_session() as db:
         yield db
-    finally:
-        db.close()
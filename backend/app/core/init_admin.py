@@ -1,12 +1,12 @@
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+from .database import sync_session
 from .security import get_password_hash
 from ..models.user import User
 
 
 def create_admin_user():
     """創建管理員帳號"""
-    db = SessionLocal()
+    db = sync_session()
     try:
         # 檢查是否已存在 admin 使用者
         existing_admin = db.query(User).filter(User.username == "admin").first()
@@ -0,0 +1,94 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+from .config import settings
+from .database import async_pool_status
+from .logging import get_logging_stats
+from .metrics import event_loop_lag_seconds, gemini_queue_depth, http_requests_in_flight, stage_in_flight
+
+
+class LoopLagMonitor:
+    """
+    量測 event loop 排程延遲
+
+    每隔 interval 睡眠一次，實際醒來時間與預期的差距即為延遲。
+    回報值是衰減的峰值：一次長時間阻塞會在接下來幾秒內持續反映在 readiness 上
+    """
+
+    def __init__(self, interval: float, decay: float = 0.9):
+        self.interval = interval
+        self.decay = decay
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.lag = max(lag, self.lag * self.decay)
+            event_loop_lag_seconds.set(self.lag)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor(interval=settings.loop_lag_interval_seconds)
+
+
+def readiness() -> Dict[str, Any]:
+    """
+    目前 worker 的負載與是否可接收流量
+
+    只讀取記憶體中的計數，不做 I/O，供負載平衡器高頻率探測
+    """
+    reasons: List[str] = []
+
+    upstream = int(sum(stage_in_flight.value(stage) for stage in settings.readiness_upstream_stages))
+    if upstream > settings.readiness_max_upstream_in_flight:
+        reasons.append("upstream_in_flight")
+
+    gemini_queue = int(gemini_queue_depth.value())
+    if settings.readiness_max_gemini_queue and gemini_queue > settings.readiness_max_gemini_queue:
+        reasons.append("gemini_queue_depth")
+
+    loop_lag_ms = loop_lag_monitor.lag * 1000
+    if loop_lag_ms > settings.readiness_max_loop_lag_ms:
+        reasons.append("event_loop_lag")
+
+    db_pool_saturation = 0.0
+    pool = async_pool_status()
+    if pool is not None and pool[1] > 0:
+        db_pool_saturation = pool[0] / pool[1]
+        if db_pool_saturation > settings.readiness_max_db_pool_saturation:
+            reasons.append("db_pool_saturation")
+
+    log_stats = get_logging_stats()
+    log_queue_fill = log_stats["queue_size"] / log_stats["queue_maxsize"] if log_stats["queue_maxsize"] else 0.0
+    if log_queue_fill > settings.readiness_max_log_queue_fill:
+        reasons.append("log_queue_depth")
+
+    requests_in_flight = int(http_requests_in_flight.value())
+    if settings.readiness_max_requests_in_flight and requests_in_flight > settings.readiness_max_requests_in_flight:
+        reasons.append("requests_in_flight")
+
+    return {
+        "status": "not_ready" if reasons else "ready",
+        "reasons": reasons,
+        "upstream_in_flight": upstream,
+        "gemini_queue_depth": gemini_queue,
+        "loop_lag_ms": round(loop_lag_ms, 2),
+        "db_pool_saturation": round(db_pool_saturation, 3),
+        "log_queue_depth": log_stats["queue_size"],
+        "requests_in_flight": requests_in_flight,
+    }
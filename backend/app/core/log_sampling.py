@@ -0,0 +1,139 @@
+import logging
+import random
+import time
+from typing import Any, Dict, Iterable, Optional
+import structlog
+from .config import settings
+
+
+class LogSamplingPolicy:
+    """
+    依事件名稱抽樣日誌
+
+    - WARNING 以上一律保留
+    - 帶有 process_time 且超過慢請求門檻的事件一律保留
+    - sample_rates 指定固定抽樣率（0~1）
+    - adaptive_events 中的事件在每秒次數超過 adaptive_target_per_second 時，
+      自動把抽樣率降到 target / 目前每秒次數
+    """
+
+    def __init__(
+        self,
+        sample_rates: Optional[Dict[str, float]] = None,
+        adaptive_events: Iterable[str] = (),
+        adaptive_target_per_second: float = 50.0,
+        slow_request_seconds: float = 1.0,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.sample_rates: Dict[str, float] = dict(sample_rates or {})
+        self.adaptive_events = set(adaptive_events)
+        self.adaptive_target_per_second = adaptive_target_per_second
+        self.slow_request_seconds = slow_request_seconds
+
+        # 每個事件名稱：(目前視窗開始時間, 視窗內次數, 上一個視窗的每秒次數)
+        self._windows: Dict[str, list] = {}
+        self.kept: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def _observed_rate(self, event: str, now: float) -> float:
+        window = self._windows.get(event)
+        if window is None:
+            self._windows[event] = [now, 1, 0.0]
+            return 0.0
+        elapsed = now - window[0]
+        if elapsed >= 1.0:
+            window[2] = window[1] / elapsed
+            window[0] = now
+            window[1] = 0
+        window[1] += 1
+        return max(window[2], float(window[1]))
+
+    def rate_for(self, event: str, now: Optional[float] = None) -> float:
+        """返回事件目前的抽樣率"""
+        rate = self.sample_rates.get(event, 1.0)
+        if event in self.adaptive_events:
+            observed = self._observed_rate(event, time.monotonic() if now is None else now)
+            if observed > self.adaptive_target_per_second:
+                rate = min(rate, self.adaptive_target_per_second / observed)
+        return rate
+
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """structlog processor"""
+        if not self.enabled:
+            return event_dict
+
+        event = event_dict.get("event")
+        if not isinstance(event, str):
+            return event_dict
+
+        if method_name in ("warning", "warn", "error", "exception", "critical", "fatal"):
+            return event_dict
+
+        process_time = event_dict.get("process_time")
+        if process_time is not None and process_time >= self.slow_request_seconds:
+            return event_dict
+
+        rate = self.rate_for(event)
+        if rate >= 1.0:
+            return event_dict
+
+        if random.random() < rate:
+            self.kept[event] = self.kept.get(event, 0) + 1
+            event_dict["sample_rate"] = round(rate, 4)
+            return event_dict
+
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        raise structlog.DropEvent
+
+    def update(
+        self,
+        sample_rates: Optional[Dict[str, float]] = None,
+        adaptive_events: Optional[Iterable[str]] = None,
+        adaptive_target_per_second: Optional[float] = None,
+        slow_request_seconds: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ) -> None:
+        """執行期間調整策略"""
+        if sample_rates is not None:
+            self.sample_rates = dict(sample_rates)
+        if adaptive_events is not None:
+            self.adaptive_events = set(adaptive_events)
+        if adaptive_target_per_second is not None:
+            self.adaptive_target_per_second = adaptive_target_per_second
+        if slow_request_seconds is not None:
+            self.slow_request_seconds = slow_request_seconds
+        if enabled is not None:
+            self.enabled = enabled
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rates": dict(self.sample_rates),
+            "adaptive_events": sorted(self.adaptive_events),
+            "adaptive_target_per_second": self.adaptive_target_per_second,
+            "slow_request_seconds": self.slow_request_seconds,
+            "observed_per_second": {
+                event: round(max(window[2], float(window[1])), 2) for event, window in self._windows.items()
+            },
+            "kept": dict(self.kept),
+            "dropped": dict(self.dropped),
+        }
+
+
+class GatedBoundLogger(structlog.stdlib.BoundLogger):
+    """debug() 在等級未開啟時直接返回，不進入 processor 鏈"""
+
+    def debug(self, event: Optional[str] = None, *args: Any, **kw: Any) -> Any:
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return None
+        return super().debug(event, *args, **kw)
+
+
+sampling_policy = LogSamplingPolicy(
+    sample_rates=settings.log_sample_rates,
+    adaptive_events=settings.log_adaptive_events,
+    adaptive_target_per_second=settings.log_adaptive_target_per_second,
+    slow_request_seconds=settings.log_slow_request_seconds,
+    enabled=settings.log_sampling_enabled,
+)
@@ -1,11 +1,149 @@
+import atexit
+import gzip
 import logging
 import logging.config
+import logging.handlers
+import os
+import queue
+import shutil
 import sys
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 import structlog
 from pythonjsonlogger import jsonlogger
 from .config import settings
+from .log_sampling import GatedBoundLogger, sampling_policy
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    """輪替時將舊檔案壓縮成 .gz（在 listener 執行緒中執行）"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class _LogQueueStats:
+    # 只做計數，不加鎖；偶爾少算一筆可以接受
+    def __init__(self) -> None:
+        self.enqueued = 0
+        self.dropped = 0
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    將日誌記錄放入有上限的佇列，由背景 listener 執行緒寫入實際的 handlers
+
+    佇列已滿時依 overflow 策略處理：
+      - drop_new：丟棄新記錄（ERROR 以上改為丟棄最舊的記錄）
+      - drop_oldest：丟棄最舊的記錄
+    """
+
+    def __init__(
+        self,
+        log_queue: "queue.Queue",
+        targets: Tuple[logging.Handler, ...],
+        stats: _LogQueueStats,
+        overflow: str = "drop_new",
+    ):
+        super().__init__(log_queue)
+        self.targets = targets
+        self.stats = stats
+        self.overflow = overflow
+        self.setLevel(min((h.level for h in targets), default=logging.NOTSET))
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同一個行程內傳遞，不需要複製或預先格式化，格式化交給 listener 執行緒
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        item = (record, self.targets)
+        try:
+            self.queue.put_nowait(item)
+            self.stats.enqueued += 1
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == "drop_oldest" or record.levelno >= logging.ERROR:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+                self.stats.enqueued += 1
+            except queue.Full:
+                pass
+        self.stats.dropped += 1
+
+
+class _RoutingQueueListener(logging.handlers.QueueListener):
+    """依每筆記錄附帶的 handlers 分派，讓不同 logger 共用同一個佇列"""
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+
+    def prepare(self, item):
+        return item
+
+    def enqueue_sentinel(self) -> None:
+        # 佇列滿時也要能送出停止訊號
+        self.queue.put(self._sentinel)
+
+    def handle(self, item) -> None:
+        record, targets = item
+        for handler in targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+_log_queue_stats = _LogQueueStats()
+_log_queue: Optional["queue.Queue"] = None
+_log_listener: Optional[_RoutingQueueListener] = None
+
+
+def _stop_log_listener() -> None:
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def _enable_queue_logging(logger_names) -> None:
+    """將各 logger 的 handlers 換成共用佇列的 BoundedQueueHandler，並啟動 listener"""
+    global _log_queue, _log_listener
+
+    _log_queue = queue.Queue(maxsize=settings.log_queue_size)
+    queue_handlers: Dict[Tuple[logging.Handler, ...], BoundedQueueHandler] = {}
+
+    for name in logger_names:
+        std_logger = logging.getLogger(name)
+        targets = tuple(h for h in std_logger.handlers if not isinstance(h, BoundedQueueHandler))
+        if not targets:
+            continue
+        if targets not in queue_handlers:
+            queue_handlers[targets] = BoundedQueueHandler(
+                _log_queue, targets, _log_queue_stats, overflow=settings.log_queue_overflow
+            )
+        std_logger.handlers = [queue_handlers[targets]]
+
+    _log_listener = _RoutingQueueListener(_log_queue)
+    _log_listener.start()
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    """返回日誌佇列的統計資訊"""
+    return {
+        "queue_enabled": _log_listener is not None,
+        "queue_size": _log_queue.qsize() if _log_queue is not None else 0,
+        "queue_maxsize": settings.log_queue_size,
+        "enqueued": _log_queue_stats.enqueued,
+        "dropped": _log_queue_stats.dropped,
+    }
 
 
 def setup_logging() -> None:
@@ -19,6 +157,7 @@ def setup_logging() -> None:
     structlog.configure(
         processors=[
             structlog.stdlib.filter_by_level,
+            sampling_policy,
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
             structlog.stdlib.PositionalArgumentsFormatter(),
@@ -30,7 +169,7 @@ def setup_logging() -> None:
         ],
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.stdlib.BoundLogger,
+        wrapper_class=GatedBoundLogger,
         cache_logger_on_first_use=True,
     )
     
@@ -86,12 +225,12 @@ def setup_logging() -> None:
         },
         "loggers": {
             "": {  # root logger
-                "level": "DEBUG",
+                "level": settings.log_level.upper(),
                 "handlers": ["console", "file", "json_file"],
                 "propagate": False,
             },
             "app": {
-                "level": "DEBUG",
+                "level": settings.log_level.upper(),
                 "handlers": ["console", "file", "json_file"],
                 "propagate": False,
             },
@@ -117,14 +256,40 @@ def setup_logging() -> None:
             },
         },
         "root": {
-            "level": "DEBUG",
+            "level": settings.log_level.upper(),
             "handlers": ["console", "file", "error_file"],
         },
     }
     
+    # 重新設置前先停止舊的 listener，確保佇列內的記錄都已寫出
+    _stop_log_listener()
+
     # 應用日誌配置
     logging.config.dictConfig(LOGGING_CONFIG)
 
+    # 舊的輪替檔案壓縮成 .gz
+    if settings.log_compress_backups:
+        for name in LOGGING_CONFIG["loggers"]:
+            for handler in logging.getLogger(name).handlers:
+                if isinstance(handler, logging.handlers.RotatingFileHandler):
+                    handler.namer = _gzip_namer
+                    handler.rotator = _gzip_rotator
+
+    # 佇列模式：請求執行緒只負責放入佇列，檔案 I/O、格式化與輪替都在背景執行緒
+    if settings.log_queue_enabled:
+        _enable_queue_logging(LOGGING_CONFIG["loggers"])
+
+
+def set_log_level(level: str) -> None:
+    """執行期間調整應用程式日誌等級（root 與 app logger）"""
+    level = level.upper()
+    for name in ("", "app"):
+        logging.getLogger(name).setLevel(level)
+
+
+def get_log_level() -> str:
+    return logging.getLevelName(logging.getLogger("app").getEffectiveLevel())
+
 
 def get_logger(name: str = None) -> structlog.BoundLogger:
     """獲取結構化日誌記錄器"""
@@ -136,5 +301,7 @@ def get_standard_logger(name: str = None) -> logging.Logger:
     return logging.getLogger(name or "app")
 
 
+atexit.register(_stop_log_listener)
+
 # 創建應用程式級別的日誌記錄器
 app_logger = get_logger("app")
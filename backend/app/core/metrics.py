@@ -0,0 +1,242 @@
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 指標只在 GIL 下做 += 更新，不加鎖；極少數情況下可能少算一次，
+# 換取熱路徑上沒有鎖競爭
+
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    type_name = "untyped"
+    # 多 worker 彙總方式（見 metrics_multiprocess）：sum 相加、max 取最大值
+    multiprocess_mode = "sum"
+    # worker 結束後是否保留其數值（計數類保留，才能維持單調遞增）
+    keep_after_exit = True
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        return dict(self._values)
+
+    def merge(self, values: Dict[Tuple[str, ...], float], labels: Tuple[str, ...], value: float) -> None:
+        if self.multiprocess_mode == "max":
+            values[labels] = max(values.get(labels, value), value)
+        else:
+            values[labels] = values.get(labels, 0.0) + value
+
+    def collect(self, values: Optional[Dict[Tuple[str, ...], float]] = None) -> List[str]:
+        lines = self._header()
+        for labels, value in list((self._values if values is None else values).items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+    keep_after_exit = False
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [每個 bucket 的計數..., +Inf 計數, 總和]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values.setdefault(labels, [0.0] * (len(self.buckets) + 2))
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        return {labels: list(series) for labels, series in list(self._values.items())}
+
+    def merge(self, values: Dict[Tuple[str, ...], List[float]], labels: Tuple[str, ...], series: List[float]) -> None:
+        current = values.get(labels)
+        if current is None:
+            values[labels] = list(series)
+        elif len(current) == len(series):
+            values[labels] = [a + b for a, b in zip(current, series)]
+
+    def collect(self, values: Optional[Dict[Tuple[str, ...], List[float]]] = None) -> List[str]:
+        lines = self._header()
+        for labels, series in list((self._values if values is None else values).items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+registry: List[_Metric] = []
+
+
+def render_metrics(values: Optional[Dict[str, dict]] = None) -> str:
+    """
+    以 Prometheus text exposition 格式輸出所有指標
+
+    values 為各指標彙總後的數值（metrics_multiprocess.aggregate）；省略時輸出本程序的數值
+    """
+    lines: List[str] = []
+    for metric in registry:
+        lines.extend(metric.collect(None if values is None else values.get(metric.name, {})))
+    return "\n".join(lines) + "\n"
+
+
+# HTTP 請求
+http_requests_total = Counter(
+    "http_requests_total", "Total HTTP requests", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency in seconds", ("method", "route", "status")
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+# 熱路徑內部階段
+stage_duration_seconds = Histogram(
+    "stage_duration_seconds",
+    "Latency of internal request stages (auth, db_user_lookup, image_read, prompt_build, gemini, tts, serialization)",
+    ("stage",),
+)
+stage_errors_total = Counter("stage_errors_total", "Internal stages that raised an exception", ("stage",))
+stage_cancelled_total = Counter(
+    "stage_cancelled_total", "Internal stages cancelled before finishing (client disconnect or deadline)", ("stage",)
+)
+stage_in_flight = Gauge("stage_in_flight", "Internal stages currently running", ("stage",))
+event_loop_lag_seconds = Gauge(
+    "event_loop_lag_seconds", "Recent event loop scheduling lag (decaying peak)", multiprocess_mode="max"
+)
+
+# 流量
+upload_bytes_total = Counter("upload_bytes_total", "Bytes of uploaded files read by the API", ("kind",))
+audio_bytes_total = Counter("audio_bytes_total", "Bytes of synthesized audio produced")
+
+# Gemini 排程（priority 為等級名稱：navigate、describe、default、info、speculative）
+gemini_queue_wait_seconds = Histogram(
+    "gemini_queue_wait_seconds", "Time spent waiting for a Gemini concurrency slot", ("priority",)
+)
+gemini_queue_depth = Gauge("gemini_queue_depth", "Requests waiting for a Gemini concurrency slot")
+gemini_dropped_total = Counter(
+    "gemini_dropped_total", "Requests dropped because their deadline passed before the Gemini call", ("priority",)
+)
+
+# 預先分析（/gemini/prefetch）
+# outcome：answer_reused（直接使用推測答案）、image_reused（只重用影像）、miss（handle 不存在或過期）、
+# cancelled（推測呼叫被取消）、wasted（推測呼叫完成但沒被使用）
+speculation_total = Counter("speculation_total", "Speculative pre-analysis outcomes", ("outcome",))
+
+# 回應壓縮
+compression_bytes_in_total = Counter(
+    "compression_bytes_in_total", "Response bytes before compression", ("route", "encoding")
+)
+compression_bytes_out_total = Counter(
+    "compression_bytes_out_total", "Response bytes after compression", ("route", "encoding")
+)
+compression_cpu_seconds_total = Counter(
+    "compression_cpu_seconds_total", "CPU time spent compressing responses", ("route", "encoding")
+)
+compression_ratio = Histogram(
+    "compression_ratio",
+    "Compressed size divided by original size",
+    ("route", "encoding"),
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+compression_skipped_total = Counter(
+    "compression_skipped_total", "Eligible responses sent uncompressed", ("route", "reason")
+)
+
+# 請求取消（reason：client_disconnect、deadline）
+requests_cancelled_total = Counter(
+    "requests_cancelled_total", "Requests whose work was cancelled before a response was sent", ("route", "reason")
+)
+
+
+# 目前請求的各階段耗時（秒），由 ServerTimingMiddleware 設置
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """量測一個內部階段的耗時，同時記入目前請求的 Server-Timing"""
+    start = time.perf_counter()
+    stage_in_flight.inc(stage)
+    try:
+        yield
+    except asyncio.CancelledError:
+        # 用戶端斷線或超過期限：工作被取消，不算錯誤
+        stage_cancelled_total.inc(stage)
+        raise
+    except BaseException:
+        stage_errors_total.inc(stage)
+        raise
+    finally:
+        stage_in_flight.dec(stage)
+        elapsed = time.perf_counter() - start
+        stage_duration_seconds.observe(elapsed, stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Optional
+import orjson
+from .config import settings
+from .logging import get_logger
+from .metrics import registry
+
+logger = get_logger("core.metrics_multiprocess")
+
+# 已結束 worker 的計數類數值（由 master 合併）
+_DEAD_FILE = "dead.json"
+
+
+def multiprocess_dir() -> Optional[Path]:
+    """多 worker 指標目錄；未設定時 /metrics 只輸出本程序的數值"""
+    return Path(settings.metrics_multiprocess_dir) if settings.metrics_multiprocess_dir else None
+
+
+def prepare_directory(directory: Path) -> None:
+    """master 啟動時清空目錄，避免沿用上次執行的數值"""
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True, exist_ok=True)
+
+
+def _encode(values: Dict[str, dict]) -> bytes:
+    return orjson.dumps({name: [[list(labels), value] for labels, value in series.items()] for name, series in values.items()})
+
+
+def _merge_file(path: Path, values: Dict[str, dict], metrics: Dict[str, Any]) -> None:
+    try:
+        data = orjson.loads(path.read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        # worker 剛結束或檔案正在被取代
+        return
+    for name, series in data.items():
+        metric = metrics.get(name)
+        if metric is None:
+            continue
+        target = values.setdefault(name, {})
+        for labels, value in series:
+            metric.merge(target, tuple(labels), value)
+
+
+def write_snapshot() -> None:
+    """將本程序的指標寫入 <pid>.json（先寫暫存檔再取代，讀取端不會看到寫一半的檔案）"""
+    directory = multiprocess_dir()
+    if directory is None:
+        return
+    values = {metric.name: metric.snapshot() for metric in registry}
+    path = directory / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(_encode(values))
+    os.replace(tmp, path)
+
+
+def aggregate() -> Optional[Dict[str, dict]]:
+    """
+    彙總所有 worker 的指標：本程序使用即時數值，其他 worker 使用最近一次寫入的檔案
+
+    計數與直方圖相加；gauge 依 multiprocess_mode 相加或取最大值。未啟用時返回 None
+    """
+    directory = multiprocess_dir()
+    if directory is None:
+        return None
+    metrics = {metric.name: metric for metric in registry}
+    values: Dict[str, dict] = {name: metric.snapshot() for name, metric in metrics.items()}
+    own = f"{os.getpid()}.json"
+    for path in directory.glob("*.json"):
+        if path.name != own:
+            _merge_file(path, values, metrics)
+    return values
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    worker 結束時由 master 呼叫：保留其計數與直方圖（合併到 dead.json），丟棄 gauge
+
+    worker 會不斷輪替（max_requests），合併後檔案數量不會持續增加
+    """
+    directory = multiprocess_dir()
+    if directory is None:
+        return
+    path = directory / f"{pid}.json"
+    if not path.exists():
+        return
+    metrics = {metric.name: metric for metric in registry if metric.keep_after_exit}
+    values: Dict[str, dict] = {}
+    _merge_file(directory / _DEAD_FILE, values, metrics)
+    _merge_file(path, values, metrics)
+    tmp = directory / f"{_DEAD_FILE}.tmp"
+    tmp.write_bytes(_encode(values))
+    os.replace(tmp, directory / _DEAD_FILE)
+    path.unlink()
+
+
+class MetricsPublisher:
+    """每隔 interval 在執行緒池中寫出本程序的指標，供其他 worker 的 /metrics 彙總"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, write_snapshot)
+            except OSError as e:
+                logger.warning("Failed to write metrics snapshot", error=str(e))
+
+    def start(self) -> None:
+        if multiprocess_dir() is None:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # 結束前寫出最後的數值，master 在 child_exit 時合併
+        await asyncio.get_running_loop().run_in_executor(None, write_snapshot)
+
+
+metrics_publisher = MetricsPublisher(interval=settings.metrics_flush_interval_seconds)
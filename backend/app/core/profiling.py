@@ -0,0 +1,140 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+from .config import settings
+from .logging import get_logger
+
+logger = get_logger("core.profiling")
+
+_CAPTURE_ID_RE = re.compile(r"^[0-9a-fA-F-]{36}$")
+
+
+def _collapse(frame) -> str:
+    """將 frame 轉成 flamegraph 使用的 collapsed stack（根在前）"""
+    parts: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+class _Capture:
+    __slots__ = ("thread_id", "samples")
+
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.samples: Counter = Counter()
+
+
+class SamplingProfiler:
+    """
+    低開銷的取樣式 profiler
+
+    只有在有 capture 進行中時，背景執行緒才會每隔 interval 讀取一次目標執行緒的
+    stack（sys._current_frames）。
+
+    限制：取樣的是執行緒而不是請求的 task。async 請求都在 event loop 執行緒上，
+    所以結果包含同時進行的其他請求，以及 loop 閒置等待 I/O 時的 select() stack；
+    在執行緒池中執行的工作則不會出現。結果適合找出阻塞 event loop 的 CPU 熱點，
+    不代表單一請求的 await 時間分布（該資訊見 Server-Timing）
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._captures: Dict[int, _Capture] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start_capture(self, thread_id: Optional[int] = None) -> int:
+        capture = _Capture(thread_id or threading.get_ident())
+        with self._lock:
+            self._captures[id(capture)] = capture
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return id(capture)
+
+    def stop_capture(self, capture_id: int) -> Counter:
+        """結束 capture 並返回取樣結果的複本（取樣執行緒可能仍持有該 capture）"""
+        with self._lock:
+            capture = self._captures.pop(capture_id, None)
+            return Counter(capture.samples) if capture is not None else Counter()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                captures = list(self._captures.values())
+                if not captures:
+                    self._wakeup.clear()
+                    continue
+            frames = sys._current_frames()
+            stacks = [(capture, frames.get(capture.thread_id)) for capture in captures]
+            del frames
+            collapsed = [(capture, _collapse(frame)) for capture, frame in stacks if frame is not None]
+            del stacks
+            # 計數與 stop_capture 的複製在同一把鎖下進行
+            with self._lock:
+                for capture, stack in collapsed:
+                    capture.samples[stack] += 1
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """以 X-Request-ID 命名、有數量上限的 collapsed stack 檔案環"""
+
+    def __init__(self, directory: str, max_captures: int):
+        self.directory = Path(directory)
+        self.max_captures = max_captures
+
+    def save(self, request_id: str, samples: Counter, metadata: Dict[str, object]) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{request_id}.collapsed"
+        header = " ".join(f"{key}={value}" for key, value in metadata.items())
+        lines = [f"# {header}"] + [f"{stack} {count}" for stack, count in samples.most_common()]
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        self._trim()
+        return path
+
+    def _trim(self) -> None:
+        files = sorted(self.directory.glob("*.collapsed"), key=lambda p: p.stat().st_mtime)
+        for old in files[: max(0, len(files) - self.max_captures)]:
+            try:
+                old.unlink()
+            except FileNotFoundError:
+                pass
+
+    def list(self) -> List[Dict[str, object]]:
+        if not self.directory.exists():
+            return []
+        captures = []
+        for path in sorted(self.directory.glob("*.collapsed"), key=lambda p: p.stat().st_mtime, reverse=True):
+            stat = path.stat()
+            with path.open(encoding="utf-8") as f:
+                header = f.readline().lstrip("# ").strip()
+            captures.append({
+                "request_id": path.stem,
+                "size": stat.st_size,
+                "created_at": stat.st_mtime,
+                "metadata": dict(item.split("=", 1) for item in header.split() if "=" in item),
+            })
+        return captures
+
+    def path_for(self, request_id: str) -> Optional[Path]:
+        if not _CAPTURE_ID_RE.match(request_id):
+            return None
+        path = self.directory / f"{request_id}.collapsed"
+        return path if path.exists() else None
+
+
+profiler = SamplingProfiler(interval=settings.profiling_interval_seconds)
+profile_store = ProfileStore(settings.profiling_dir, settings.profiling_max_captures)
@@ -0,0 +1,11 @@
+from typing import Any
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+from .metrics import observe_stage
+
+
+class ORJSONResponse(_ORJSONResponse):
+    """FastAPI 的 ORJSONResponse，序列化時間計入 serialization 階段"""
+
+    def render(self, content: Any) -> bytes:
+        with observe_stage("serialization"):
+            return super().render(content)
@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+from .config import settings
+from .metrics import gemini_dropped_total, gemini_queue_depth, gemini_queue_wait_seconds, observe_stage
+
+
+class DeadlineExceeded(Exception):
+    """請求在取得上游配額之前已超過期限"""
+
+
+class _Waiter:
+    __slots__ = ("priority", "deadline", "seq", "future")
+
+    def __init__(self, priority: int, deadline: float, seq: int, future: "asyncio.Future[None]"):
+        self.priority = priority
+        self.deadline = deadline
+        self.seq = seq
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        # 先比優先等級，同等級內最早期限優先（EDF），最後依到達順序
+        return (self.priority, self.deadline, self.seq) < (other.priority, other.deadline, other.seq)
+
+
+class PriorityScheduler:
+    """
+    限制上游並發數的優先權排程器（每個 worker 一個，只在 event loop 上使用，不需要鎖）
+
+    - 有空位且沒有人排隊時立即執行
+    - 否則依（優先等級, 期限）排隊；釋放空位時直接交給下一個等待者
+    - 等待期間期限已過的請求在使用配額前丟棄（DeadlineExceeded）
+    """
+
+    def __init__(self, max_concurrency: int, classes: List[str]):
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self._active = 0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    def priority_of(self, name: Optional[str]) -> int:
+        """等級名稱轉為數值（越小越優先）；未知名稱視為 default"""
+        if name in self.classes:
+            return self.classes.index(name)
+        return self.classes.index("default") if "default" in self.classes else len(self.classes)
+
+    def _label(self, priority: int) -> str:
+        return self.classes[priority] if priority < len(self.classes) else "default"
+
+    @asynccontextmanager
+    async def slot(self, priority: int, deadline: float) -> AsyncIterator[None]:
+        """
+        取得一個上游配額；deadline 為 loop.time() 的絕對時間
+
+        期限在取得配額前就已經過了時拋出 DeadlineExceeded
+        """
+        if self.max_concurrency <= 0:
+            yield
+            return
+        # 排隊時間也記入 Server-Timing（gemini_queue）
+        with observe_stage("gemini_queue"):
+            await self._acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int, deadline: float) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        label = self._label(priority)
+        if deadline <= start:
+            gemini_dropped_total.inc(label)
+            raise DeadlineExceeded("deadline already passed")
+
+        if self._active < self.max_concurrency and not self._queue:
+            self._active += 1
+            gemini_queue_wait_seconds.observe(0.0, label)
+            return
+
+        waiter = _Waiter(priority, deadline, next(self._seq), loop.create_future())
+        heapq.heappush(self._queue, waiter)
+        gemini_queue_depth.set(len(self._queue))
+        try:
+            await asyncio.wait_for(waiter.future, timeout=deadline - start)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # 逾時與 _release 交給我們配額同時發生（Python 3.12+ 的 wait_for 可能如此）：
+                # 配額是在期限前取得的，照常使用，否則 _active 永遠不會歸還
+                return
+            self._remove(waiter)
+            gemini_dropped_total.inc(label)
+            raise DeadlineExceeded("deadline passed while queued") from None
+        except DeadlineExceeded:
+            gemini_dropped_total.inc(label)
+            raise
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 配額已交給我們，但請求同時被取消：歸還
+                self._release()
+            else:
+                self._remove(waiter)
+            raise
+        finally:
+            gemini_queue_wait_seconds.observe(loop.time() - start, label)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        try:
+            self._queue.remove(waiter)
+        except ValueError:
+            return
+        heapq.heapify(self._queue)
+        gemini_queue_depth.set(len(self._queue))
+
+    def _release(self) -> None:
+        now = asyncio.get_running_loop().time()
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            gemini_queue_depth.set(len(self._queue))
+            if waiter.future.done():
+                continue
+            if waiter.deadline <= now:
+                waiter.future.set_exception(DeadlineExceeded("deadline passed while queued"))
+                continue
+            # 配額直接轉交，_active 不變
+            waiter.future.set_result(None)
+            return
+        self._active -= 1
+
+
+gemini_scheduler = PriorityScheduler(
+    max_concurrency=settings.gemini_max_concurrency,
+    classes=settings.gemini_priority_classes,
+)
@@ -0,0 +1,201 @@
+import atexit
+import hashlib
+import multiprocessing
+import os
+import struct
+import threading
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+from .config import settings
+from .logging import get_logger
+
+logger = get_logger("core.shared_cache")
+
+# header：epoch（seqlock，奇數代表正在清空）、已使用的資料位元組數、項目數
+_HEADER = struct.Struct("<QQQ")
+# index slot：key 摘要、資料 offset、資料長度；摘要全為 0 代表空 slot
+_SLOT = struct.Struct("<16sQQ")
+_EMPTY_DIGEST = bytes(16)
+_MAX_LOAD = 0.75
+
+
+def _digest(key: str) -> bytes:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    # 全 0 保留給空 slot
+    return digest if digest != _EMPTY_DIGEST else b"\x01" + digest[1:]
+
+
+class SharedBlobStore:
+    """
+    跨 worker 共用的唯讀為主 bytes 快取（POSIX shared memory）
+
+    必須在 fork 之前建立（gunicorn.conf.py 的 on_starting），各 worker 繼承同一塊記憶體與鎖，
+    內容在每台主機上只存一份。
+
+    只存放大型的 bytes（合成語音）；系統提示詞是模組常數，preload 後已由 worker
+    以 copy-on-write 共用，個人化提示詞每次組合只需數微秒，不放入共用記憶體
+
+    - 項目寫入後不再修改；key 需包含所有會影響內容的參數
+    - 讀取不加鎖；寫入與清空使用跨程序的鎖
+    - 空間或 index 用完時整個清空重來（世代式），不做逐項淘汰
+    """
+
+    def __init__(self, size: int, max_entries: int):
+        self.max_entries = max_entries
+        self._index_start = _HEADER.size
+        self._data_start = self._index_start + max_entries * _SLOT.size
+        if size <= self._data_start:
+            raise ValueError("shared cache size too small for its index")
+
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._buf = self._shm.buf
+        self._size = size
+        self._lock = multiprocessing.Lock()
+        self._owner_pid = os.getpid()
+
+        # 本程序的統計
+        self.hits = 0
+        self.misses = 0
+
+    def _probe(self, digest: bytes) -> Tuple[Optional[int], bool]:
+        """返回 (slot 位置, 是否已存在)；index 已滿時 slot 位置為 None"""
+        buf = self._buf
+        start = int.from_bytes(digest[:8], "little") % self.max_entries
+        for i in range(self.max_entries):
+            pos = self._index_start + ((start + i) % self.max_entries) * _SLOT.size
+            stored = bytes(buf[pos:pos + 16])
+            if stored == digest:
+                return pos, True
+            if stored == _EMPTY_DIGEST:
+                return pos, False
+        return None, False
+
+    def get(self, key: str) -> Optional[bytes]:
+        buf = self._buf
+        epoch = _HEADER.unpack_from(buf, 0)[0]
+        if epoch & 1:
+            self.misses += 1
+            return None
+
+        pos, found = self._probe(_digest(key))
+        if not found:
+            self.misses += 1
+            return None
+        _, offset, length = _SLOT.unpack_from(buf, pos)
+        value = bytes(buf[offset:offset + length])
+
+        # 讀取期間被清空過，內容可能已被覆寫
+        if _HEADER.unpack_from(buf, 0)[0] != epoch:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> bool:
+        """寫入項目；已存在時不覆寫。返回項目是否已在快取中"""
+        digest = _digest(key)
+        length = len(value)
+        if self._data_start + length > self._size:
+            return False
+
+        buf = self._buf
+        with self._lock:
+            epoch, used, count = _HEADER.unpack_from(buf, 0)
+            if (
+                count + 1 > self.max_entries * _MAX_LOAD
+                or self._data_start + used + length > self._size
+            ):
+                self._clear_locked()
+                epoch, used, count = _HEADER.unpack_from(buf, 0)
+                logger.info("Shared cache full, cleared", epoch=epoch)
+
+            pos, found = self._probe(digest)
+            if found:
+                return True
+            if pos is None:
+                return False
+
+            offset = self._data_start + used
+            buf[offset:offset + length] = value
+            # 先寫 offset/長度，最後寫摘要，讀取端看到摘要時資料已完整
+            _SLOT.pack_into(buf, pos, _EMPTY_DIGEST, offset, length)
+            buf[pos:pos + 16] = digest
+            _HEADER.pack_into(buf, 0, epoch, used + length, count + 1)
+        return True
+
+    def _clear_locked(self) -> None:
+        buf = self._buf
+        epoch = _HEADER.unpack_from(buf, 0)[0]
+        _HEADER.pack_into(buf, 0, epoch + 1, 0, 0)
+        buf[self._index_start:self._data_start] = bytes(self._data_start - self._index_start)
+        _HEADER.pack_into(buf, 0, epoch + 2, 0, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> Dict[str, object]:
+        epoch, used, count = _HEADER.unpack_from(self._buf, 0)
+        return {
+            "name": self._shm.name,
+            "size": self._size,
+            "data_used": used,
+            "data_capacity": self._size - self._data_start,
+            "entries": count,
+            "max_entries": self.max_entries,
+            "generation": epoch // 2,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self) -> None:
+        """建立者程序結束時移除 shared memory 名稱（已映射的 worker 不受影響）"""
+        if os.getpid() != self._owner_pid:
+            return
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+_shared_cache: Optional[SharedBlobStore] = None
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def init_shared_cache() -> Optional[SharedBlobStore]:
+    """
+    建立本程序的共用快取（只建立一次）
+
+    gunicorn 在 master 的 on_starting 中呼叫，fork 出的 worker 共用同一塊記憶體；
+    其他程序（開發用 uvicorn、CLI、benchmark）在第一次使用時才建立，沒用到快取就不配置 shared memory
+    """
+    global _shared_cache, _initialized
+    if _initialized:
+        return _shared_cache
+    with _init_lock:
+        if _initialized:
+            return _shared_cache
+        if settings.shared_cache_enabled:
+            try:
+                _shared_cache = SharedBlobStore(
+                    size=settings.shared_cache_size_mb * 1024 * 1024,
+                    max_entries=settings.shared_cache_max_entries,
+                )
+                atexit.register(_shared_cache.close)
+            except (OSError, ValueError) as e:
+                # 沒有 /dev/shm 等環境下退回不快取
+                logger.warning("Shared cache unavailable", error=str(e))
+        _initialized = True
+    return _shared_cache
+
+
+def get_shared_cache() -> Optional[SharedBlobStore]:
+    """取得共用快取；停用或無法建立時返回 None"""
+    return _shared_cache if _initialized else init_shared_cache()
+
+
+def close_shared_cache() -> None:
+    """建立者程序結束時移除 shared memory（尚未建立時不做任何事）"""
+    if _shared_cache is not None:
+        _shared_cache.close()
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+import orjson
+from .config import settings
+from .logging import get_logger
+from .metrics import speculation_total
+from .shared_cache import get_shared_cache
+
+logger = get_logger("core.speculation")
+
+# 其他 worker 等待推測答案寫入共用快取時的輪詢間隔
+_ANSWER_POLL_SECONDS = 0.05
+
+
+def image_digest(data: bytes) -> str:
+    """影像內容摘要，用於判斷重新上傳的影像是否就是預先分析的畫面"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _image_key(handle: str) -> str:
+    return f"speculation:{handle}"
+
+
+def _answer_key(handle: str) -> str:
+    return f"speculation-answer:{handle}"
+
+
+class Speculation:
+    """
+    一次預先分析：已讀取的影像與推測性的「描述畫面」Gemini 呼叫
+
+    task 只存在於建立它的 worker；其他 worker 從共用快取取得的 Speculation 沒有 task，
+    推測答案完成後同樣從共用快取讀取
+    """
+
+    __slots__ = ("handle", "user_id", "image", "mime", "model", "digest", "created_at", "task")
+
+    def __init__(
+        self,
+        user_id: Optional[int],
+        image: bytes,
+        mime: str,
+        model: str,
+        handle: Optional[str] = None,
+        created_at: Optional[float] = None,
+    ):
+        self.handle = handle or secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.image = image
+        self.mime = mime
+        self.model = model
+        self.digest = image_digest(image)
+        # 牆上時間，才能在不同 worker 之間判斷是否過期
+        self.created_at = time.time() if created_at is None else created_at
+        self.task: Optional["asyncio.Task[Any]"] = None
+
+    def expired(self, now: float) -> bool:
+        return now - self.created_at > settings.speculation_ttl_seconds
+
+
+class SpeculationStore:
+    """
+    以 handle 保存進行中的預先分析
+
+    - 過期、被新畫面取代或超過容量時取消仍在執行的推測呼叫
+    - 取出（take）後由呼叫端決定是否使用推測結果
+    - 影像與推測答案另外寫入共用快取（shared_cache），多 worker 時 handle 落在其他 worker 也能使用；
+      其他 worker 無法取消推測呼叫，只能等它在 TTL 內以最低等級執行完畢
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Speculation]" = OrderedDict()
+
+    def add(self, speculation: Speculation) -> None:
+        self.purge()
+        while len(self._entries) >= self.max_entries:
+            _, oldest = self._entries.popitem(last=False)
+            self.discard(oldest, "evicted")
+        self._entries[speculation.handle] = speculation
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            meta = orjson.dumps({
+                "user_id": speculation.user_id,
+                "mime": speculation.mime,
+                "model": speculation.model,
+                "created_at": speculation.created_at,
+            })
+            shared_cache.set(_image_key(speculation.handle), meta + b"\n" + speculation.image)
+
+    def publish_answer(self, speculation: Speculation, answer: str) -> None:
+        """推測答案完成時寫入共用快取，供其他 worker 使用"""
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.set(_answer_key(speculation.handle), answer.encode("utf-8"))
+
+    def take(self, handle: str, user_id: Optional[int]) -> Optional[Speculation]:
+        """取出 handle 對應的預先分析；不存在、已過期或不屬於此使用者時返回 None"""
+        speculation = self._entries.get(handle)
+        if speculation is None:
+            return self._take_shared(handle, user_id)
+        if speculation.user_id != user_id:
+            return None
+        del self._entries[handle]
+        if speculation.expired(time.time()):
+            self.discard(speculation, "expired")
+            return None
+        return speculation
+
+    def _take_shared(self, handle: str, user_id: Optional[int]) -> Optional[Speculation]:
+        # 由其他 worker 建立的預先分析（共用快取停用或已被清空時找不到）
+        shared_cache = get_shared_cache()
+        blob = shared_cache.get(_image_key(handle)) if shared_cache is not None else None
+        if blob is None:
+            return None
+        header, _, image = blob.partition(b"\n")
+        meta = orjson.loads(header)
+        if meta["user_id"] != user_id:
+            return None
+        speculation = Speculation(
+            user_id, image, meta["mime"], meta["model"], handle=handle, created_at=meta["created_at"]
+        )
+        if speculation.expired(time.time()):
+            return None
+        speculation_total.inc("remote")
+        return speculation
+
+    async def answer(self, speculation: Speculation, timeout: float) -> Optional[str]:
+        """等待推測答案（最多 timeout 秒）；失敗或逾時返回 None"""
+        task = speculation.task
+        if task is None:
+            return await self._wait_shared_answer(speculation, timeout)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.discard(speculation, "timeout")
+        except Exception as e:
+            logger.debug("Speculative answer unavailable", error=str(e))
+        return None
+
+    async def _wait_shared_answer(self, speculation: Speculation, timeout: float) -> Optional[str]:
+        shared_cache = get_shared_cache()
+        if shared_cache is None:
+            return None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            answer = shared_cache.get(_answer_key(speculation.handle))
+            if answer is not None:
+                return answer.decode("utf-8")
+            if loop.time() >= deadline or speculation.expired(time.time()):
+                return None
+            await asyncio.sleep(_ANSWER_POLL_SECONDS)
+
+    def cancel(self, handle: str, user_id: Optional[int], reason: str) -> bool:
+        speculation = self.take(handle, user_id)
+        if speculation is None:
+            return False
+        self.discard(speculation, reason)
+        return True
+
+    def discard(self, speculation: Speculation, reason: str) -> None:
+        """丟棄預先分析；推測呼叫仍在執行時取消，已完成則記為浪費"""
+        task = speculation.task
+        if task is not None and not task.done():
+            task.cancel()
+            speculation_total.inc("cancelled")
+        elif task is not None:
+            speculation_total.inc("wasted")
+        logger.debug("Speculation discarded", handle=speculation.handle, reason=reason)
+
+    def purge(self) -> None:
+        now = time.time()
+        # 依建立順序排列，遇到第一個未過期的即可停止
+        while self._entries:
+            handle, speculation = next(iter(self._entries.items()))
+            if not speculation.expired(now):
+                break
+            del self._entries[handle]
+            self.discard(speculation, "expired")
+
+    def close(self) -> None:
+        while self._entries:
+            _, speculation = self._entries.popitem(last=False)
+            self.discard(speculation, "shutdown")
+
+
+speculation_store = SpeculationStore(max_entries=settings.speculation_max_entries)
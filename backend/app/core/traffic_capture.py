@@ -0,0 +1,296 @@
+import os
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl
+import orjson
+from .config import settings
+from .logging import get_logger
+
+logger = get_logger("core.traffic_capture")
+
+_STOP = object()
+
+
+def _multipart_boundary(content_type: str) -> Optional[str]:
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            return value.strip('"') or None
+    return None
+
+
+class MultipartShape:
+    """
+    逐段解析 multipart 的結構（欄位名稱、檔名、型別、大小），不保留內容
+
+    請求主體讀取時即時 feed，只保留跨段的分隔符尾巴，不緩衝整個主體。
+    keep_fields 中的文字欄位（模型、語音等參數）保留原值（最多 max_value_bytes）；
+    重播時依此產生相同結構與大小的請求
+    """
+
+    _MAX_HEADER_BYTES = 16 * 1024
+
+    def __init__(self, boundary: str, keep_fields: Iterable[str] = (), max_value_bytes: int = 1024):
+        self.delimiter = b"--" + boundary.encode("latin-1")
+        self.separator = b"\r\n" + self.delimiter
+        self.keep_fields = frozenset(keep_fields)
+        self.max_value_bytes = max_value_bytes
+        self.parts: List[Dict[str, Any]] = []
+        self._buf = b""
+        self._state = "preamble"
+        self._part: Optional[Dict[str, Any]] = None
+        self._value: Optional[bytearray] = None
+
+    @classmethod
+    def for_content_type(cls, content_type: str, keep_fields: Iterable[str] = ()) -> Optional["MultipartShape"]:
+        if not content_type.startswith("multipart/form-data"):
+            return None
+        boundary = _multipart_boundary(content_type)
+        return cls(boundary, keep_fields) if boundary else None
+
+    def feed(self, data: bytes) -> None:
+        if self._state in ("done", "invalid"):
+            return
+        self._buf += data
+        while self._step():
+            pass
+
+    def _step(self) -> bool:
+        buf = self._buf
+        if self._state == "preamble":
+            index = buf.find(self.delimiter)
+            if index < 0:
+                self._buf = buf[-(len(self.delimiter) - 1):]
+                return False
+            self._buf = buf[index + len(self.delimiter):]
+            self._state = "delimiter"
+            return True
+
+        if self._state == "delimiter":
+            if len(buf) < 2:
+                return False
+            if buf.startswith(b"--"):
+                self._state = "done"
+                self._buf = b""
+                return False
+            self._buf = buf[2:] if buf.startswith(b"\r\n") else buf
+            self._state = "headers"
+            return True
+
+        if self._state == "headers":
+            index = buf.find(b"\r\n\r\n")
+            if index < 0:
+                if len(buf) > self._MAX_HEADER_BYTES:
+                    self._state = "invalid"
+                    self._buf = b""
+                return False
+            self._start_part(buf[:index])
+            self._buf = buf[index + 4:]
+            self._state = "content"
+            return True
+
+        # content：找到下一個分隔符前的內容只計算大小
+        index = buf.find(self.separator)
+        if index < 0:
+            keep = len(self.separator) - 1
+            if len(buf) > keep:
+                self._consume(buf[:-keep])
+                self._buf = buf[-keep:]
+            return False
+        self._consume(buf[:index])
+        self._finish_part()
+        self._buf = buf[index + len(self.separator):]
+        self._state = "delimiter"
+        return True
+
+    def _start_part(self, head: bytes) -> None:
+        part: Dict[str, Any] = {"size": 0}
+        for line in head.decode("latin-1").split("\r\n"):
+            name, _, value = line.partition(":")
+            if name.lower() == "content-disposition":
+                for item in value.split(";")[1:]:
+                    key, _, val = item.strip().partition("=")
+                    if key in ("name", "filename"):
+                        part[key] = val.strip('"')
+            elif name.lower() == "content-type":
+                part["content_type"] = value.strip()
+        self._part = part
+        self._value = bytearray() if "filename" not in part and part.get("name") in self.keep_fields else None
+
+    def _consume(self, content: bytes) -> None:
+        self._part["size"] += len(content)
+        if self._value is not None and len(self._value) < self.max_value_bytes:
+            self._value += content[: self.max_value_bytes - len(self._value)]
+
+    def _finish_part(self) -> None:
+        if self._value is not None:
+            self._part["value"] = self._value.decode("utf-8", "replace")
+        self.parts.append(self._part)
+        self._part = None
+        self._value = None
+
+    def result(self) -> Optional[List[Dict[str, Any]]]:
+        return self.parts if self._state == "done" or (self._state != "invalid" and self.parts) else None
+
+
+def query_shape(query_string: bytes, keep_fields: Iterable[str] = ()) -> List[List[Any]]:
+    """
+    查詢字串的結構：[名稱, {"value": 原值} 或 {"str": 長度}]
+
+    與表單相同，只有 keep_fields 中的參數保留原值，其餘（例如使用者名稱）只記錄長度
+    """
+    shape: List[List[Any]] = []
+    for key, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+        shape.append([key, {"value": value} if key in keep_fields else {"str": len(value)}])
+    return shape
+
+
+def json_shape(body: bytes, keep_fields: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+    """
+    JSON 物件的結構：字串只保留長度（keep_fields 除外），數值與布林保留原值（多為參數，例如取樣率）
+    """
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    shape: Dict[str, Any] = {}
+    for key, value in data.items():
+        if isinstance(value, str) and key in keep_fields:
+            shape[key] = {"value": value}
+        elif isinstance(value, str):
+            shape[key] = {"str": len(value)}
+        elif value is None or isinstance(value, (bool, int, float)):
+            shape[key] = {"value": value}
+        else:
+            shape[key] = {"json": len(orjson.dumps(value))}
+    return shape
+
+
+class TrafficRecorder:
+    """
+    流量擷取：將請求的中繼資料寫入只會附加的 NDJSON 分段檔
+
+    - 每筆記錄：開始時間、方法、路徑與路由樣板、狀態碼、耗時、請求 / 回應大小、
+      請求內容的 SHA-256、multipart / JSON / 查詢字串的結構
+    - capture_payloads 開啟時，請求內容依雜湊存一份於 payloads/（相同內容只存一次）
+    - 寫檔在背景執行緒；佇列滿時丟棄並計數，不影響請求
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        capture_payloads: bool,
+        segment_bytes: int,
+        keep_fields: Iterable[str] = (),
+        queue_size: int = 1000,
+    ):
+        self.directory = Path(directory)
+        self.capture_payloads = capture_payloads
+        self.segment_bytes = segment_bytes
+        self.keep_fields = frozenset(keep_fields)
+        self.recorded = 0
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._segment = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._thread.start()
+
+    def record(self, entry: Dict[str, Any], payload: Optional[bytes] = None, json_body: Optional[bytes] = None) -> None:
+        """
+        放入寫檔佇列；payload 為完整請求內容（只在 capture_payloads 時提供），
+        json_body 為 JSON 請求內容（大小受 traffic_capture_shape_max_bytes 限制），用於記錄結構
+        """
+        try:
+            self._queue.put_nowait((entry, payload, json_body))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _open_segment(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segment += 1
+        name = f"traffic-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._segment}.ndjson"
+        self._file = (self.directory / name).open("ab")
+
+    def _write_payload(self, digest: str, body: bytes) -> None:
+        path = self.directory / "payloads" / digest[:2] / digest
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+
+    def _process(self, entry: Dict[str, Any], payload: Optional[bytes], json_body: Optional[bytes]) -> None:
+        if json_body is not None:
+            shape = json_shape(json_body, self.keep_fields)
+            if shape is not None:
+                entry["json_shape"] = shape
+        if payload is not None and self.capture_payloads:
+            self._write_payload(entry["req_sha256"], payload)
+            entry["payload"] = True
+
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            self._open_segment()
+        self._file.write(orjson.dumps(entry) + b"\n")
+        self._file.flush()
+        self.recorded += 1
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            try:
+                self._process(*item)
+            except Exception as e:
+                logger.warning("Failed to write traffic capture record", error=str(e))
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "capture_payloads": self.capture_payloads,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queue_size": self._queue.qsize(),
+        }
+
+
+traffic_recorder = TrafficRecorder(
+    directory=settings.traffic_capture_dir,
+    capture_payloads=settings.traffic_capture_payloads,
+    segment_bytes=settings.traffic_capture_segment_mb * 1024 * 1024,
+    keep_fields=settings.traffic_capture_keep_fields,
+)
+
+
+def should_capture(path: str) -> bool:
+    for prefix in settings.traffic_capture_exclude_paths:
+        if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+            return False
+    rate = settings.traffic_capture_sample_rate
+    return rate >= 1.0 or random.random() < rate
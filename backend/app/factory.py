@@ -1,25 +1,106 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 from app.core.config import settings
+from app.core.database import dispose_engines, get_async_engine
+from app.core.load import loop_lag_monitor
+from app.core.metrics_multiprocess import metrics_publisher
+from app.core.shared_cache import close_shared_cache
+from app.core.speculation import speculation_store
+from app.core.traffic_capture import traffic_recorder
+from app.core.responses import ORJSONResponse
 from app.core.logging import setup_logging, get_logger
 from app.api.routes import api_router
+from app.api.routers.tts import close_tts_client
+from app.middleware.cancellation_middleware import CancellationMiddleware
+from app.middleware.capture_middleware import TrafficCaptureMiddleware
+from app.middleware.compression_middleware import CompressionMiddleware
 from app.middleware.logging_middleware import LoggingMiddleware
+from app.middleware.metrics_middleware import MetricsMiddleware
+from app.middleware.profiling_middleware import ProfilingMiddleware
+from app.middleware.server_timing_middleware import ServerTimingMiddleware
 from dotenv import load_dotenv
 
-# 設置日誌
-setup_logging()
 logger = get_logger("app")
 
 
+def _warm_imports() -> None:
+    """在背景載入第一次呼叫才需要的重量級 SDK，避免第一個請求付出匯入成本"""
+    for warm in settings.startup_warm_imports:
+        try:
+            __import__(warm)
+        except Exception as e:
+            logger.warning("Failed to warm import", module=warm, error=str(e))
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    # 日誌設置（建立目錄、開啟檔案 handler）放在啟動階段，而非模組匯入時
+    setup_logging()
+    logger.info("Starting application", app_name=settings.app_name, version=settings.version)
+
+    # 建立連線池（不會立即連線）
+    get_async_engine()
+    loop_lag_monitor.start()
+    metrics_publisher.start()
+
+    # 不等待預熱完成，/health 可以立即回應
+    warmup = None
+    if settings.startup_warm_imports:
+        warmup = asyncio.get_running_loop().run_in_executor(None, _warm_imports)
+
+    logger.info("Application started")
+    yield
+
+    await loop_lag_monitor.stop()
+    await metrics_publisher.stop()
+    # 取消仍在執行的推測性 Gemini 呼叫
+    speculation_store.close()
+    if warmup is not None:
+        await warmup
+    # 寫完佇列中剩餘的流量記錄
+    if settings.traffic_capture_enabled:
+        await asyncio.get_running_loop().run_in_executor(None, traffic_recorder.close)
+        logger.info("Traffic capture closed", **traffic_recorder.stats())
+    # 關閉 TTS 上游的連線池
+    await close_tts_client()
+    # 建立者程序結束時移除 shared memory（uvicorn 收到 SIGTERM 時不會執行 atexit）
+    close_shared_cache()
+    # 關閉資料庫連線池
+    await dispose_engines()
+    logger.info("Database connections closed")
+
+
 def create_app() -> FastAPI:
     load_dotenv(override=True)
     
-    logger.info("Starting application", app_name=settings.app_name, version=settings.version)
-    
-    application = FastAPI(title=settings.app_name, version=settings.version)
+    application = FastAPI(
+        title=settings.app_name,
+        version=settings.version,
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+    )
+
+    # 取消放在最內層：被取消的請求返回的 504 / 499 仍會經過日誌與指標
+    if settings.request_cancellation_enabled:
+        application.add_middleware(CancellationMiddleware)
+
+    # 壓縮放在其次內層：外層的日誌與指標記錄的是實際送出的大小
+    if settings.compression_enabled:
+        application.add_middleware(CompressionMiddleware)
+
+    # 流量擷取需在 LoggingMiddleware 內層，才能取得請求 ID
+    if settings.traffic_capture_enabled:
+        application.add_middleware(TrafficCaptureMiddleware)
 
-    # 添加日誌中間件（應該在其他中間件之前）
+    # 添加指標與日誌中間件（應該在其他中間件之前）
+    application.add_middleware(MetricsMiddleware)
+    if settings.profiling_enabled:
+        application.add_middleware(ProfilingMiddleware)
+    if settings.server_timing_enabled:
+        application.add_middleware(ServerTimingMiddleware)
     application.add_middleware(LoggingMiddleware)
 
     application.add_middleware(
@@ -28,6 +109,8 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # 讓瀏覽器端 RUM 可以讀取請求 ID 與各階段耗時；Content-Location 為合成語音的 GET 位址
+        expose_headers=["X-Request-ID", "Server-Timing", "Content-Location", "ETag"],
     )
 
     application.include_router(api_router)
@@ -37,7 +120,6 @@ def create_app() -> FastAPI:
     async def favicon():
         return Response(status_code=204)  # No Content
     
-    logger.info("Application created successfully")
     return application
 
 
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from typing import Optional
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..core.config import settings
+from ..core.logging import get_logger
+from ..core.metrics import requests_cancelled_total
+
+logger = get_logger("middleware.cancellation")
+
+# 用戶端已關閉連線（nginx 慣例），實際上不會被收到，只用於日誌與指標
+CLIENT_CLOSED_REQUEST = 499
+
+
+def _parse_ms(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def request_deadline(headers: Headers, loop: asyncio.AbstractEventLoop) -> Optional[float]:
+    """
+    從標頭計算請求期限（loop.time() 的絕對時間），沒有期限時返回 None
+
+    - X-Request-Deadline：Unix 時間（毫秒）
+    - X-Request-Timeout：相對於收到請求的毫秒數
+    兩者與 request_max_timeout_seconds 取最早者
+    """
+    now = loop.time()
+    candidates = []
+    absolute_ms = _parse_ms(headers.get("x-request-deadline"))
+    if absolute_ms is not None:
+        candidates.append(now + absolute_ms / 1000 - time.time())
+    timeout_ms = _parse_ms(headers.get("x-request-timeout"))
+    if timeout_ms is not None:
+        candidates.append(now + timeout_ms / 1000)
+    if settings.request_max_timeout_seconds > 0:
+        candidates.append(now + settings.request_max_timeout_seconds)
+    return min(candidates) if candidates else None
+
+
+class CancellationMiddleware:
+    """
+    用戶端斷線或超過期限時取消請求的處理（純 ASGI）
+
+    應用程式在獨立的 task 中執行，取消會傳遞到所有 await 中的工作：
+    排隊中的 Gemini 配額、Gemini / TTS 上游呼叫與資料庫查詢。
+    部分結果直接丟棄，不會寫入快取。
+
+    - 斷線：在應用程式讀完請求主體後監聽 http.disconnect，隨時取消
+    - 期限：回應開始前到期時取消並返回 504；期限也存入 request.state.deadline 供排程使用
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in settings.request_cancellation_exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = request_deadline(Headers(scope=scope), loop)
+        if deadline is not None:
+            scope.setdefault("state", {})["deadline"] = deadline
+
+        start = loop.time()
+        # 容量 1：應用程式沒有讀取時不會預先緩衝整個請求主體
+        queue: "asyncio.Queue[Message]" = asyncio.Queue(maxsize=1)
+        reason: Optional[str] = None
+        response_started = False
+        response_complete = False
+        timer: Optional[asyncio.TimerHandle] = None
+
+        def cancel(why: str) -> None:
+            nonlocal reason
+            if reason is None and not response_complete and not app_task.done():
+                reason = why
+                app_task.cancel()
+
+        async def pump() -> None:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    cancel("client_disconnect")
+                    await queue.put(message)
+                    return
+                await queue.put(message)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+                # 回應已開始送出，期限不再適用
+                if timer is not None:
+                    timer.cancel()
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        app_task = loop.create_task(self.app(scope, queue.get, send_wrapper))
+        pump_task = loop.create_task(pump())
+        if deadline is not None:
+            timer = loop.call_at(deadline, cancel, "deadline")
+
+        try:
+            await asyncio.wait({app_task})
+        except asyncio.CancelledError:
+            # 伺服器關閉等外部取消：一併取消應用程式
+            app_task.cancel()
+            await asyncio.gather(app_task, return_exceptions=True)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            pump_task.cancel()
+
+        if not app_task.cancelled():
+            app_task.result()
+            return
+        if reason is None:
+            raise asyncio.CancelledError()
+
+        route = getattr(scope.get("route"), "path", "unmatched")
+        requests_cancelled_total.inc(route, reason)
+        logger.info(
+            "Request cancelled",
+            reason=reason,
+            route=route,
+            elapsed_ms=round((loop.time() - start) * 1000, 2),
+            response_started=response_started,
+        )
+        if response_started:
+            return
+        if reason == "deadline":
+            response = JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)
+        else:
+            response = JSONResponse({"detail": "Client closed request"}, status_code=CLIENT_CLOSED_REQUEST)
+        await response(scope, receive, send)
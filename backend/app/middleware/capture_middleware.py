@@ -0,0 +1,97 @@
+import hashlib
+import time
+from typing import List, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..core.config import settings
+from ..core.traffic_capture import MultipartShape, query_shape, should_capture, traffic_recorder
+
+
+class TrafficCaptureMiddleware:
+    """
+    擷取請求流量供重播（純 ASGI）
+
+    請求內容在讀取時逐段計算雜湊並解析 multipart 結構，不延遲請求；
+    只有開啟 capture_payloads 時才保留完整內容（上限 traffic_capture_max_body_bytes），
+    JSON 主體只保留 traffic_capture_shape_max_bytes 以內的內容供解析結構。
+    記錄在回應送出後交給背景執行緒寫檔。Authorization 標頭只記錄是否存在，
+    查詢字串與表單相同，只保留參數欄位的原值
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        traffic_recorder.start()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not should_capture(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        ts = time.time()
+        start_time = time.perf_counter()
+        headers = dict(scope.get("headers") or ())
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        hasher = hashlib.sha256()
+        multipart = MultipartShape.for_content_type(content_type, traffic_recorder.keep_fields)
+        payload: Optional[List[bytes]] = [] if traffic_recorder.capture_payloads else None
+        json_body: Optional[List[bytes]] = [] if content_type.startswith("application/json") else None
+        req_bytes = 0
+        resp_bytes = 0
+        status_code = 500
+
+        async def receive_wrapper() -> Message:
+            nonlocal payload, json_body, req_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                if body:
+                    hasher.update(body)
+                    req_bytes += len(body)
+                    if multipart is not None:
+                        multipart.feed(body)
+                    if payload is not None:
+                        if req_bytes > settings.traffic_capture_max_body_bytes:
+                            payload = None
+                        else:
+                            payload.append(body)
+                    if json_body is not None:
+                        if req_bytes > settings.traffic_capture_shape_max_bytes:
+                            json_body = None
+                        else:
+                            json_body.append(body)
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, resp_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                resp_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            entry = {
+                "ts": round(ts, 6),
+                "request_id": scope.get("state", {}).get("request_id"),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", "unmatched"),
+                "query": query_shape(scope.get("query_string", b""), traffic_recorder.keep_fields),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start_time) * 1000, 3),
+                "req_bytes": req_bytes,
+                "resp_bytes": resp_bytes,
+                "req_sha256": hasher.hexdigest(),
+                "content_type": content_type,
+                "auth": b"authorization" in headers,
+            }
+            if multipart is not None:
+                parts = multipart.result()
+                if parts is not None:
+                    entry["parts"] = parts
+            traffic_recorder.record(
+                entry,
+                payload=b"".join(payload) if payload else None,
+                json_body=b"".join(json_body) if json_body else None,
+            )
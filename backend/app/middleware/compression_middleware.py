@@ -0,0 +1,117 @@
+import time
+from typing import Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..core.compression import available_codecs, negotiate
+from ..core.config import settings
+from ..core.metrics import (
+    compression_bytes_in_total,
+    compression_bytes_out_total,
+    compression_cpu_seconds_total,
+    compression_ratio,
+    compression_skipped_total,
+)
+
+
+def _compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    # 音訊等已編碼的二進位內容再壓縮只會浪費 CPU
+    if content_type.startswith(("audio/", "video/")):
+        return False
+    return content_type.startswith(tuple(settings.compression_content_types))
+
+
+class CompressionMiddleware:
+    """
+    依 Accept-Encoding 協商 zstd / br / gzip 壓縮回應（純 ASGI）
+
+    - 只壓縮 compression_content_types 中的型別，且大小至少 compression_min_bytes
+    - 只處理單一訊息的回應主體（一般 JSON 回應）；串流回應原樣轉送，不會被緩衝
+    - 已有 Content-Encoding 的回應不處理；壓縮後沒有變小時送出原始內容
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.codecs = available_codecs()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not _compressible(headers.get("content-type", "")):
+                    passthrough = True
+                    await send(message)
+                    return
+                # 回應內容依 Accept-Encoding 而不同，快取需以此區分
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                # 等到主體才決定是否壓縮
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            route = getattr(scope.get("route"), "path", "unmatched")
+            reason = None
+            if message.get("more_body", False):
+                reason = "streaming"
+            elif encoding is None:
+                reason = "not_accepted"
+            elif len(body) < settings.compression_min_bytes:
+                reason = "too_small"
+
+            if reason is None:
+                compressed = await self._compress(encoding, body, route)
+                if len(compressed) < len(body):
+                    headers = MutableHeaders(raw=start_message["headers"])
+                    headers["content-encoding"] = encoding
+                    headers["content-length"] = str(len(compressed))
+                    del headers["accept-ranges"]
+                    body = compressed
+                else:
+                    reason = "no_gain"
+
+            if reason is not None:
+                compression_skipped_total.inc(route, reason)
+            await send(start_message)
+            start_message = None
+            passthrough = True
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _compress(self, encoding: str, body: bytes, route: str) -> bytes:
+        codec = self.codecs[encoding]
+
+        def run() -> Tuple[bytes, float]:
+            # thread_time 只計算目前執行緒的 CPU 時間，不受 event loop 上其他工作影響
+            cpu_start = time.thread_time()
+            result = codec(body)
+            return result, time.thread_time() - cpu_start
+
+        if len(body) >= settings.compression_threadpool_min_bytes:
+            compressed, cpu = await run_in_threadpool(run)
+        else:
+            compressed, cpu = run()
+
+        compression_bytes_in_total.inc(route, encoding, amount=len(body))
+        compression_bytes_out_total.inc(route, encoding, amount=len(compressed))
+        compression_cpu_seconds_total.inc(route, encoding, amount=cpu)
+        compression_ratio.observe(len(compressed) / len(body), route, encoding)
+        return compressed
@@ -1,74 +1,96 @@
+import logging
 import time
 import uuid
-from typing import Callable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..core.config import settings
 from ..core.logging import get_logger
 
 logger = get_logger("middleware")
+_std_logger = logging.getLogger("middleware")
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """HTTP請求日誌中間件"""
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # 生成請求ID
+def _header(scope: Scope, name: bytes) -> str:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return "unknown"
+
+
+class LoggingMiddleware:
+    """
+    HTTP請求日誌中間件（純 ASGI）
+
+    包裝 send 以取得狀態碼與回應大小，不緩衝回應內容，串流回應可直接通過；
+    探針路徑（probe_paths）直接通過，不產生請求 ID 與日誌
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.skip_paths = frozenset(settings.probe_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        # 生成請求ID，並放到 request.state 供後續使用
         request_id = str(uuid.uuid4())
-        
-        # 記錄請求開始
-        start_time = time.time()
-        
-        # 獲取客戶端IP
-        client_ip = request.client.host if request.client else "unknown"
-        
-        # 記錄請求信息
-        logger.info(
-            "Request started",
-            request_id=request_id,
-            method=request.method,
-            url=str(request.url),
-            client_ip=client_ip,
-            user_agent=request.headers.get("user-agent", "unknown"),
-        )
-        
-        # 處理請求
-        try:
-            response = await call_next(request)
-            
-            # 計算處理時間
-            process_time = time.time() - start_time
-            
-            # 記錄響應信息
+        scope.setdefault("state", {})["request_id"] = request_id
+        request_id_header = request_id.encode("latin-1")
+
+        start_time = time.perf_counter()
+        status_code = 500
+        response_size = 0
+
+        if _std_logger.isEnabledFor(logging.INFO):
+            client = scope.get("client")
             logger.info(
-                "Request completed",
+                "Request started",
                 request_id=request_id,
-                method=request.method,
-                url=str(request.url),
-                status_code=response.status_code,
-                process_time=round(process_time, 4),
-                client_ip=client_ip,
+                method=scope["method"],
+                path=scope["path"],
+                query=scope.get("query_string", b"").decode("latin-1"),
+                client_ip=client[0] if client else "unknown",
+                user_agent=_header(scope, b"user-agent"),
             )
-            
-            # 添加請求ID到響應頭
-            response.headers["X-Request-ID"] = request_id
-            
-            return response
-            
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # 添加請求ID到響應頭
+                message["headers"] = list(message.get("headers", ())) + [(b"x-request-id", request_id_header)]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
-            # 計算處理時間
-            process_time = time.time() - start_time
-            
-            # 記錄錯誤
+            process_time = time.perf_counter() - start_time
+            client = scope.get("client")
             logger.error(
                 "Request failed",
                 request_id=request_id,
-                method=request.method,
-                url=str(request.url),
+                method=scope["method"],
+                path=scope["path"],
                 error=str(e),
                 process_time=round(process_time, 4),
-                client_ip=client_ip,
+                client_ip=client[0] if client else "unknown",
                 exc_info=True,
             )
-            
-            # 重新拋出異常
             raise
+
+        process_time = time.perf_counter() - start_time
+        if _std_logger.isEnabledFor(logging.INFO):
+            client = scope.get("client")
+            logger.info(
+                "Request completed",
+                request_id=request_id,
+                method=scope["method"],
+                path=scope["path"],
+                status_code=status_code,
+                response_size=response_size,
+                process_time=round(process_time, 4),
+                client_ip=client[0] if client else "unknown",
+            )
@@ -0,0 +1,41 @@
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..core.config import settings
+from ..core.metrics import http_request_duration_seconds, http_requests_in_flight, http_requests_total
+
+
+class MetricsMiddleware:
+    """
+    記錄每個路由的請求數、延遲與進行中請求數（純 ASGI）
+
+    路由標籤使用路由樣板（例如 /users/{user_id}），未匹配的路徑一律記為 unmatched，
+    避免標籤數量無限增長；探針路徑（probe_paths）不記錄
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.skip_paths = frozenset(settings.probe_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "unmatched"), str(status_code))
+            http_requests_total.inc(*labels)
+            http_request_duration_seconds.observe(time.perf_counter() - start_time, *labels)
@@ -0,0 +1,46 @@
+import random
+import time
+import uuid
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+from ..core.config import settings
+from ..core.logging import get_logger
+from ..core.profiling import profile_store, profiler
+
+logger = get_logger("middleware.profiling")
+
+
+class ProfilingMiddleware:
+    """
+    對一部分請求啟動取樣 profiler，只保留超過延遲門檻的結果（純 ASGI）
+
+    需放在 LoggingMiddleware 內層，才能取得 request.state.request_id。
+    取樣的是 event loop 執行緒，結果可能包含同時進行的其他請求（見 SamplingProfiler）
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or random.random() >= settings.profiling_sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        capture_id = profiler.start_capture()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            samples = profiler.stop_capture(capture_id)
+            duration = time.perf_counter() - start_time
+            if duration >= settings.profiling_slow_threshold_seconds and samples:
+                # 沒有經過 LoggingMiddleware 的請求（例如探針路徑）另外產生 ID，才能從 /admin/profiles 下載
+                request_id = scope.get("state", {}).get("request_id") or str(uuid.uuid4())
+                metadata = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "duration": round(duration, 4),
+                    "samples": sum(samples.values()),
+                }
+                await run_in_threadpool(profile_store.save, request_id, samples, metadata)
+                logger.info("Slow request profile captured", request_id=request_id, **metadata)
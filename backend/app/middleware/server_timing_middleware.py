@@ -0,0 +1,39 @@
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..core.metrics import request_timings
+
+
+class ServerTimingMiddleware:
+    """
+    在回應加上 Server-Timing 標頭（純 ASGI）
+
+    各階段耗時由 observe_stage 記錄（auth、prompt_build、gemini、tts、serialization...），
+    total 為從收到請求到送出回應標頭的時間
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        timings = {}
+        token = request_timings.set(timings)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start_time
+                entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings.items()]
+                entries.append(f"total;dur={total * 1000:.1f}")
+                message["headers"] = list(message.get("headers", ())) + [
+                    (b"server-timing", ", ".join(entries).encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_timings.reset(token)
@@ -0,0 +1,11 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+
+class LoggingPolicyUpdate(BaseModel):
+    level: Optional[str] = Field(default=None, pattern="(?i)^(DEBUG|INFO|WARNING|ERROR|CRITICAL)$")
+    sampling_enabled: Optional[bool] = None
+    sample_rates: Optional[Dict[str, float]] = None
+    adaptive_events: Optional[List[str]] = None
+    adaptive_target_per_second: Optional[float] = Field(default=None, gt=0)
+    slow_request_seconds: Optional[float] = Field(default=None, ge=0)
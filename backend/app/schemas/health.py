@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel
 
 
@@ -5,3 +6,13 @@ class HealthResponse(BaseModel):
     status: str
 
 
+
+
+class ReadinessResponse(BaseModel):
+    status: str  # ready, not_ready
+    reasons: List[str]
+    upstream_in_flight: int
+    loop_lag_ms: float
+    db_pool_saturation: float
+    log_queue_depth: int
+    requests_in_flight: int
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 
@@ -6,12 +6,17 @@ class TTSRequest(BaseModel):
     text: str
     language_code: Optional[str] = "cmn-CN"
     voice_name: Optional[str] = "cmn-CN-Chirp3-HD-Achernar"
+    sample_rate_hertz: Optional[int] = Field(default=None, ge=8000, le=48000)
+    postprocess: Optional[bool] = None
+    # True 時 audio_url 為可快取的 GET /tts/audio/{hash}，而非 base64 data URL
+    return_url: bool = False
 
 
 class TTSResponse(BaseModel):
     success: bool
     message: str
     audio_url: Optional[str] = None
+    audio_hash: Optional[str] = None
 
 
 class TTSErrorResponse(BaseModel):
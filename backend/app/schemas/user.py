@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from datetime import datetime
-from typing import Optional, List
+from operator import attrgetter
+from typing import Any, Optional, List
 from enum import Enum
 
 
@@ -40,6 +41,14 @@ class UserUpdate(BaseModel):
     chronic_diseases: Optional[List[str]] = None
     others: Optional[str] = None
 
+    @field_validator("username")
+    @classmethod
+    def username_not_null(cls, value: Optional[str]) -> str:
+        # 可以省略（不更新），但不能明確設為 null
+        if value is None:
+            raise ValueError("username cannot be null")
+        return value
+
 
 class UserInDB(UserBase):
     id: int
@@ -59,6 +68,23 @@ class User(UserBase):
         from_attributes = True
 
 
+class BulkUserResult(BaseModel):
+    row: int
+    username: Optional[str] = None
+    status: str  # created, updated, exists, duplicate, invalid
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkUserResponse(BaseModel):
+    success: bool
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    results: List[BulkUserResult]
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -66,3 +92,42 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+
+
+_user_fields = attrgetter(
+    "id",
+    "username",
+    "gender",
+    "age",
+    "vision_level",
+    "chronic_diseases",
+    "others",
+    "created_at",
+    "updated_at",
+)
+
+
+def serialize_user(user: Any) -> dict:
+    """將 ORM 使用者或 UserProfile 轉成回應用的 dict（所有使用者回應共用）"""
+    (
+        user_id,
+        username,
+        gender,
+        age,
+        vision_level,
+        chronic_diseases,
+        others,
+        created_at,
+        updated_at,
+    ) = _user_fields(user)
+    return {
+        "id": user_id,
+        "username": username,
+        "gender": gender.value if gender is not None else None,
+        "age": age,
+        "vision_level": vision_level.value if vision_level is not None else None,
+        "chronic_diseases": list(chronic_diseases) if chronic_diseases is not None else None,
+        "others": others,
+        "created_at": created_at.isoformat() if created_at is not None else None,
+        "updated_at": updated_at.isoformat() if updated_at is not None else None,
+    }
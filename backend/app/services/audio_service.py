@@ -0,0 +1,192 @@
+import io
+import wave
+from typing import Optional, Tuple
+import numpy as np
+from ..core.config import settings
+from ..core.logging import get_logger
+
+logger = get_logger("services.audio")
+
+# LINEAR16 的最大振幅
+_INT16_MAX = 32767
+
+
+def read_wav(audio_data: bytes) -> Tuple[np.ndarray, int, int]:
+    """
+    解析 WAV 音訊，返回 (samples, sample_rate, channels)
+
+    samples 為 float32，範圍 [-1, 1]，形狀為 (frames, channels)
+    """
+    with wave.open(io.BytesIO(audio_data), "rb") as wav:
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        sample_width = wav.getsampwidth()
+        frames = wav.readframes(wav.getnframes())
+
+    if sample_width != 2:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+
+    samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / _INT16_MAX
+    return samples.reshape(-1, channels), sample_rate, channels
+
+
+def write_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """將 float32 取樣寫回 LINEAR16 WAV（重新產生標頭）"""
+    channels = samples.shape[1] if samples.ndim > 1 else 1
+    pcm = np.clip(samples, -1.0, 1.0)
+    pcm = np.round(pcm * _INT16_MAX).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def trim_silence(
+    samples: np.ndarray,
+    sample_rate: int,
+    threshold_db: float = -45.0,
+    frame_ms: int = 10,
+    padding_ms: int = 50,
+) -> np.ndarray:
+    """
+    依能量門檻裁掉開頭與結尾的靜音
+
+    以 frame_ms 為窗計算 RMS，第一個與最後一個超過門檻的窗之間的內容會被保留，
+    前後各保留 padding_ms 避免切掉子音
+    """
+    frame_len = max(1, sample_rate * frame_ms // 1000)
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return samples
+
+    mono = samples.mean(axis=1)
+    frames = mono[: n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    threshold = 10.0 ** (threshold_db / 20.0)
+
+    voiced = np.flatnonzero(rms > threshold)
+    if voiced.size == 0:
+        # 全部都是靜音，保留原樣交給上層決定
+        return samples
+
+    padding = sample_rate * padding_ms // 1000
+    start = max(0, voiced[0] * frame_len - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame_len + padding)
+    return samples[start:end]
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """
+    線性插值重新取樣
+
+    降頻時先做移動平均低通，避免高頻混疊
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+
+    if target_rate < source_rate:
+        width = int(round(source_rate / target_rate))
+        if width > 1:
+            kernel = np.ones(width, dtype=np.float32) / width
+            samples = np.stack(
+                [np.convolve(samples[:, c], kernel, mode="same") for c in range(samples.shape[1])],
+                axis=1,
+            )
+
+    n_out = int(round(len(samples) * target_rate / source_rate))
+    src_positions = np.arange(len(samples), dtype=np.float64)
+    out_positions = np.linspace(0, len(samples) - 1, n_out)
+    return np.stack(
+        [np.interp(out_positions, src_positions, samples[:, c]) for c in range(samples.shape[1])],
+        axis=1,
+    ).astype(np.float32)
+
+
+def normalize_loudness(samples: np.ndarray, target_dbfs: float = -16.0) -> np.ndarray:
+    """將 RMS 響度調整到 target_dbfs，並限制峰值不超過滿刻度"""
+    if len(samples) == 0:
+        return samples
+
+    rms = float(np.sqrt(np.mean(np.square(samples))))
+    if rms == 0.0:
+        return samples
+
+    gain = 10.0 ** (target_dbfs / 20.0) / rms
+    peak = float(np.max(np.abs(samples)))
+    if peak * gain > 1.0:
+        gain = 1.0 / peak
+    return samples * gain
+
+
+def postprocess_wav(
+    audio_data: bytes,
+    sample_rate_hertz: Optional[int] = None,
+    trim: bool = True,
+    normalize: bool = True,
+) -> bytes:
+    """
+    TTS 輸出的後處理：裁靜音、重新取樣、響度正規化，並重寫 WAV 標頭
+
+    非 LINEAR16 WAV 的輸入會原樣返回
+    """
+    try:
+        samples, source_rate, _ = read_wav(audio_data)
+    except (wave.Error, ValueError, EOFError) as e:
+        logger.warning("Audio post-processing skipped", error=str(e))
+        return audio_data
+
+    if trim:
+        samples = trim_silence(samples, source_rate, threshold_db=settings.tts_silence_threshold_db)
+
+    target_rate = sample_rate_hertz or source_rate
+    if target_rate != source_rate:
+        samples = resample(samples, source_rate, target_rate)
+
+    if normalize:
+        samples = normalize_loudness(samples, target_dbfs=settings.tts_target_dbfs)
+
+    processed = write_wav(samples, target_rate)
+    logger.debug(
+        "Audio post-processed",
+        original_size=len(audio_data),
+        processed_size=len(processed),
+        source_rate=source_rate,
+        target_rate=target_rate,
+    )
+    return processed
+
+
+def downsample_wav(audio_data: bytes, max_sample_rate: int) -> bytes:
+    """
+    上傳語音的前處理：混成單聲道，取樣率高於 max_sample_rate 時降頻
+
+    Gemini 內部會將音訊降到 16kHz 單聲道，先在伺服器端處理可減少上游傳輸量；
+    非 LINEAR16 WAV（例如瀏覽器錄製的 webm/opus）原樣返回
+    """
+    try:
+        samples, source_rate, channels = read_wav(audio_data)
+    except (wave.Error, ValueError, EOFError):
+        return audio_data
+
+    if channels == 1 and source_rate <= max_sample_rate:
+        return audio_data
+
+    samples = samples.mean(axis=1, keepdims=True)
+    target_rate = min(source_rate, max_sample_rate)
+    if target_rate != source_rate:
+        samples = resample(samples, source_rate, target_rate)
+
+    processed = write_wav(samples, target_rate)
+    logger.debug(
+        "Uploaded audio downsampled",
+        original_size=len(audio_data),
+        processed_size=len(processed),
+        source_rate=source_rate,
+        target_rate=target_rate,
+        channels=channels,
+    )
+    return processed
@@ -0,0 +1,33 @@
+from typing import Optional
+
+INTENTS = ("navigate", "info", "describe")
+
+# 依序比對：導航優先（安全相關），其次是物品資訊，最後是畫面描述
+_KEYWORDS = (
+    ("navigate", (
+        "怎麼走", "怎麼去", "帶我", "導航", "方向", "在哪", "出口", "入口", "樓梯", "電梯",
+        "過馬路", "紅綠燈", "門口", "往哪", "左轉", "右轉", "怎么走", "导航", "电梯",
+    )),
+    ("info", (
+        "多少錢", "價格", "價錢", "成分", "熱量", "保存期限", "有效期限", "過敏", "素食", "含糖",
+        "怎麼用", "說明", "這是什麼", "是什麼", "品牌", "多少钱", "价格", "成分表", "怎么用",
+    )),
+    ("describe", (
+        "前面有什麼", "前方有什麼", "有什麼", "周圍", "附近", "描述", "看到什麼", "畫面", "環境",
+        "這是哪裡", "眼前", "前面有什么", "周围", "描述一下",
+    )),
+)
+
+
+def guess_intent(text: Optional[str]) -> Optional[str]:
+    """
+    以關鍵字快速猜測問題意圖（describe / navigate / info），無法判斷時返回 None
+
+    只用於排程與推測性分析的提示，不影響 Gemini 的回答
+    """
+    if not text:
+        return None
+    for intent, keywords in _KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return intent
+    return None
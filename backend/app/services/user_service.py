@@ -1,100 +1,245 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
-from ..models.user import User
+from pydantic import BaseModel
+from sqlalchemy import delete, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, Optional, List, Tuple
+from ..models.user import GenderEnum, User, VisionLevelEnum
 from ..schemas.user import UserCreate, UserUpdate
+from ..core.cache import invalidate_user
 from ..core.logging import get_logger
+from ..core.metrics import observe_stage
 
 logger = get_logger("services.user")
 
 
+class UsernameAlreadyExistsError(Exception):
+    """使用者名稱已被使用"""
+
+
+# PostgreSQL SQLSTATE unique_violation
+UNIQUE_VIOLATION = "23505"
+
+
+def _is_unique_violation(error: IntegrityError) -> bool:
+    orig = error.orig
+    return (getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)) == UNIQUE_VIOLATION
+
+
+def _user_row(user: BaseModel, fields: Iterable[str]) -> dict:
+    """將 schema 轉成 users 表的欄位值（enum 轉為 ORM enum）"""
+    row = {}
+    for field in fields:
+        value = getattr(user, field)
+        if field == "gender" and value is not None:
+            value = GenderEnum(value.value)
+        elif field == "vision_level" and value is not None:
+            value = VisionLevelEnum(value.value)
+        row[field] = value
+    return row
+
+
 class UserService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def get_user(self, user_id: int) -> Optional[User]:
+    async def get_user(self, user_id: int) -> Optional[User]:
         """根據 ID 獲取使用者"""
         logger.debug("Getting user by ID", user_id=user_id)
-        user = self.db.query(User).filter(User.id == user_id).first()
+        with observe_stage("db_user_lookup"):
+            user = await self.db.scalar(select(User).where(User.id == user_id))
         if user:
             logger.debug("User found", user_id=user_id, username=user.username)
         else:
             logger.debug("User not found", user_id=user_id)
         return user
 
-    def get_user_by_username(self, username: str) -> Optional[User]:
+    async def get_user_by_username(self, username: str) -> Optional[User]:
         """根據使用者名稱獲取使用者"""
         logger.debug("Getting user by username", username=username)
-        user = self.db.query(User).filter(User.username == username).first()
+        with observe_stage("db_user_lookup"):
+            user = await self.db.scalar(select(User).where(User.username == username))
         if user:
             logger.debug("User found by username", username=username, user_id=user.id)
         else:
             logger.debug("User not found by username", username=username)
         return user
 
-    def get_users(self, skip: int = 0, limit: int = 100) -> List[User]:
-        """獲取使用者列表"""
-        logger.debug("Getting users list", skip=skip, limit=limit)
-        users = self.db.query(User).offset(skip).limit(limit).all()
+    async def get_users(self, skip: int = 0, limit: int = 100, after_id: Optional[int] = None) -> List[User]:
+        """
+        獲取使用者列表
+
+        提供 after_id 時使用 keyset 分頁（id > after_id），不受頁數深度影響；
+        否則退回 offset 分頁
+        """
+        logger.debug("Getting users list", skip=skip, limit=limit, after_id=after_id)
+        query = select(User).order_by(User.id).limit(limit)
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        else:
+            query = query.offset(skip)
+        result = await self.db.scalars(query)
+        users = list(result)
         logger.debug("Users list retrieved", count=len(users))
         return users
 
-    def create_user(self, user: UserCreate) -> User:
-        """創建新使用者"""
+    async def stream_users(self, batch_size: int = 1000) -> AsyncIterator[User]:
+        """以 server-side cursor 逐批讀取所有使用者，記憶體用量固定"""
+        logger.debug("Streaming users", batch_size=batch_size)
+        query = select(User).order_by(User.id).execution_options(yield_per=batch_size)
+        result = await self.db.stream_scalars(query)
+        async for user in result:
+            yield user
+
+    async def create_user(self, user: UserCreate) -> User:
+        """
+        創建新使用者
+
+        以 INSERT ... ON CONFLICT DO NOTHING RETURNING 一次完成檢查與寫入，
+        使用者名稱已存在時拋出 UsernameAlreadyExistsError
+        """
         logger.info("Creating new user", username=user.username)
         try:
-            db_user = User(
-                username=user.username
+            stmt = (
+                pg_insert(User)
+                .values(_user_row(user, UserCreate.model_fields))
+                .on_conflict_do_nothing(index_elements=[User.username])
+                .returning(User)
             )
-            self.db.add(db_user)
-            self.db.commit()
-            self.db.refresh(db_user)
+            db_user = await self.db.scalar(stmt)
+            if db_user is None:
+                await self.db.rollback()
+                logger.warning("User creation conflict: username already exists", username=user.username)
+                raise UsernameAlreadyExistsError(user.username)
+            await self.db.commit()
             logger.info("User created successfully", user_id=db_user.id, username=db_user.username)
             return db_user
+        except UsernameAlreadyExistsError:
+            raise
         except Exception as e:
             logger.error("Failed to create user", username=user.username, error=str(e), exc_info=True)
-            self.db.rollback()
+            await self.db.rollback()
             raise
 
-    def update_user(self, user_id: int, user_update: UserUpdate) -> Optional[User]:
-        """更新使用者資訊"""
+    async def update_user(self, user_id: int, user_update: UserUpdate) -> Optional[User]:
+        """
+        更新使用者資訊
+
+        以單一 UPDATE ... RETURNING 完成，同時取回舊的使用者名稱以清除快取；
+        新名稱與其他使用者衝突時拋出 UsernameAlreadyExistsError
+        """
         logger.info("Updating user", user_id=user_id)
-        db_user = self.get_user(user_id)
-        if not db_user:
-            logger.warning("User not found for update", user_id=user_id)
-            return None
+        update_data = user_update.model_dump(exclude_unset=True)
+        if not update_data:
+            return await self.get_user(user_id)
 
         try:
-            update_data = user_update.dict(exclude_unset=True)
-
-            for field, value in update_data.items():
-                setattr(db_user, field, value)
-                logger.debug("User field updated", user_id=user_id, field=field)
+            # 鎖定並取得更新前的使用者名稱
+            old = (
+                select(User.id, User.username.label("old_username"))
+                .where(User.id == user_id)
+                .with_for_update()
+                .subquery()
+            )
+            stmt = (
+                update(User)
+                .where(User.id == old.c.id)
+                .values(**_user_row(user_update, update_data))
+                .returning(User, old.c.old_username)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            )
+            row = (await self.db.execute(stmt)).first()
+            if row is None:
+                await self.db.rollback()
+                logger.warning("User not found for update", user_id=user_id)
+                return None
 
-            self.db.commit()
-            self.db.refresh(db_user)
+            db_user, old_username = row
+            await self.db.commit()
+            invalidate_user(old_username, db_user.username)
+            logger.debug("User fields updated", user_id=user_id, fields=list(update_data))
             logger.info("User updated successfully", user_id=user_id, username=db_user.username)
             return db_user
+        except IntegrityError as e:
+            await self.db.rollback()
+            if not _is_unique_violation(e):
+                # 其他約束（例如 NOT NULL）不是名稱衝突，交給呼叫端當作錯誤處理
+                logger.error("Failed to update user", user_id=user_id, error=str(e), exc_info=True)
+                raise
+            logger.warning("User update conflict: username already exists", user_id=user_id)
+            raise UsernameAlreadyExistsError(update_data.get("username"))
         except Exception as e:
             logger.error("Failed to update user", user_id=user_id, error=str(e), exc_info=True)
-            self.db.rollback()
+            await self.db.rollback()
             raise
 
-    def delete_user(self, user_id: int) -> bool:
-        """刪除使用者"""
+    async def delete_user(self, user_id: int) -> bool:
+        """刪除使用者（DELETE ... RETURNING）"""
         logger.info("Deleting user", user_id=user_id)
-        db_user = self.get_user(user_id)
-        if not db_user:
-            logger.warning("User not found for deletion", user_id=user_id)
-            return False
-
         try:
-            username = db_user.username
-            self.db.delete(db_user)
-            self.db.commit()
+            username = await self.db.scalar(
+                delete(User)
+                .where(User.id == user_id)
+                .returning(User.username)
+                .execution_options(synchronize_session=False)
+            )
+            if username is None:
+                await self.db.rollback()
+                logger.warning("User not found for deletion", user_id=user_id)
+                return False
+
+            await self.db.commit()
+            invalidate_user(username)
             logger.info("User deleted successfully", user_id=user_id, username=username)
             return True
         except Exception as e:
             logger.error("Failed to delete user", user_id=user_id, error=str(e), exc_info=True)
-            self.db.rollback()
+            await self.db.rollback()
+            raise
+
+    async def bulk_upsert_users(
+        self,
+        users: List[UserCreate],
+        update_existing: bool = False,
+        batch_size: int = 500,
+    ) -> Dict[str, Tuple[int, str]]:
+        """
+        在單一交易內以多列 INSERT ... ON CONFLICT (username) 批次寫入使用者
+
+        update_existing 為 True 時，既有使用者只更新該列有提供的欄位；
+        否則既有使用者保持不變。返回 username -> (id, "created" | "updated")，
+        未出現在結果中的使用者代表已存在且未變更
+        """
+        logger.info("Bulk writing users", count=len(users), update_existing=update_existing)
+
+        # 依提供的欄位分組，讓同一個多列語句的欄位一致
+        groups: Dict[FrozenSet[str], List[dict]] = {}
+        for user in users:
+            fields = frozenset(user.model_fields_set | {"username"})
+            groups.setdefault(fields, []).append(_user_row(user, fields))
+
+        results: Dict[str, Tuple[int, str]] = {}
+        try:
+            for fields, rows in groups.items():
+                update_fields = fields - {"username"}
+                for start in range(0, len(rows), batch_size):
+                    stmt = pg_insert(User).values(rows[start:start + batch_size])
+                    if update_existing and update_fields:
+                        set_ = {field: stmt.excluded[field] for field in update_fields}
+                        set_["updated_at"] = func.now()
+                        stmt = stmt.on_conflict_do_update(index_elements=[User.username], set_=set_)
+                    else:
+                        stmt = stmt.on_conflict_do_nothing(index_elements=[User.username])
+                    # xmax = 0 代表該列是新插入的
+                    stmt = stmt.returning(User.id, User.username, literal_column("xmax = 0").label("inserted"))
+                    for row in await self.db.execute(stmt):
+                        results[row.username] = (row.id, "created" if row.inserted else "updated")
+            await self.db.commit()
+        except Exception as e:
+            logger.error("Failed to bulk write users", count=len(users), error=str(e), exc_info=True)
+            await self.db.rollback()
             raise
 
+        invalidate_user(*results)
+        logger.info("Users bulk written", count=len(users), written=len(results))
+        return results
@@ -0,0 +1,136 @@
+"""
+Gemini generateContent 與 Cloud TTS text:synthesize 的本機模擬服務
+
+供壓力測試使用，不需要 Google 憑證。延遲、錯誤率與回應大小皆可設定：
+
+    uv run python -m benchmarks.fake_upstreams --port 9100 \\
+        --gemini-latency lognormal:800:0.4 --gemini-error-rate 0.01 \\
+        --tts-latency uniform:150:400 --audio-seconds 3
+
+延遲格式（毫秒）：
+    fixed:MS
+    uniform:LO:HI
+    normal:MEAN:STD
+    lognormal:MEDIAN:SIGMA
+"""
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import json
+import math
+import random
+import struct
+import wave
+from typing import Callable
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """將延遲設定轉成返回秒數的函式"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(":")] if params else []
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    raise ValueError(f"invalid latency spec: {spec}")
+
+
+def _tone_wav(seconds: float, sample_rate: int) -> bytes:
+    """產生 LINEAR16 單聲道的 440Hz 正弦波 WAV（與 Cloud TTS LINEAR16 輸出格式相同）"""
+    n = int(seconds * sample_rate)
+    frames = struct.pack(
+        f"<{n}h", *(int(8000 * math.sin(2 * math.pi * 440 * i / sample_rate)) for i in range(n))
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def build_app(args: argparse.Namespace) -> Starlette:
+    gemini_latency = parse_latency(args.gemini_latency)
+    tts_latency = parse_latency(args.tts_latency)
+    audio_b64 = base64.b64encode(_tone_wav(args.audio_seconds, args.audio_rate)).decode("ascii")
+    counter = itertools.count()
+    filler = "前方約兩公尺有一張木製桌子。" * (args.answer_chars // 14 + 1)
+
+    async def generate_content(request: Request) -> Response:
+        await request.body()
+        await asyncio.sleep(gemini_latency())
+        if random.random() < args.gemini_error_rate:
+            return JSONResponse(
+                {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}},
+                status_code=503,
+            )
+
+        n = next(counter)
+        # 預設每個回答都不同，避免 TTS 快取讓測試失真
+        prefix = "測試回應" if args.repeat_answers else f"測試回應 {n}："
+        speech = (prefix + filler)[: max(len(prefix) + 1, args.answer_chars)]
+        model = request.path_params["model"]
+        return JSONResponse({
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": json.dumps({"speech": speech}, ensure_ascii=False)}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {"promptTokenCount": 258, "candidatesTokenCount": len(speech), "totalTokenCount": 258 + len(speech)},
+            "modelVersion": model,
+        })
+
+    async def synthesize(request: Request) -> Response:
+        await request.body()
+        await asyncio.sleep(tts_latency())
+        if random.random() < args.tts_error_rate:
+            return JSONResponse({"error": {"code": 500, "message": "Internal error", "status": "INTERNAL"}}, status_code=500)
+        return JSONResponse({"audioContent": audio_b64})
+
+    async def dispatch(request: Request) -> Response:
+        path = request.path_params["path"]
+        if path.endswith(":generateContent"):
+            request.path_params["model"] = path.rsplit("/", 1)[-1].split(":", 1)[0]
+            return await generate_content(request)
+        if path.endswith("text:synthesize"):
+            return await synthesize(request)
+        return JSONResponse({"error": {"code": 404, "message": f"unknown path {path}"}}, status_code=404)
+
+    return Starlette(routes=[Route("/{path:path}", dispatch, methods=["POST"])])
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--gemini-latency", default="lognormal:800:0.4")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--answer-chars", type=int, default=120, help="Gemini 回答的字數")
+    parser.add_argument("--repeat-answers", action="store_true", help="每次回答相同內容（測試 TTS 快取命中）")
+    parser.add_argument("--tts-latency", default="uniform:150:400")
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="TTS 回傳的音訊長度")
+    parser.add_argument("--audio-rate", type=int, default=24000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(build_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
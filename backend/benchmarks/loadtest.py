@@ -0,0 +1,400 @@
+"""
+端對端壓力測試
+
+啟動本機的 Gemini / TTS 模擬服務（benchmarks.fake_upstreams）與真正的後端
+（uvicorn，或 --app-workers > 1 時用 gunicorn），在固定並發數下持續送出請求，
+每個情境輸出 p50/p95/p99 延遲、RPS、錯誤數與後端程序 RSS。
+
+執行方式（在 backend 目錄）：
+    uv run python -m benchmarks.loadtest
+    uv run python -m benchmarks.loadtest --scenarios analyze,tts_synthesize \\
+        --concurrency 1,8,32 --duration 20 --gemini-latency lognormal:1200:0.5 \\
+        --gemini-error-rate 0.02 --output loadtest.json
+
+情境：health, analyze, analyze_and_speak, tts_synthesize, tts_stream, users
+（users 需要可連線的 DATABASE_URL，無法連線時標記為 skipped）
+後端輸出寫到 logs/loadtest-backend.log
+
+--target http://host:port 可對已在執行的實例測試（此時不啟動後端與模擬服務，
+RSS 需用 --target-pid 指定）
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import httpx
+from benchmarks.fake_upstreams import add_arguments as add_upstream_arguments
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+Scenario = Callable[[httpx.AsyncClient, Dict[str, Any], int], Awaitable[Union[int, str]]]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _descendants(pid: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    result, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        result.append(current)
+        stack.extend(children.get(current, ()))
+    return result
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """程序（含 gunicorn worker 等子程序）的 RSS 總和，單位 bytes"""
+    if Path("/proc").is_dir():
+        total = 0
+        for member in _descendants(pid):
+            try:
+                for line in Path(f"/proc/{member}/status").read_text().splitlines():
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            except OSError:
+                continue
+        return total
+    try:
+        out = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True, check=True)
+        return int(out.stdout.strip()) * 1024
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+# ---------------------------------------------------------------- 情境
+
+def _image_form(ctx: Dict[str, Any], i: int) -> Tuple[Dict[str, str], Dict[str, Tuple[str, bytes, str]]]:
+    return (
+        {"text": f"前面有什麼？({i})"},
+        {"image": ("frame.jpg", ctx["image"], "image/jpeg")},
+    )
+
+
+async def scenario_health(client: httpx.AsyncClient, ctx: Dict[str, Any], i: int) -> int:
+    return (await client.get("/health")).status_code
+
+
+async def scenario_analyze(client: httpx.AsyncClient, ctx: Dict[str, Any], i: int) -> int:
+    data, files = _image_form(ctx, i)
+    return (await client.post("/gemini/analyze", data=data, files=files)).status_code
+
+
+async def scenario_analyze_and_speak(client: httpx.AsyncClient, ctx: Dict[str, Any], i: int) -> Union[int, str]:
+    data, files = _image_form(ctx, i)
+    response = await client.post("/gemini/analyze-and-speak", data=data, files=files)
+    # TTS 失敗時後端回傳文字 fallback（200），視為錯誤
+    if response.status_code == 200 and not response.headers.get("content-type", "").startswith("audio/"):
+        return "tts_fallback"
+    return response.status_code
+
+
+async def scenario_tts_synthesize(client: httpx.AsyncClient, ctx: Dict[str, Any], i: int) -> int:
+    text = f"{ctx['run_id']} 第 {i} 句：前方約兩公尺有一張木製桌子。"
+    return (await client.post("/tts/synthesize", json={"text": text})).status_code
+
+
+async def scenario_tts_stream(client: httpx.AsyncClient, ctx: Dict[str, Any], i: int) -> int:
+    text = f"{ctx['run_id']} 串流第 {i} 句：前方約兩公尺有一張木製桌子。"
+    return (await client.post("/tts/synthesize-stream", json={"text": text})).status_code
+
+
+async def setup_users(client: httpx.AsyncClient, ctx: Dict[str, Any]) -> None:
+    username = f"loadtest_{ctx['run_id']}"
+    response = await client.post("/users/register", params={"username": username})
+    if response.status_code != 200:
+        raise RuntimeError(f"register failed: {response.status_code} {response.text[:200]}")
+    ctx["username"] = username
+
+
+async def scenario_users(client: httpx.AsyncClient, ctx: Dict[str, Any], i: int) -> int:
+    login = await client.post("/users/login", params={"username": ctx["username"]})
+    if login.status_code != 200:
+        return login.status_code
+    token = login.json()["access_token"]
+    return (await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})).status_code
+
+
+SCENARIOS: Dict[str, Tuple[Scenario, Optional[Callable[[httpx.AsyncClient, Dict[str, Any]], Awaitable[None]]]]] = {
+    "health": (scenario_health, None),
+    "analyze": (scenario_analyze, None),
+    "analyze_and_speak": (scenario_analyze_and_speak, None),
+    "tts_synthesize": (scenario_tts_synthesize, None),
+    "tts_stream": (scenario_tts_stream, None),
+    "users": (scenario_users, setup_users),
+}
+
+
+# ---------------------------------------------------------------- 執行
+
+async def run_level(
+    base_url: str,
+    scenario: Scenario,
+    ctx: Dict[str, Any],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    timeout: float,
+    pid: Optional[int],
+) -> Dict[str, Any]:
+    """以固定並發數執行一個情境：warmup 期間的結果不計入"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    rss_samples: List[int] = []
+    counter = iter(range(10 ** 12))
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        measure_from = start + warmup
+        deadline = measure_from + duration
+
+        async def worker() -> None:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    return
+                try:
+                    status = await scenario(client, ctx, next(counter))
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                finished = time.perf_counter()
+                if now >= measure_from:
+                    latencies.append(finished - now)
+                    key = str(status)
+                    statuses[key] = statuses.get(key, 0) + 1
+
+        async def sample_rss() -> None:
+            while time.perf_counter() < deadline:
+                rss = process_tree_rss(pid) if pid else None
+                if rss is not None:
+                    rss_samples.append(rss)
+                await asyncio.sleep(0.25)
+
+        await asyncio.gather(sample_rss(), *(worker() for _ in range(concurrency)))
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and 200 <= int(status) < 300)
+    mb = 1024 * 1024
+    return {
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "requests": len(latencies),
+        "ok": ok,
+        "errors": len(latencies) - ok,
+        "status_counts": statuses,
+        "rps": round(len(latencies) / duration, 2),
+        "ok_rps": round(ok / duration, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "rss_mb": {
+            "start": round(rss_samples[0] / mb, 1),
+            "peak": round(max(rss_samples) / mb, 1),
+            "end": round(rss_samples[-1] / mb, 1),
+        } if rss_samples else None,
+    }
+
+
+async def _wait_healthy(base_url: str, proc: Optional[subprocess.Popen], timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"process exited with {proc.returncode}")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not become healthy within {timeout}s")
+
+
+def _start_upstreams(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    argv = [
+        sys.executable, "-m", "benchmarks.fake_upstreams", "--port", str(port),
+        "--gemini-latency", args.gemini_latency,
+        "--gemini-error-rate", str(args.gemini_error_rate),
+        "--answer-chars", str(args.answer_chars),
+        "--tts-latency", args.tts_latency,
+        "--tts-error-rate", str(args.tts_error_rate),
+        "--audio-seconds", str(args.audio_seconds),
+        "--audio-rate", str(args.audio_rate),
+    ]
+    if args.repeat_answers:
+        argv.append("--repeat-answers")
+    return subprocess.Popen(argv, cwd=BACKEND_DIR)
+
+
+def _start_backend(args: argparse.Namespace, port: int, upstream_url: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        GEMINI_BASE_URL=upstream_url,
+        TTS_API_URL=f"{upstream_url}/v1/text:synthesize",
+        GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "loadtest-fake-key"),
+        GOOGLE_PROJECT_ID="loadtest",
+        GOOGLE_ACCESS_TOKEN="loadtest",
+        LOG_LEVEL=args.app_log_level,
+    )
+    if args.no_shared_cache:
+        env["SHARED_CACHE_ENABLED"] = "false"
+    if args.app_workers > 1:
+        env.update(GUNICORN_WORKERS=str(args.app_workers), GUNICORN_BIND=f"127.0.0.1:{port}")
+        argv = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        argv = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                "--log-level", "warning", "--no-access-log"]
+    log_path = BACKEND_DIR / "logs" / "loadtest-backend.log"
+    log_path.parent.mkdir(exist_ok=True)
+    with log_path.open("ab") as log_file:
+        return subprocess.Popen(argv, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def _stop(proc: Optional[subprocess.Popen]) -> None:
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    upstreams = backend = None
+    try:
+        if args.target:
+            base_url, pid = args.target.rstrip("/"), args.target_pid
+        else:
+            upstream_port, backend_port = _free_port(), _free_port()
+            upstream_url = f"http://127.0.0.1:{upstream_port}"
+            upstreams = _start_upstreams(args, upstream_port)
+            backend = _start_backend(args, backend_port, upstream_url)
+            base_url, pid = f"http://127.0.0.1:{backend_port}", backend.pid
+            await _wait_upstreams(upstream_url, upstreams)
+        await _wait_healthy(base_url, backend)
+
+        ctx: Dict[str, Any] = {"run_id": uuid.uuid4().hex[:8], "image": os.urandom(args.image_kb * 1024)}
+        results: List[Dict[str, Any]] = []
+        for name in args.scenarios:
+            scenario, setup = SCENARIOS[name]
+            if setup is not None:
+                try:
+                    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+                        await setup(client, ctx)
+                except Exception as e:
+                    results.append({"scenario": name, "skipped": str(e)})
+                    print(f"{name}: skipped ({e})", file=sys.stderr)
+                    continue
+            for concurrency in args.concurrency:
+                result = await run_level(
+                    base_url, scenario, ctx, concurrency, args.duration, args.warmup, args.timeout, pid
+                )
+                result["scenario"] = name
+                results.append(result)
+                _print_row(result)
+
+        return {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": {
+                key: value for key, value in vars(args).items() if key not in ("output",)
+            },
+            "results": results,
+        }
+    finally:
+        _stop(backend)
+        _stop(upstreams)
+
+
+async def _wait_upstreams(upstream_url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=upstream_url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"fake upstreams exited with {proc.returncode}")
+            try:
+                await client.post("/ping")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("fake upstreams did not start")
+
+
+def _print_row(result: Dict[str, Any]) -> None:
+    latency = result["latency_ms"]
+    rss = result["rss_mb"]["peak"] if result.get("rss_mb") else "-"
+    print(
+        f"{result['scenario']:<18} c={result['concurrency']:<4} "
+        f"rps={result['rps']:>8.1f}  p50={latency['p50']:>8.1f}ms  p95={latency['p95']:>8.1f}ms  "
+        f"p99={latency['p99']:>8.1f}ms  errors={result['errors']:<5} rss_peak={rss}MB",
+        flush=True,
+    )
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="health,analyze,analyze_and_speak,tts_synthesize,tts_stream,users",
+                        type=lambda v: [s for s in v.split(",") if s])
+    parser.add_argument("--concurrency", default="1,8,32", type=_int_list)
+    parser.add_argument("--duration", type=float, default=10.0, help="每個並發等級的量測秒數")
+    parser.add_argument("--warmup", type=float, default=2.0, help="量測前的暖機秒數")
+    parser.add_argument("--timeout", type=float, default=60.0, help="單一請求逾時秒數")
+    parser.add_argument("--image-kb", type=int, default=80, help="上傳影像大小")
+    parser.add_argument("--app-workers", type=int, default=1, help=">1 時以 gunicorn 啟動後端")
+    parser.add_argument("--app-log-level", default="WARNING")
+    parser.add_argument("--no-shared-cache", action="store_true", help="關閉 TTS shared memory 快取")
+    parser.add_argument("--target", default=None, help="測試已在執行的實例，例如 http://127.0.0.1:8000")
+    parser.add_argument("--target-pid", type=int, default=None, help="--target 的程序 ID（量測 RSS）")
+    parser.add_argument("--output", default=None, help="JSON 結果輸出路徑（預設輸出到 stdout）")
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (available: {', '.join(SCENARIOS)})")
+
+    report = asyncio.run(run(args))
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(payload + "\n", encoding="utf-8")
+        print(f"results written to {args.output}")
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""
+後端熱路徑微基準測試（與上游無關的每請求 CPU 成本）
+
+涵蓋：system prompt 組裝、JWT 編碼 / 解碼與 get_current_user、使用者序列化（含舊的標準庫 json 實作）、
+LoggingMiddleware（與舊的 BaseHTTPMiddleware 實作比較）、640px JPEG 的 multipart 解析、TTS 回應的 base64 處理。
+
+每個項目自動決定迭代次數，重複 --repeat 次，記錄每次呼叫的 min / median。
+絕對時間依機器而異，因此每次量測都與固定的參考項目（reference.stdlib）交替執行，
+基準檔記錄各項目相對於參考項目的時間比（median）；與 benchmarks/baselines/micro.json 比較時
+使用這個比值，慢超過 --threshold 時結束碼為 1。
+
+執行方式（在 backend 目錄）：
+    uv run python -m benchmarks.micro
+    uv run python -m benchmarks.micro --filter jwt
+    uv run python -m benchmarks.micro --save-baseline   # 更新基準
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import struct
+import sys
+import time
+import wave
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "micro.json"
+
+SyncFn = Callable[[], Any]
+AsyncFn = Callable[[], Awaitable[Any]]
+
+# 名稱 -> 建立受測函式的 setup（setup 的時間不計入）
+BENCHMARKS: Dict[str, Callable[[], Union[SyncFn, AsyncFn]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+# ---------------------------------------------------------------- 測試資料
+
+def _profile(**overrides) -> SimpleNamespace:
+    from app.models.user import GenderEnum, VisionLevelEnum
+
+    fields = dict(
+        id=1,
+        username="user1",
+        gender=GenderEnum.FEMALE,
+        age=72,
+        vision_level=VisionLevelEnum.LEVEL_5,
+        chronic_diseases=("高血壓", "糖尿病"),
+        others="需要較慢的語速，對花生過敏",
+        created_at=datetime(2025, 1, 1, tzinfo=timezone.utc),
+        updated_at=datetime(2025, 6, 1, tzinfo=timezone.utc),
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def _wav(seconds: float, sample_rate: int = 24000) -> bytes:
+    n = int(seconds * sample_rate)
+    frames = struct.pack(f"<{n}h", *(int(8000 * math.sin(i / 10)) for i in range(n)))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(frames)
+    return buffer.getvalue()
+
+
+def _jpeg_640() -> bytes:
+    """640x480 JPEG；沒有 Pillow 時使用同樣大小（約 48KB）的 JPEG 外殼"""
+    try:
+        from PIL import Image
+
+        rng = random.Random(640)
+        image = Image.new("RGB", (640, 480))
+        image.putdata([(rng.randrange(256), (x * 3) % 256, 128) for x in range(640 * 480)])
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=80)
+        return buffer.getvalue()
+    except ImportError:
+        rng = random.Random(640)
+        return b"\xff\xd8" + bytes(rng.randrange(256) for _ in range(48 * 1024)) + b"\xff\xd9"
+
+
+def _http_scope(method: str, path: str, headers: List[Tuple[bytes, bytes]]) -> Dict[str, Any]:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 12345),
+        "server": ("127.0.0.1", 8000),
+    }
+
+
+# ---------------------------------------------------------------- 參考項目
+
+# 只使用標準庫、不隨專案程式碼改變的工作量（字串格式化、dict 建立、json、排序），
+# 作為換算各機器速度的基準
+REFERENCE = "reference.stdlib"
+
+
+@benchmark(REFERENCE)
+def _reference():
+    rng = random.Random(0)
+    rows = [(rng.randrange(10**6), f"user{i}") for i in range(200)]
+
+    def run():
+        data = [{"id": key, "username": name, "label": f"{name}:{key}"} for key, name in rows]
+        data.sort(key=lambda row: row["id"])
+        return json.dumps(data)
+    return run
+
+
+# ---------------------------------------------------------------- system prompt
+
+@benchmark("prompt.anonymous")
+def _prompt_anonymous():
+    from app.api.routers.system_prompt import get_system_prompt_with_user
+    return lambda: get_system_prompt_with_user(None)
+
+
+@benchmark("prompt.minimal_profile")
+def _prompt_minimal():
+    from app.api.routers.system_prompt import get_system_prompt_with_user
+    user = _profile(gender=None, age=None, vision_level=None, chronic_diseases=None, others=None)
+    return lambda: get_system_prompt_with_user(user)
+
+
+@benchmark("prompt.elderly_blind_chronic")
+def _prompt_full():
+    from app.api.routers.system_prompt import get_system_prompt_with_user
+    user = _profile()
+    return lambda: get_system_prompt_with_user(user)
+
+
+@benchmark("prompt.youth_mild")
+def _prompt_youth():
+    from app.api.routers.system_prompt import get_system_prompt_with_user
+    from app.models.user import GenderEnum, VisionLevelEnum
+    user = _profile(gender=GenderEnum.MALE, age=15, vision_level=VisionLevelEnum.LEVEL_1,
+                    chronic_diseases=None, others=None)
+    return lambda: get_system_prompt_with_user(user)
+
+
+# ---------------------------------------------------------------- JWT / auth
+
+@benchmark("jwt.create_access_token")
+def _jwt_encode():
+    from app.api.routers.users import create_access_token
+    return lambda: create_access_token({"sub": "user1"}, timedelta(minutes=30))
+
+
+@benchmark("jwt.decode_uncached")
+def _jwt_decode_uncached():
+    from app.api.routers.users import create_access_token
+    from app.core.auth import decode_access_token
+    from app.core.cache import token_cache
+    token = create_access_token({"sub": "user1"}, timedelta(minutes=30))
+
+    def run():
+        token_cache.clear()
+        return decode_access_token(token)
+    return run
+
+
+@benchmark("jwt.decode_cached")
+def _jwt_decode_cached():
+    from app.api.routers.users import create_access_token
+    from app.core.auth import decode_access_token
+    token = create_access_token({"sub": "user1"}, timedelta(minutes=30))
+    decode_access_token(token)
+    return lambda: decode_access_token(token)
+
+
+@benchmark("auth.get_current_user_cached")
+def _get_current_user():
+    from fastapi.security import HTTPAuthorizationCredentials
+    from app.api.routers.users import create_access_token
+    from app.core.auth import get_current_user
+    from app.core.cache import cache_user, get_cached_user
+    token = create_access_token({"sub": "user1"}, timedelta(minutes=30))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    # 使用者快照已在快取中時不會存取資料庫
+    cache_user("user1", get_cached_user("user1")[0], _profile(), ttl=3600)
+
+    async def run():
+        return await get_current_user(credentials, None)
+    return run
+
+
+# ---------------------------------------------------------------- 序列化
+
+def _legacy_user_dict(user) -> dict:
+    # routers/users.py 原本在每個 handler 內手寫的轉換，與 serialize_user 比較用
+    return {
+        "id": user.id,
+        "username": user.username,
+        "gender": user.gender.value if user.gender else None,
+        "age": user.age,
+        "vision_level": user.vision_level.value if user.vision_level else None,
+        "chronic_diseases": user.chronic_diseases,
+        "others": user.others,
+        "created_at": user.created_at.isoformat(),
+        "updated_at": user.updated_at.isoformat() if user.updated_at else None
+    }
+
+
+@benchmark("serialize.user")
+def _serialize_user():
+    from app.schemas.user import serialize_user
+    user = _profile()
+    return lambda: serialize_user(user)
+
+
+@benchmark("serialize.users_me_response")
+def _users_me_response():
+    from app.core.responses import ORJSONResponse
+    from app.schemas.user import serialize_user
+    user = _profile()
+    return lambda: ORJSONResponse({"success": True, "user": serialize_user(user)})
+
+
+@benchmark("serialize.users_list_100")
+def _users_list():
+    from app.core.responses import ORJSONResponse
+    from app.schemas.user import serialize_user
+    users = [_profile(id=i, username=f"user{i}") for i in range(100)]
+    return lambda: ORJSONResponse([serialize_user(u) for u in users])
+
+
+@benchmark("serialize.users_me_response_stdlib")
+def _users_me_response_stdlib():
+    # 舊實作：手寫 dict + 標準庫 json（JSONResponse）
+    from fastapi.responses import JSONResponse
+    user = _profile()
+    return lambda: JSONResponse({"success": True, "user": _legacy_user_dict(user)})
+
+
+@benchmark("serialize.users_list_100_stdlib")
+def _users_list_stdlib():
+    from fastapi.responses import JSONResponse
+    users = [_profile(id=i, username=f"user{i}") for i in range(100)]
+    return lambda: JSONResponse([_legacy_user_dict(u) for u in users])
+
+
+@benchmark("serialize.login_response")
+def _login_response():
+    from app.core.responses import ORJSONResponse
+    from app.schemas.user import serialize_user
+    user = _profile()
+    return lambda: ORJSONResponse({"success": True, "message": "User logged in successfully",
+                                   "user": serialize_user(user), "token": "x" * 160})
+
+
+@benchmark("serialize.gemini_analyze_response")
+def _gemini_response():
+    from app.core.responses import ORJSONResponse
+    speech = "前方約兩公尺有一張椅子，椅子左側是門口。" * 8
+    return lambda: ORJSONResponse({"result": speech})
+
+
+# ---------------------------------------------------------------- middleware
+
+def _minimal_app():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"status":"ok"}'})
+    return app
+
+
+def _asgi_get(app) -> AsyncFn:
+    # 不使用 /health：探針路徑會略過日誌與指標
+    scope = _http_scope("GET", "/users/me", [(b"host", b"localhost"), (b"user-agent", b"bench")])
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def run():
+        await app(dict(scope), receive, send)
+    return run
+
+
+@benchmark("asgi.no_middleware")
+def _asgi_plain():
+    return _asgi_get(_minimal_app())
+
+
+@benchmark("asgi.logging_middleware")
+def _asgi_logging():
+    from app.middleware.logging_middleware import LoggingMiddleware
+    return _asgi_get(LoggingMiddleware(_minimal_app()))
+
+
+@benchmark("asgi.logging_base_http_middleware")
+def _asgi_logging_legacy():
+    # 重構前以 BaseHTTPMiddleware 實作的 LoggingMiddleware，僅供比較
+    import uuid
+    from starlette.middleware.base import BaseHTTPMiddleware
+    from app.core.logging import get_logger
+
+    logger = get_logger("middleware")
+
+    async def dispatch(request, call_next):
+        request_id = str(uuid.uuid4())
+        start_time = time.time()
+        client_ip = request.client.host if request.client else "unknown"
+        logger.info("Request started", request_id=request_id, method=request.method, url=str(request.url),
+                    client_ip=client_ip, user_agent=request.headers.get("user-agent", "unknown"))
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.info("Request completed", request_id=request_id, method=request.method, url=str(request.url),
+                    status_code=response.status_code, process_time=round(process_time, 4), client_ip=client_ip)
+        response.headers["X-Request-ID"] = request_id
+        return response
+    return _asgi_get(BaseHTTPMiddleware(_minimal_app(), dispatch=dispatch))
+
+
+# ---------------------------------------------------------------- multipart
+
+@benchmark("multipart.jpeg_640_with_text")
+def _multipart():
+    from starlette.requests import Request
+    boundary = "----benchboundary7MA4YWxkTrZu0gW"
+    jpeg = _jpeg_640()
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"text\"\r\n\r\n前面有什麼？\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"frame.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + jpeg + f"\r\n--{boundary}--\r\n".encode()
+    scope = _http_scope("POST", "/gemini/analyze", [
+        (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+        (b"content-length", str(len(body)).encode()),
+    ])
+
+    async def run():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {"type": "http.disconnect"}
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request = Request(scope, receive)
+        form = await request.form()
+        data = await form["image"].read()
+        await form.close()
+        return data
+    return run
+
+
+# ---------------------------------------------------------------- base64（TTS）
+
+@benchmark("tts.decode_audio_content_3s")
+def _tts_decode():
+    audio_content = base64.b64encode(_wav(3.0)).decode("ascii")
+    return lambda: base64.b64decode(audio_content)
+
+
+@benchmark("tts.synthesize_response_3s")
+def _tts_response():
+    # synthesize_text_to_speech：base64 編碼、data URL、TTSResponse 與 JSON 輸出
+    from app.api.routers.tts import TTSResponse
+    from app.core.responses import ORJSONResponse
+    audio = _wav(3.0)
+
+    def run():
+        audio_base64 = base64.b64encode(audio).decode("utf-8")
+        response = TTSResponse(success=True, message="Speech synthesis successful",
+                               audio_url=f"data:audio/wav;base64,{audio_base64}")
+        return ORJSONResponse(response.model_dump())
+    return run
+
+
+# ---------------------------------------------------------------- 執行
+
+def _timer(fn: Union[SyncFn, AsyncFn], loop: asyncio.AbstractEventLoop) -> Callable[[int], float]:
+    """返回 timed(n)：連續呼叫 n 次所需的秒數"""
+    if asyncio.iscoroutinefunction(fn):
+        async def batch(n: int) -> float:
+            start = time.perf_counter()
+            for _ in range(n):
+                await fn()
+            return time.perf_counter() - start
+
+        return lambda n: loop.run_until_complete(batch(n))
+
+    def timed(n: int) -> float:
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return time.perf_counter() - start
+    return timed
+
+
+def _calibrate(timed: Callable[[int], float], min_time: float) -> int:
+    """暖機後決定每次量測的呼叫次數，使單次量測至少 min_time 秒"""
+    timed(3)
+    number = 1
+    while True:
+        elapsed = timed(number)
+        if elapsed >= min_time:
+            return number
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+
+
+def _measure(
+    fn: Union[SyncFn, AsyncFn], reference: Optional[SyncFn], repeat: int, min_time: float
+) -> Tuple[List[float], List[float]]:
+    """
+    返回 repeat 次量測的每次呼叫秒數，以及每次與參考項目的時間比
+
+    每次量測前緊接著量測參考項目，CPU 頻率或其他負載的變化會同時影響兩者，比值比絕對時間穩定
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        timed = _timer(fn, loop)
+        number = _calibrate(timed, min_time)
+        if reference is not None:
+            timed_reference = _timer(reference, loop)
+            reference_number = _calibrate(timed_reference, min_time)
+        samples: List[float] = []
+        ratios: List[float] = []
+        for _ in range(repeat):
+            reference_time = timed_reference(reference_number) / reference_number if reference is not None else None
+            sample = timed(number) / number
+            samples.append(sample)
+            ratios.append(sample / reference_time if reference_time else 1.0)
+        return samples, ratios
+    finally:
+        loop.close()
+
+
+def _load_baseline(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8")).get("results", {})
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="只執行名稱包含此字串的項目")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="每次量測的最短秒數")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="相對於參考項目的倍數比基準大超過此比例視為退步")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true", help="將本次結果寫入基準檔")
+    parser.add_argument("--json", default=None, help="另外將結果寫到此路徑")
+    args = parser.parse_args(argv)
+
+    # 使用正式的日誌設定（等級、抽樣），但不實際寫出
+    from app.core.logging import setup_logging
+    setup_logging()
+    for name in logging.root.manager.loggerDict:
+        logging.getLogger(name).handlers = [logging.NullHandler()]
+    logging.getLogger().handlers = [logging.NullHandler()]
+
+    baseline_path = Path(args.baseline)
+    baseline = _load_baseline(baseline_path)
+    results: Dict[str, Dict[str, float]] = {}
+    regressions: List[str] = []
+
+    print(f"{'benchmark':<38}{'median':>12}{'min':>12}{'relative':>10}{'baseline':>10}{'change':>9}")
+    # 參考項目一律最先執行，其餘項目依 --filter 篩選
+    names = [REFERENCE] + [name for name in BENCHMARKS if name != REFERENCE and args.filter in name]
+    reference = BENCHMARKS[REFERENCE]()
+    for name in names:
+        fn = reference if name == REFERENCE else BENCHMARKS[name]()
+        samples, ratios = _measure(fn, None if name == REFERENCE else reference, args.repeat, args.min_time)
+        median_us = statistics.median(samples) * 1e6
+        min_us = min(samples) * 1e6
+        relative = statistics.median(ratios)
+        results[name] = {"median_us": round(median_us, 3), "min_us": round(min_us, 3), "relative": round(relative, 5)}
+
+        base = baseline.get(name, {}).get("relative")
+        change = ""
+        if base and name != REFERENCE:
+            ratio = relative / base - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += " !"
+        base_text = f"{base:.4f}" if base else "-"
+        print(f"{name:<38}{median_us:>10.2f}us{min_us:>10.2f}us{relative:>10.4f}{base_text:>10}{change:>9}", flush=True)
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "reference": REFERENCE,
+        "results": results,
+    }
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if args.save_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        report["results"] = dict(sorted(merged.items()))
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline written to {baseline_path}")
+        return 0
+
+    if regressions:
+        print(f"\nregressions (> {args.threshold:.0%} slower than baseline, relative to {REFERENCE}): "
+              f"{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
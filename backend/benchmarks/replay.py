@@ -0,0 +1,220 @@
+"""
+重播 TrafficCaptureMiddleware 擷取的流量
+
+依原始的請求間隔（除以 --speed）對目標實例重送請求，輸出每個路由的延遲、
+與擷取時狀態碼的一致率，以及排程延遲（重播端是否跟得上原始節奏）。
+
+請求內容的來源：
+- 擷取時開啟 TRAFFIC_CAPTURE_PAYLOADS：使用 payloads/ 中的原始內容
+- 否則依記錄的 multipart / JSON 結構產生相同欄位與大小的內容；
+  以請求雜湊作為亂數種子，同一份擷取每次重播的內容都相同
+
+執行方式（在 backend 目錄）：
+    uv run python -m benchmarks.replay logs/traffic --target http://127.0.0.1:8000
+    uv run python -m benchmarks.replay logs/traffic/traffic-20260101-120000-42-1.ndjson \\
+        --speed 4 --token "$TOKEN" --output replay.json
+
+擷取不會保存 Authorization 標頭；原本帶有身分驗證的請求需用 --token 提供重播用的 token
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from benchmarks.loadtest import percentile
+
+
+def load_records(paths: List[str]) -> Tuple[List[Dict[str, Any]], Optional[Path]]:
+    """讀取擷取檔（檔案或目錄），依開始時間排序；返回記錄與 payloads 目錄"""
+    files: List[Path] = []
+    payload_dir = None
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            files.extend(sorted(path.glob("traffic-*.ndjson")))
+            payload_dir = payload_dir or path / "payloads"
+        else:
+            files.append(path)
+            payload_dir = payload_dir or path.parent / "payloads"
+
+    records = []
+    for file in files:
+        with file.open("rb") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda r: r["ts"])
+    return records, payload_dir
+
+
+def _text(rng: random.Random, size: int) -> str:
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(size))
+
+
+def build_request(record: Dict[str, Any], payload_dir: Optional[Path]) -> Dict[str, Any]:
+    """將一筆記錄轉成 httpx 請求參數"""
+    kwargs: Dict[str, Any] = {}
+    rng = random.Random(record["req_sha256"])
+    # 查詢字串：參數欄位使用原值，其餘以相同長度的文字代替
+    query = record.get("query")
+    if isinstance(query, list):
+        kwargs["params"] = [(key, spec["value"] if "value" in spec else _text(rng, spec["str"])) for key, spec in query]
+    elif query:
+        kwargs["params"] = query
+    if record.get("payload") and payload_dir is not None:
+        digest = record["req_sha256"]
+        payload = payload_dir / digest[:2] / digest
+        if payload.exists():
+            kwargs["content"] = payload.read_bytes()
+            if record.get("content_type"):
+                kwargs["headers"] = {"content-type": record["content_type"]}
+            return kwargs
+
+    if "parts" in record:
+        data, files = [], []
+        for part in record["parts"]:
+            if "filename" in part:
+                content = rng.randbytes(part["size"])
+                files.append((part.get("name", "file"), (part["filename"], content, part.get("content_type"))))
+            else:
+                data.append((part.get("name", ""), part.get("value", _text(rng, part["size"]))))
+        kwargs["data"] = dict(data)
+        kwargs["files"] = files
+    elif "json_shape" in record:
+        body: Dict[str, Any] = {}
+        for key, spec in record["json_shape"].items():
+            if "value" in spec:
+                body[key] = spec["value"]
+            elif "str" in spec:
+                body[key] = _text(rng, spec["str"])
+        kwargs["json"] = body
+    elif record["req_bytes"]:
+        kwargs["content"] = rng.randbytes(record["req_bytes"])
+        if record.get("content_type"):
+            kwargs["headers"] = {"content-type": record["content_type"]}
+    return kwargs
+
+
+async def replay(
+    records: List[Dict[str, Any]],
+    payload_dir: Optional[Path],
+    base_url: str,
+    speed: float,
+    token: Optional[str],
+    timeout: float,
+) -> List[Dict[str, Any]]:
+    # 先準備好所有請求內容，避免產生內容的時間影響發送節奏
+    prepared = [build_request(record, payload_dir) for record in records]
+    t0 = records[0]["ts"]
+    results: List[Dict[str, Any]] = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+
+        async def send(record: Dict[str, Any], kwargs: Dict[str, Any], scheduled: float) -> None:
+            lag = time.perf_counter() - scheduled
+            headers = dict(kwargs.pop("headers", {}))
+            params = kwargs.pop("params", None)
+            if record.get("auth") and token:
+                headers["authorization"] = f"Bearer {token}"
+            start = time.perf_counter()
+            try:
+                response = await client.request(
+                    record["method"], record["path"], params=params or None, headers=headers, **kwargs
+                )
+                await response.aread()
+                status: Any = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            results.append({
+                "route": record["route"],
+                "status": status,
+                "expected_status": record["status"],
+                "latency_ms": (time.perf_counter() - start) * 1000,
+                "captured_ms": record["duration_ms"],
+                "schedule_lag_ms": lag * 1000,
+            })
+
+        start = time.perf_counter()
+        tasks = []
+        for record, kwargs in zip(records, prepared):
+            scheduled = start + (record["ts"] - t0) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(record, kwargs, scheduled)))
+        await asyncio.gather(*tasks)
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    routes: Dict[str, List[Dict[str, Any]]] = {}
+    for result in results:
+        routes.setdefault(result["route"], []).append(result)
+
+    summary = {}
+    for route, items in sorted(routes.items()):
+        latencies = sorted(r["latency_ms"] for r in items)
+        captured = sorted(r["captured_ms"] for r in items)
+        summary[route] = {
+            "requests": len(items),
+            "status_match": round(sum(r["status"] == r["expected_status"] for r in items) / len(items), 4),
+            "latency_ms": {q: round(percentile(latencies, p), 2) for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+            "captured_ms": {q: round(percentile(captured, p), 2) for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        }
+    lags = sorted(r["schedule_lag_ms"] for r in results)
+    return {
+        "routes": summary,
+        "schedule_lag_ms": {"p50": round(percentile(lags, 0.5), 2), "max": round(lags[-1], 2) if lags else 0.0},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="擷取檔或擷取目錄")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="重播倍速（2 = 請求間隔減半）")
+    parser.add_argument("--token", default=None, help="原本帶有 Authorization 的請求改用此 Bearer token")
+    parser.add_argument("--limit", type=int, default=0, help="只重播前 N 筆（0 = 全部）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="單一請求逾時秒數")
+    parser.add_argument("--output", default=None, help="JSON 結果輸出路徑")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    records, payload_dir = load_records(args.paths)
+    if args.limit:
+        records = records[: args.limit]
+    if not records:
+        parser.error("no captured requests found")
+
+    span = records[-1]["ts"] - records[0]["ts"]
+    print(f"replaying {len(records)} requests over {span / args.speed:.1f}s (x{args.speed:g})", file=sys.stderr)
+    results = asyncio.run(replay(records, payload_dir, args.target.rstrip("/"), args.speed, args.token, args.timeout))
+    report = summarize(results)
+
+    for route, stats in report["routes"].items():
+        latency, captured = stats["latency_ms"], stats["captured_ms"]
+        print(
+            f"{route:<28} n={stats['requests']:<5} match={stats['status_match']:.0%}  "
+            f"p50={latency['p50']:>8.1f}ms ({captured['p50']:.1f})  p95={latency['p95']:>8.1f}ms ({captured['p95']:.1f})  "
+            f"p99={latency['p99']:>8.1f}ms ({captured['p99']:.1f})"
+        )
+    print(f"schedule lag p50={report['schedule_lag_ms']['p50']}ms max={report['schedule_lag_ms']['max']}ms")
+
+    if args.output:
+        report.update(
+            generated_at=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            config={"paths": args.paths, "target": args.target, "speed": args.speed, "limit": args.limit},
+        )
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+正式環境啟動設定
+
+    uv run gunicorn -c gunicorn.conf.py main:app
+
+- preload_app：master 先匯入並建立 app 再 fork，已匯入的模組以 copy-on-write 方式由所有 worker 共用
+- shared memory 快取與使用者變更世代在 master 的 on_starting 中建立，所有 worker 共用同一份
+- 各 worker 定期寫出指標，/metrics 回傳所有 worker 的彙總（見 app.core.metrics_multiprocess）
+- worker 數預設等於可用 CPU 核心數（GUNICORN_WORKERS 可覆寫）
+- 每個 worker 處理 max_requests（加上隨機 jitter）個請求後輪替，避免同時重啟
+- 逐一替換 worker：python -m app.cli rolling-restart
+"""
+import os
+import shutil
+from pathlib import Path
+from app.core.config import settings
+from app.core.metrics_multiprocess import mark_process_dead, prepare_directory
+from app.core.cache import init_user_generations
+from app.core.shared_cache import init_shared_cache
+
+
+def _available_cores() -> int:
+    # 容器內以 CPU affinity 為準
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = settings.gunicorn_bind
+workers = settings.gunicorn_workers or _available_cores()
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+max_requests = settings.gunicorn_max_requests
+max_requests_jitter = settings.gunicorn_max_requests_jitter
+timeout = settings.gunicorn_timeout
+graceful_timeout = settings.gunicorn_graceful_timeout
+keepalive = settings.gunicorn_keepalive
+pidfile = settings.gunicorn_pid_file
+
+# worker 心跳檔放在記憶體中，避免磁碟 I/O 阻塞造成誤判逾時
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+_ready_dir = Path(settings.gunicorn_ready_dir)
+
+
+def on_starting(server):
+    # 在 fork 之前建立共用快取，所有 worker 映射同一塊 shared memory
+    init_shared_cache()
+    # 使用者變更世代：任一 worker 更新或刪除使用者時，其他 worker 的使用者快取一併失效
+    init_user_generations()
+    # 各 worker 將指標寫到此目錄，/metrics 彙總所有 worker（設定由 fork 出的 worker 繼承）
+    if not settings.metrics_multiprocess_dir:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else "logs"
+        settings.metrics_multiprocess_dir = f"{base}/mc-hackathon-metrics-{os.getpid()}"
+    prepare_directory(Path(settings.metrics_multiprocess_dir))
+    Path(settings.gunicorn_pid_file).parent.mkdir(parents=True, exist_ok=True)
+    _ready_dir.mkdir(parents=True, exist_ok=True)
+    for stale in _ready_dir.glob("*"):
+        stale.unlink()
+
+
+def on_exit(server):
+    shutil.rmtree(settings.metrics_multiprocess_dir, ignore_errors=True)
+
+
+def post_worker_init(worker):
+    # rolling-restart 依此判斷新 worker 已就緒
+    (_ready_dir / str(worker.pid)).touch()
+
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
+    try:
+        (_ready_dir / str(worker.pid)).unlink()
+    except FileNotFoundError:
+        pass
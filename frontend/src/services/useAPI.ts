@@ -53,6 +53,10 @@ export interface GeminiAnalyzeRequest {
   text: string
   system_instruction: string
   image?: Blob
+  // 語音提問原始錄音，與影像一起送給 Gemini，不需先在瀏覽器做語音辨識
+  audio?: Blob
+  // prefetchFrame 返回的 handle；有 handle 時先不上傳 image，伺服器返回 410（handle 已失效）時才附上 image 重送
+  prefetch_handle?: string
 }
 
 export class ApiService {
@@ -205,9 +209,14 @@ export class ApiService {
       form.append('text', request.text)
       form.append('system_instruction', request.system_instruction)
       
-      if (request.image) {
+      if (request.prefetch_handle) {
+        form.append('prefetch_handle', request.prefetch_handle)
+      } else if (request.image) {
         form.append('image', request.image, 'photo.jpg')
       }
+      if (request.audio) {
+        form.append('audio', request.audio, request.audio.type.includes('wav') ? 'question.wav' : 'question.webm')
+      }
 
       const response = await fetch(`${this.baseUrl}/gemini/analyze-and-speak`, {
         method: 'POST',
@@ -217,6 +226,11 @@ export class ApiService {
         body: form,
       })
 
+      if (response.status === 410 && request.prefetch_handle) {
+        // handle 已過期或伺服器已重啟：改為直接附上影像重送
+        return this.analyzeAndSpeak({ ...request, prefetch_handle: undefined })
+      }
+
       if (!response.ok) {
         const text = await response.text()
         return {
@@ -240,6 +254,37 @@ export class ApiService {
     }
   }
 
+  /**
+   * 影像先於問題就緒時預先上傳，伺服器會開始推測性分析
+   * replaces 為上一個 handle（畫面已更新時取消舊的推測）
+   */
+  async prefetchFrame(image: Blob, replaces?: string): Promise<ApiResponse<{ handle: string; expires_in: number }>> {
+    const form = new FormData()
+    form.append('image', image, 'photo.jpg')
+    if (replaces) {
+      form.append('replaces', replaces)
+    }
+    try {
+      const response = await fetch(`${this.baseUrl}/gemini/prefetch`, {
+        method: 'POST',
+        headers: {
+          ...this.getAuthHeaders(),
+        },
+        body: form,
+      })
+      if (!response.ok) {
+        return { success: false, error: `HTTP ${response.status}`, message: `HTTP ${response.status}` }
+      }
+      return { success: true, data: await response.json() }
+    } catch (error) {
+      return {
+        success: false,
+        error: error instanceof Error ? error.message : 'prefetch failed',
+        message: '預先上傳失敗',
+      }
+    }
+  }
+
   /**
    * 檢查健康狀態
    */